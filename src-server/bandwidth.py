@@ -0,0 +1,103 @@
+#!env python
+
+## Built-in imports
+import collections
+import logging
+import threading
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.bandwidth")
+log.setLevel(logging.INFO)
+
+
+def peer_key(peer):
+  """Client address without the port, as given by context.peer() (e.g. "ipv4:1.2.3.4:5678" -> "ipv4:1.2.3.4")"""
+  if peer is None:
+    return None
+  return peer.rsplit(":", 1)[0]
+
+
+class PeerEstimate(object):
+  """
+  RTT and bandwidth to one client, fitted to network time = rtt + bytes / bandwidth.
+
+  The fit is a least-squares line over the client's reports with older reports decayed away, so it follows the
+  client as its network changes. Until the reports span a range of sizes, bandwidth stays at its last (or default)
+  value and only the RTT is fitted.
+  """
+  def __init__(self, decay=common.NETWORK_ESTIMATE_DECAY):
+    self.decay = decay
+    self.sum_w = 0.
+    self.sum_x = 0.
+    self.sum_y = 0.
+    self.sum_xx = 0.
+    self.sum_xy = 0.
+    self.num_reports = 0
+    self.rtt = 0.
+    self.bandwidth = common.DEFAULT_BANDWIDTH_BYTES_PER_SECOND
+
+  def record(self, num_bytes, network_time):
+    self.sum_w = self.decay * self.sum_w + 1.
+    self.sum_x = self.decay * self.sum_x + num_bytes
+    self.sum_y = self.decay * self.sum_y + network_time
+    self.sum_xx = self.decay * self.sum_xx + num_bytes * num_bytes
+    self.sum_xy = self.decay * self.sum_xy + num_bytes * network_time
+    self.num_reports += 1
+    self._fit()
+
+  def _fit(self):
+    mean_x = self.sum_x / self.sum_w
+    mean_y = self.sum_y / self.sum_w
+    var_x = self.sum_xx / self.sum_w - mean_x * mean_x
+    cov_xy = self.sum_xy / self.sum_w - mean_x * mean_y
+    if var_x > (common.NETWORK_MIN_SIZE_SPREAD * mean_x) ** 2 and cov_xy > 0:
+      self.bandwidth = var_x / cov_xy
+    self.rtt = max(0., mean_y - mean_x / self.bandwidth)
+
+  def transfer_time(self, num_bytes):
+    return self.rtt + num_bytes / self.bandwidth
+
+
+class NetworkEstimator(object):
+  """Per-client network estimates, learned from the NetworkReports clients attach to their requests"""
+  def __init__(self, max_peers=common.MAX_TRACKED_PEERS):
+    self.max_peers = max_peers
+    self.lock = threading.Lock()
+    self.peers = collections.OrderedDict()  # Least recently heard from first
+
+  def record(self, peer, report):
+    """Learns from a NetworkReport; its network time is what the client saw minus the time spent in the server"""
+    key = peer_key(peer)
+    if key is None:
+      return
+    network_time = report.elapsed - (report.server_time if report.HasField("server_time") else 0.)
+    if network_time <= 0:
+      return
+    with self.lock:
+      if key not in self.peers:
+        self.peers[key] = PeerEstimate()
+        if len(self.peers) > self.max_peers:
+          self.peers.popitem(last=False)
+      self.peers.move_to_end(key)
+      self.peers[key].record(report.bytes, network_time)
+
+  def transfer_time(self, peer, num_bytes):
+    """Expected time to move num_bytes between the server and the client, or 0 if nothing is known about it"""
+    with self.lock:
+      estimate = self.peers.get(peer_key(peer))
+      if estimate is None:
+        return 0.
+      return estimate.transfer_time(num_bytes)
+
+  def get_stats(self):
+    with self.lock:
+      return {
+        key : { "rtt" : estimate.rtt, "bandwidth" : estimate.bandwidth, "reports" : estimate.num_reports }
+        for key, estimate in self.peers.items()
+      }
@@ -0,0 +1,90 @@
+#!env python
+"""
+Compares model selection through the catalog index with the filter-and-sort path it replaced.
+
+Variants are endpoints with a stand-in predictor and synthetic latency measurements, so no AWS resources are needed.
+The old path's per-call logging is left out, so the difference shown is from indexing alone.
+Run from src-server/ as `python benchmarks/bench_catalog.py`.
+"""
+
+# Built-in imports
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# my imports
+import common
+import model_selection
+import serving_model
+
+
+def get_endpoints(num_variants):
+  endpoints = []
+  for i in range(num_variants):
+    endpoint = serving_model.SageMakerModelEndpoint_Image(
+      f"variant{i}", None, (224, 224), random.uniform(0.5, 0.9))
+    endpoint.is_loaded = True
+    endpoint.measurements[serving_model.ActionState.INFER].extend(
+      [random.uniform(0.05, 1.0) for _ in range(common.MIN_PROFILING_SAMPLES)])
+    endpoints.append(endpoint)
+  return endpoints
+
+
+def sorted_pick(models, min_accuracy=None, max_latency=None):
+  """The previous pick_model path: filter the active variants and sort them on every call"""
+  if min_accuracy is not None:
+    potential_variants = sorted(list(filter(
+      (lambda m: (m.accuracy >= min_accuracy)),
+      models
+    )), key=(lambda m: m.latency), reverse=False)
+  else:
+    potential_variants = sorted(list(filter(
+      (lambda m: (m.latency <= max_latency)),
+      models
+    )), key=(lambda m: m.accuracy), reverse=True)
+  profiled_variants = [m for m in potential_variants if not m.is_profiling]
+  if len(profiled_variants) > 0:
+    potential_variants = profiled_variants
+  return potential_variants[0] if len(potential_variants) > 0 else None
+
+
+def time_per_call(fn, queries):
+  ts = time.perf_counter()
+  for kwargs in queries:
+    fn(**kwargs)
+  return (time.perf_counter() - ts) / len(queries)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--num_queries", type=int, default=2000)
+  parser.add_argument("--variants", type=int, nargs="+", default=[10, 100, 1000])
+  args = parser.parse_args()
+
+  for num_variants in args.variants:
+    endpoints = get_endpoints(num_variants)
+    picker = model_selection.INFaaSModelPicker(endpoints)
+    queries = [
+      ({"min_accuracy" : random.uniform(0.5, 0.9)} if i % 2 == 0 else {"max_latency" : random.uniform(0.05, 1.0)})
+      for i in range(args.num_queries)
+    ]
+    for kwargs in queries:
+      assert picker.find_variant(**kwargs) is sorted_pick(set(endpoints), **kwargs)
+
+    sorted_time = time_per_call((lambda **kwargs: sorted_pick(picker.active_models, **kwargs)), queries)
+    indexed_time = time_per_call(picker.find_variant, queries)
+    update_time = time_per_call(
+      (lambda endpoint: picker.catalog.update(endpoint)), [{"endpoint" : e} for e in endpoints])
+    print(
+      f"{num_variants:>5} variants: sorted {sorted_time * 1e6:8.1f}us/pick, "
+      f"indexed {indexed_time * 1e6:6.1f}us/pick ({sorted_time / indexed_time:0.1f}x), "
+      f"{update_time * 1e6:0.1f}us/update"
+    )
+
+
+if __name__ == "__main__":
+  main()
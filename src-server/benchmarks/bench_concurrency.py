@@ -0,0 +1,125 @@
+#!env python
+"""
+Compares how many requests the thread-pool server and the grpc.aio server keep in flight at once.
+
+Endpoints are replaced with stand-ins that sleep for a fixed latency, so no AWS resources are needed.
+Run from src-server/ as `python benchmarks/bench_concurrency.py`.
+"""
+
+# Built-in imports
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from concurrent import futures
+
+# pip'd imports
+import grpc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# my imports
+import inference_service_pb2 as inference_service_pb2
+import inference_service_pb2_grpc as inference_service_pb2_grpc
+import serving_model
+import server
+
+
+class SleepingPredictor(object):
+  """Stands in for a sagemaker.Predictor, tracking the peak number of concurrent predict() calls"""
+  def __init__(self, endpoint_name, latency):
+    self.endpoint_name = endpoint_name
+    self.latency = latency
+    self.lock = threading.Lock()
+    self.in_flight = 0
+    self.max_in_flight = 0
+
+  def predict(self, data):
+    with self.lock:
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    time.sleep(self.latency)
+    with self.lock:
+      self.in_flight -= 1
+    return json.dumps({"predictions": [[0.1, 0.9]] * len(data)})
+
+
+def get_endpoints(latency, concurrency):
+  # Endpoint concurrency is set high so the servers' own limits are what get measured
+  return {
+    "efficientnetb0": serving_model.SageMakerModelEndpoint_Image(
+      "efficientnetb0", SleepingPredictor("efficientnetb0-bench", latency), (224, 224), 0.71, concurrency=concurrency)
+  }
+
+
+async def run_load(port, num_requests):
+  with open("mug.jpg", "rb") as fid:
+    data = base64.urlsafe_b64encode(fid.read()).decode("utf-8")
+  request = inference_service_pb2.Message1(
+    application=inference_service_pb2.Application.IMAGE,
+    model_name="efficientnetb0",
+    data=data
+  )
+  async with grpc.aio.insecure_channel(f"localhost:{port}") as channel:
+    stub = inference_service_pb2_grpc.InferenceStub(channel)
+    ts = time.time()
+    await asyncio.gather(*[stub.Infer1(request) for _ in range(num_requests)])
+    return time.time() - ts
+
+
+def bench_threaded(port, num_requests, latency, num_workers):
+  endpoints = get_endpoints(latency, num_requests)
+  servicer = server.InferenceServicer(endpoints=endpoints, warmup=False, max_batch_size=1)
+  grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=num_workers))
+  inference_service_pb2_grpc.add_InferenceServicer_to_server(servicer, grpc_server)
+  grpc_server.add_insecure_port(f"[::]:{port}")
+  grpc_server.start()
+  try:
+    duration = asyncio.run(run_load(port, num_requests))
+  finally:
+    grpc_server.stop(None)
+  return duration, endpoints["efficientnetb0"].endpoint.max_in_flight
+
+
+def bench_asyncio(port, num_requests, latency, max_in_flight):
+  endpoints = get_endpoints(latency, num_requests)
+
+  async def _run():
+    servicer = server.AsyncInferenceServicer(
+      endpoints=endpoints, warmup=False, max_in_flight=max_in_flight, max_batch_size=1)
+    grpc_server = grpc.aio.server()
+    inference_service_pb2_grpc.add_InferenceServicer_to_server(servicer, grpc_server)
+    grpc_server.add_insecure_port(f"[::]:{port}")
+    await grpc_server.start()
+    try:
+      return await run_load(port, num_requests)
+    finally:
+      await grpc_server.stop(None)
+
+  duration = asyncio.run(_run())
+  return duration, endpoints["efficientnetb0"].endpoint.max_in_flight
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--num_requests", type=int, default=500)
+  parser.add_argument("--latency", type=float, default=0.5, help="Simulated endpoint latency in seconds")
+  parser.add_argument("--num_workers", type=int, default=10)
+  parser.add_argument("--max_in_flight", type=int, default=256)
+  parser.add_argument("--port", type=int, default=50061)
+  args = parser.parse_args()
+
+  for name, bench, limit in [
+    ("threaded", bench_threaded, args.num_workers),
+    ("asyncio", bench_asyncio, args.max_in_flight),
+  ]:
+    duration, peak = bench(args.port, args.num_requests, args.latency, limit)
+    print(f"{name:>8} (limit={limit}): {args.num_requests / duration:0.1f} req/s, peak in-flight {peak}, {duration:0.3f}s total")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,240 @@
+#!env python
+"""
+Runs the real InferenceServicer against an emulated SageMaker runtime and reports how each scenario performs.
+
+Each scenario starts an EmulatedRuntime (see sagemaker_emulator.py) with its own endpoint behaviors, builds image
+endpoints whose predictors call it through the usual runtime client, profiles them briefly and serves them over
+gRPC. A Poisson load of Infer2V2 requests is then sent for a fixed duration by loadgen.py's open-loop generator, so
+a server that falls behind shows up as growing latency (measured from when each request was due) rather than a
+lower send rate.
+Throughput, latency percentiles and SLO attainment per scenario go to a JSON file that can be diffed between commits.
+Run from src-server/ as `python benchmarks/bench_harness.py [--scenarios scenarios.json] [--output results.json]`.
+"""
+
+# Built-in imports
+import argparse
+import asyncio
+import collections
+import functools
+import json
+import math
+import os
+import random
+import sys
+from concurrent import futures
+
+# Nothing here talks to AWS, but the runtime client still needs a region and credentials to sign requests with
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "emulated")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "emulated")
+
+# pip'd imports
+import grpc
+import sagemaker.predictor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+# my imports
+import common
+import inference_service_pb2 as inference_service_pb2
+import inference_service_pb2_grpc as inference_service_pb2_grpc
+import loadgen
+import sagemaker_emulator
+import server
+import serving_model
+
+
+VARIANTS = [
+  # name, accuracy, dimensions, emulated behavior
+  ("efficientnetb0", 0.771, (224, 224), { "latency" : 0.08, "sigma" : 0.2 }),
+  ("efficientnetb3", 0.816, (300, 300), { "latency" : 0.20, "sigma" : 0.25 }),
+  ("efficientnetb7", 0.843, (600, 600), { "latency" : 0.60, "sigma" : 0.3 }),
+]
+
+def get_variants(**behavior):
+  return [
+    { "name" : name, "accuracy" : accuracy, "dimensions" : dimensions, "emulator" : { **variant_behavior, **behavior } }
+    for name, accuracy, dimensions, variant_behavior in VARIANTS
+  ]
+
+SCENARIOS = [
+  { "name" : "accuracy_steady", "endpoints" : get_variants(), "slo_type" : "accuracy", "slo_value" : 0.8,
+    "rate" : 10., "duration" : 20. },
+  { "name" : "latency_steady", "endpoints" : get_variants(), "slo_type" : "latency", "slo_value" : 0.5,
+    "rate" : 10., "duration" : 20. },
+  { "name" : "latency_saturated", "endpoints" : get_variants(), "slo_type" : "latency", "slo_value" : 0.5,
+    "rate" : 50., "duration" : 20. },
+  { "name" : "latency_throttled", "endpoints" : get_variants(), "slo_type" : "latency", "slo_value" : 0.5,
+    "rate" : 20., "duration" : 20., "concurrency" : 4 },
+  { "name" : "latency_cold_starts", "endpoints" : get_variants(keep_alive=1.), "slo_type" : "latency",
+    "slo_value" : 0.5, "rate" : 0.5, "duration" : 60. },
+  { "name" : "latency_hedged", "endpoints" : get_variants(sigma=0.8), "slo_type" : "latency", "slo_value" : 0.5,
+    "rate" : 10., "duration" : 20., "servicer" : { "hedge_percentile" : common.HEDGE_PERCENTILE } },
+  # Only the two larger variants meet the floor, so the hedge has to go to efficientnetb7 rather than efficientnetb0
+  { "name" : "latency_hedged_accuracy_floor", "endpoints" : get_variants(sigma=0.8), "slo_type" : "latency",
+    "slo_value" : 1.0, "min_accuracy" : 0.8, "rate" : 10., "duration" : 20.,
+    "servicer" : { "hedge_percentile" : common.HEDGE_PERCENTILE } },
+]
+
+
+def percentile(values, q):
+  """Nearest-rank q-th percentile (0-100), or None if there are no values"""
+  if len(values) == 0:
+    return None
+  ranked = sorted(values)
+  return ranked[min(len(ranked) - 1, max(0, math.ceil(q / 100. * len(ranked)) - 1))]
+
+
+def get_endpoints(scenario):
+  """Image endpoints whose predictors go through the shared runtime client, and so to the emulator"""
+  endpoints = {}
+  for endpoint_dict in scenario["endpoints"]:
+    predictor = sagemaker.predictor.Predictor(
+      endpoint_name=endpoint_dict["name"],
+      sagemaker_session=serving_model.SageMakerRuntime.get_session(),
+      serializer=serving_model.ImageB64Serializer()
+    )
+    endpoints[endpoint_dict["name"]] = serving_model.SageMakerModelEndpoint_Image(
+      endpoint_dict["name"], predictor, tuple(endpoint_dict["dimensions"]), endpoint_dict["accuracy"],
+      concurrency=scenario.get("concurrency", common.SERVERLESS_MAX_CONCURRENCY))
+  return endpoints
+
+
+def get_emulated_endpoints(scenario):
+  return [
+    sagemaker_emulator.EmulatedEndpoint(name=endpoint_dict["name"], **endpoint_dict.get("emulator", {}))
+    for endpoint_dict in scenario["endpoints"]
+  ]
+
+
+def new_request(scenario, data):
+  return inference_service_pb2.Message2V2(
+    application=inference_service_pb2.Application.IMAGE,
+    slo_type=(inference_service_pb2.SLOType.LATENCY if scenario["slo_type"] == "latency"
+              else inference_service_pb2.SLOType.ACCURACY),
+    slo_value=scenario["slo_value"],
+    data=data,
+    **({ "min_accuracy" : scenario["min_accuracy"] } if "min_accuracy" in scenario else {})
+  )
+
+
+def met_slo(scenario, latency, response):
+  if response.endpoint.accuracy < scenario.get("min_accuracy", 0.):
+    return False
+  if scenario["slo_type"] == "latency":
+    return latency <= scenario["slo_value"]
+  return response.endpoint.accuracy >= scenario["slo_value"]
+
+
+class ScenarioMix(object):
+  """The same Infer2V2 request over and over, in the form loadgen.run_load sends"""
+  def __init__(self, scenario, data):
+    self.sent_request = loadgen.SentRequest(
+      scenario["name"], "Infer2V2", new_request(scenario, data), functools.partial(met_slo, scenario))
+
+  def next_request(self):
+    return self.sent_request
+
+
+class ScenarioResults(loadgen.LoadResults):
+  """Keeps one result per request rather than histograms, since summarize() reports more than loadgen does"""
+  def __init__(self):
+    super().__init__()
+    self.requests = []
+
+  def record(self, sent_request, latency, response=None, error=None):
+    if error is not None:
+      self.requests.append({ "latency" : latency, "error" : error })
+      return
+    self.requests.append({
+      "latency" : latency, "model" : response.model_name, "met_slo" : sent_request.met_slo(latency, response),
+    })
+
+
+def run_load(port, scenario, data):
+  """Sends Poisson arrivals at the scenario's rate for its duration, with loadgen's open-loop generator"""
+  results = asyncio.run(loadgen.run_load(
+    [f"localhost:{port}"], loadgen.PoissonArrivals(scenario["rate"]), ScenarioMix(scenario, data),
+    scenario["duration"], scenario.get("max_outstanding", 10000), num_channels=1, results=ScenarioResults()))
+  return results.requests, results.duration
+
+
+def summarize(scenario, results, duration, runtime):
+  latencies = [result["latency"] for result in results if "error" not in result]
+  errors = collections.Counter([result["error"] for result in results if "error" in result])
+  return {
+    "requests" : len(results),
+    "errors" : dict(errors),
+    "duration" : duration,
+    "throughput" : len(latencies) / duration,
+    "latency" : {
+      "mean" : (sum(latencies) / len(latencies)) if len(latencies) > 0 else None,
+      "p50" : percentile(latencies, 50),
+      "p95" : percentile(latencies, 95),
+      "p99" : percentile(latencies, 99),
+    },
+    "slo_attainment" : (sum([1 for result in results if result.get("met_slo", False)]) / len(results)
+                        if len(results) > 0 else None),
+    "models" : dict(collections.Counter([result["model"] for result in results if "model" in result])),
+    "runtime" : runtime.get_stats(),
+  }
+
+
+def run_scenario(scenario, port, data):
+  runtime = sagemaker_emulator.EmulatedRuntime(get_emulated_endpoints(scenario)).start()
+  serving_model.SageMakerRuntime.set_endpoint_url(runtime.url)
+  endpoints = get_endpoints(scenario)
+  servicer = server.InferenceServicer(endpoints=endpoints, warmup=False, **scenario.get("servicer", {}))
+  servicer.warm_up_endpoints(endpoints, num_executions=scenario.get("warmup", common.MIN_PROFILING_SAMPLES))
+
+  grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=scenario.get("num_workers", 64)))
+  inference_service_pb2_grpc.add_InferenceServicer_to_server(servicer, grpc_server)
+  grpc_server.add_insecure_port(f"[::]:{port}")
+  grpc_server.start()
+  try:
+    results, duration = run_load(port, scenario, data)
+  finally:
+    grpc_server.stop(None)
+    if servicer.keep_warm is not None:
+      servicer.keep_warm.stop()
+    runtime.stop()
+  return summarize(scenario, results, duration, runtime)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--scenarios", default=None, help="JSON list of scenarios to run instead of the built-in ones")
+  parser.add_argument("--only", nargs="*", default=None, help="Names of the scenarios to run")
+  parser.add_argument("--output", default="bench_results.json")
+  parser.add_argument("--image", default="mug.jpg")
+  parser.add_argument("--port", type=int, default=50071)
+  parser.add_argument("--seed", type=int, default=common.RNG_SEED)
+  args = parser.parse_args()
+
+  random.seed(args.seed)
+  scenarios = SCENARIOS
+  if args.scenarios is not None:
+    with open(args.scenarios) as fid:
+      scenarios = json.load(fid)
+  if args.only is not None:
+    scenarios = [scenario for scenario in scenarios if scenario["name"] in args.only]
+  with open(args.image, "rb") as fid:
+    data = fid.read()
+
+  report = {}
+  for scenario in scenarios:
+    print(f"Running {scenario['name']} ({scenario['rate']} req/s for {scenario['duration']}s)")
+    report[scenario["name"]] = summary = run_scenario(scenario, args.port, data)
+    latency = summary["latency"]
+    print(
+      f"  {summary['throughput']:0.1f} req/s, p50 {latency['p50']}, p95 {latency['p95']}, p99 {latency['p99']}, "
+      f"SLO attainment {summary['slo_attainment']}, errors {summary['errors']}")
+
+  with open(args.output, "w") as fid:
+    json.dump(report, fid, indent=2, sort_keys=True)
+  print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+  main()
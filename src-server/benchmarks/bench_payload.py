@@ -0,0 +1,61 @@
+#!env python
+"""
+Compares the base64 string RPCs (Message1) with the binary V2 RPCs (Message1V2).
+
+Reports wire bytes per request and the server-side CPU time to parse the request and recover its payload bytes.
+Run from src-server/ as `python benchmarks/bench_payload.py`.
+"""
+
+# Built-in imports
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# my imports
+import inference_service_pb2 as inference_service_pb2
+import server
+
+
+def cpu_per_request(message_cls, serialized, num_iterations):
+  ts = time.process_time()
+  for _ in range(num_iterations):
+    request = message_cls.FromString(serialized)
+    server.InferenceServicer.process_data(None, request)
+  return (time.process_time() - ts) / num_iterations
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--image", default="mug.jpg")
+  parser.add_argument("--num_iterations", type=int, default=2000)
+  args = parser.parse_args()
+
+  with open(args.image, "rb") as fid:
+    raw = fid.read()
+
+  requests = {
+    "string (Message1)" : inference_service_pb2.Message1(
+      application=inference_service_pb2.Application.IMAGE,
+      model_name="efficientnetb0",
+      data=base64.urlsafe_b64encode(raw).decode("utf-8")
+    ),
+    "bytes (Message1V2)" : inference_service_pb2.Message1V2(
+      application=inference_service_pb2.Application.IMAGE,
+      model_name="efficientnetb0",
+      data=raw
+    ),
+  }
+
+  print(f"Image: {args.image} ({len(raw)} bytes)")
+  for name, request in requests.items():
+    serialized = request.SerializeToString()
+    cpu_time = cpu_per_request(request.__class__, serialized, args.num_iterations)
+    print(f"{name:>20}: {len(serialized):>8} bytes/request, {cpu_time * 1e6:8.1f}us CPU/request")
+
+
+if __name__ == "__main__":
+  main()
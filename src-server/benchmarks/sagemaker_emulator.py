@@ -0,0 +1,181 @@
+#!env python
+"""
+A local stand-in for the SageMaker runtime, so the real endpoint code can be benchmarked without AWS.
+
+It serves the runtime's invocation contract (POST /endpoints/<name>/invocations) and answers with made-up
+predictions, after a delay drawn from each endpoint's latency distribution. Endpoints start cold, go cold again after
+sitting idle for their keep-alive, and throttle invocations past their concurrency limit the way the real runtime
+does, with a 429 ThrottlingException that botocore retries.
+Run on its own from src-server/ as `python benchmarks/sagemaker_emulator.py --config endpoints.json`, or start it
+in-process with EmulatedRuntime(...).start() as bench_harness.py does.
+"""
+
+# Built-in imports
+import argparse
+import http.server
+import json
+import math
+import random
+import threading
+import time
+
+
+class EmulatedEndpoint(object):
+  """
+  One endpoint's behavior.
+
+  Latency is lognormal around latency (the median) with shape sigma, plus per_item times that for each extra input
+  in a batch. An invocation that arrives after keep_alive seconds with nothing running pays cold_start on top.
+  """
+  def __init__(self, name, latency=0.1, sigma=0.2, per_item=0.25, cold_start=2.0, keep_alive=10.0, concurrency=1,
+               num_classes=1000):
+    self.name = name
+    self.latency = latency
+    self.sigma = sigma
+    self.per_item = per_item
+    self.cold_start = cold_start
+    self.keep_alive = keep_alive
+    self.concurrency = concurrency
+    self.num_classes = num_classes
+
+    self.lock = threading.Lock()
+    self.in_flight = 0
+    self.last_active = None
+    self.num_invocations = 0
+    self.num_throttled = 0
+    self.num_cold_starts = 0
+
+  @classmethod
+  def from_dict(cls, endpoint_dict):
+    return cls(**endpoint_dict)
+
+  def admit(self):
+    """Claims a concurrency slot, returning whether the invocation starts cold, or None if it is throttled"""
+    now = time.time()
+    with self.lock:
+      if self.in_flight >= self.concurrency:
+        self.num_throttled += 1
+        return None
+      cold = self.in_flight == 0 and (self.last_active is None or now - self.last_active > self.keep_alive)
+      self.in_flight += 1
+      self.last_active = now
+      self.num_invocations += 1
+      if cold:
+        self.num_cold_starts += 1
+      return cold
+
+  def release(self):
+    with self.lock:
+      self.in_flight -= 1
+      self.last_active = time.time()
+
+  def sample_latency(self, batch_size, cold):
+    latency = self.latency * math.exp(self.sigma * random.gauss(0., 1.)) * (1. + self.per_item * (batch_size - 1))
+    return latency + (self.cold_start if cold else 0.)
+
+  def respond(self, body):
+    """Predictions in the shape a TensorFlow Serving container gives them, one per input"""
+    try:
+      batch_size = max(1, len(json.loads(body).get("instances", [None])))
+    except (ValueError, AttributeError):
+      batch_size = 1
+    predictions = []
+    for _ in range(batch_size):
+      scores = [0.] * self.num_classes
+      scores[random.randrange(self.num_classes)] = 1.
+      predictions.append(scores)
+    return batch_size, json.dumps({ "predictions" : predictions }).encode("utf-8")
+
+  def get_stats(self):
+    with self.lock:
+      return {
+        "invocations" : self.num_invocations,
+        "throttled" : self.num_throttled,
+        "cold_starts" : self.num_cold_starts,
+      }
+
+
+class InvocationHandler(http.server.BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"  # Keep-alive, as the runtime client's connection pool expects
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+    parts = self.path.strip("/").split("/")
+    if len(parts) != 3 or parts[0] != "endpoints" or parts[2] != "invocations":
+      return self.send_error_response(404, "UnknownOperationException", f"No such operation: {self.path}")
+    endpoint = self.server.endpoints.get(parts[1])
+    if endpoint is None:
+      return self.send_error_response(400, "ValidationError", f"Endpoint {parts[1]} not found.")
+
+    cold = endpoint.admit()
+    if cold is None:
+      return self.send_error_response(429, "ThrottlingException", "Rate exceeded")
+    try:
+      batch_size, response = endpoint.respond(body)
+      time.sleep(endpoint.sample_latency(batch_size, cold))
+    finally:
+      endpoint.release()
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(response)))
+    self.send_header("x-Amzn-Invoked-Production-Variant", "AllTraffic")
+    self.end_headers()
+    self.wfile.write(response)
+
+  def send_error_response(self, status, error_type, message):
+    body = json.dumps({ "message" : message }).encode("utf-8")
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.send_header("x-amzn-ErrorType", error_type)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+class EmulatedRuntime(object):
+  def __init__(self, endpoints, host="localhost", port=0):
+    self.server = http.server.ThreadingHTTPServer((host, port), InvocationHandler)
+    self.server.daemon_threads = True
+    self.server.endpoints = { endpoint.name : endpoint for endpoint in endpoints }
+    self.thread = threading.Thread(target=self.server.serve_forever, name="emulated-runtime", daemon=True)
+
+  @property
+  def url(self):
+    host, port = self.server.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def start(self):
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def get_stats(self):
+    return { name : endpoint.get_stats() for name, endpoint in sorted(self.server.endpoints.items()) }
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--config", required=True,
+                      help="JSON list of endpoints, each with a name and any of EmulatedEndpoint's settings")
+  parser.add_argument("--port", type=int, default=8080)
+  args = parser.parse_args()
+
+  with open(args.config) as fid:
+    endpoints = [EmulatedEndpoint.from_dict(endpoint_dict) for endpoint_dict in json.load(fid)]
+  runtime = EmulatedRuntime(endpoints, port=args.port).start()
+  print(f"Emulating {len(endpoints)} endpoints at {runtime.url}")
+  try:
+    runtime.thread.join()
+  except KeyboardInterrupt:
+    runtime.stop()
+    print(json.dumps(runtime.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+  main()
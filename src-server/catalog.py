@@ -0,0 +1,388 @@
+#!env python
+
+## Built-in imports
+import bisect
+import collections
+import heapq
+import logging
+import math
+import threading
+import time
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.catalog")
+log.setLevel(logging.INFO)
+
+
+def percentile_key(percentile):
+  """Percentiles are tracked at whole numbers, so clients cannot make the catalog keep arbitrarily many indexes"""
+  if percentile is None:
+    return None
+  return min(100, max(1, int(round(percentile))))
+
+
+def latency_at(model, percentile=None):
+  if percentile is None:
+    return model.latency
+  return model.percentile_latency(percentile)
+
+
+class LatencyTree(object):
+  """Segment tree over a fixed number of slots, answering range-minimum and "rightmost slot under a bound" queries"""
+  def __init__(self, num_slots):
+    self.size = 1
+    while self.size < max(num_slots, 1):
+      self.size *= 2
+    self.tree = [math.inf] * (2 * self.size)
+
+  def update(self, slot, value):
+    node = self.size + slot
+    self.tree[node] = value
+    node //= 2
+    while node >= 1:
+      self.tree[node] = min(self.tree[2 * node], self.tree[2 * node + 1])
+      node //= 2
+
+  def argmin(self, lo, hi):
+    """Slot in [lo, hi) with the lowest value, or None if every slot there is empty"""
+    best_slot, best_value = None, math.inf
+    lo += self.size
+    hi += self.size
+    nodes = []
+    while lo < hi:
+      if lo & 1:
+        nodes.append(lo)
+        lo += 1
+      if hi & 1:
+        hi -= 1
+        nodes.append(hi)
+      lo //= 2
+      hi //= 2
+    for node in nodes:
+      if self.tree[node] < best_value:
+        best_slot, best_value = node, self.tree[node]
+    if best_slot is None:
+      return None
+    # Walk down to the leaf holding the minimum
+    while best_slot < self.size:
+      best_slot = 2 * best_slot if self.tree[2 * best_slot] == best_value else 2 * best_slot + 1
+    return best_slot - self.size
+
+  def min(self, lo, hi):
+    slot = self.argmin(lo, hi)
+    return math.inf if slot is None else self.tree[self.size + slot]
+
+  def rightmost_at_most(self, lo, hi, bound, node=1, node_lo=0, node_hi=None):
+    """Highest slot in [lo, hi) whose value is <= bound, or None"""
+    if node_hi is None:
+      node_hi = self.size
+    if node_hi <= lo or hi <= node_lo or self.tree[node] > bound:
+      return None
+    if node_hi - node_lo == 1:
+      return node_lo
+    mid = (node_lo + node_hi) // 2
+    slot = self.rightmost_at_most(lo, hi, bound, 2 * node + 1, mid, node_hi)
+    if slot is None:
+      slot = self.rightmost_at_most(lo, hi, bound, 2 * node, node_lo, mid)
+    return slot
+
+  def slots_at_most(self, lo, hi, bound, node=1, node_lo=0, node_hi=None):
+    """Every slot in [lo, hi) whose value is <= bound"""
+    if node_hi is None:
+      node_hi = self.size
+    if node_hi <= lo or hi <= node_lo or self.tree[node] > bound:
+      return []
+    if node_hi - node_lo == 1:
+      return [node_lo]
+    mid = (node_lo + node_hi) // 2
+    return (self.slots_at_most(lo, hi, bound, 2 * node, node_lo, mid)
+            + self.slots_at_most(lo, hi, bound, 2 * node + 1, mid, node_hi))
+
+
+class ParetoFrontier(object):
+  """
+  Accuracy levels, in increasing order, whose best latency beats that of every more accurate level.
+
+  Along the frontier latency strictly increases with accuracy, so "fastest at least this accurate" is the first
+  member at or above an accuracy level and "most accurate within this latency" is the last member under it. When a
+  level's latency changes only the members below it can change, and only down to the first member that is left
+  as it was, so updates walk just the part of the frontier that moves.
+  """
+  def __init__(self, num_levels):
+    self.latencies = [math.inf] * num_levels
+    self.tree = LatencyTree(num_levels)
+    self.members = []  # Accuracy levels, ascending
+
+  def update(self, level, latency):
+    if self.latencies[level] == latency:
+      return
+    self.latencies[level] = latency
+    self.tree.update(level, latency)
+
+    below = self.members[:bisect.bisect_left(self.members, level)]
+    above = self.members[bisect.bisect_right(self.members, level):]
+    bound = self.latencies[above[0]] if len(above) > 0 else math.inf
+    added = []
+    hi = level + 1
+    while True:
+      # The next member down is the most accurate level strictly faster than the one above it
+      found = self.tree.rightmost_at_most(0, hi, math.nextafter(bound, -math.inf))
+      if found is None:
+        below = []
+        break
+      if found < level and len(below) > 0 and below[-1] == found:
+        break  # Everything from here down is as it was
+      while len(below) > 0 and below[-1] >= found:
+        below.pop()
+      added.append(found)
+      bound = self.latencies[found]
+      hi = found
+    self.members = below + added[::-1] + above
+
+  def first_at_or_above(self, level):
+    i = bisect.bisect_left(self.members, level)
+    return self.members[i] if i < len(self.members) else None
+
+  def last_within(self, max_latency):
+    i = bisect.bisect_right(self.members, max_latency, key=(lambda member: self.latencies[member]))
+    return self.members[i - 1] if i > 0 else None
+
+
+class ApplicationIndex(object):
+  """
+  Variants of one application sorted by accuracy, with their latencies cached in segment trees.
+
+  One tree holds every variant and a second only those that have finished profiling, so queries can prefer
+  variants whose latency estimates are settled without filtering the list. Each tree has a Pareto frontier over
+  its accuracy levels (variants of equal accuracy share a level, represented by the fastest of them), and the
+  plain SLO queries are answered from the frontier alone.
+  """
+  def __init__(self, models, percentile=None):
+    self.percentile = percentile  # Latencies are taken at this percentile rather than the mean, if set
+    self.models = sorted(models, key=(lambda m: m.accuracy))
+    self.accuracies = [m.accuracy for m in self.models]
+    self.slots = { m.name : i for i, m in enumerate(self.models) }
+    self.latencies = [math.inf] * len(self.models)
+
+    # Accuracy levels: level_accuracies[k] is shared by slots level_starts[k] up to level_starts[k + 1]
+    self.level_accuracies = sorted(set(self.accuracies))
+    self.level_starts = [bisect.bisect_left(self.accuracies, a) for a in self.level_accuracies] + [len(self.models)]
+
+    self.lock = threading.Lock()
+    self.all_tree = LatencyTree(len(self.models))
+    self.settled_tree = LatencyTree(len(self.models))
+    self.all_frontier = ParetoFrontier(len(self.level_accuracies))
+    self.settled_frontier = ParetoFrontier(len(self.level_accuracies))
+    for model in self.models:
+      self.update(model)
+
+  def update(self, model):
+    slot = self.slots[model.name]
+    latency = latency_at(model, self.percentile)
+    level = bisect.bisect_left(self.level_accuracies, model.accuracy)
+    with self.lock:
+      self.latencies[slot] = latency
+      self.all_tree.update(slot, latency)
+      self.settled_tree.update(slot, (math.inf if model.is_profiling else latency))
+      for tree, frontier in [(self.all_tree, self.all_frontier), (self.settled_tree, self.settled_frontier)]:
+        frontier.update(level, tree.min(*self.level_range(level)))
+
+  def level_range(self, level):
+    return self.level_starts[level], self.level_starts[level + 1]
+
+  def get_frontier(self, settled_only=False):
+    """Variants on the frontier from least to most accurate, and the variants they dominate"""
+    tree = self.settled_tree if settled_only else self.all_tree
+    frontier = self.settled_frontier if settled_only else self.all_frontier
+    with self.lock:
+      members = [
+        tree.argmin(*self.level_range(level))
+        for level in frontier.members
+        if frontier.latencies[level] < math.inf
+      ]
+    member_set = set(members)
+    return (
+      [self.models[slot] for slot in members],
+      [model for slot, model in enumerate(self.models) if slot not in member_set]
+    )
+
+  def first_slot_with_accuracy(self, min_accuracy):
+    return bisect.bisect_left(self.accuracies, min_accuracy)
+
+  @staticmethod
+  def ranges_without(lo, hi, exclude):
+    if exclude is None or not (lo <= exclude < hi):
+      return [(lo, hi)]
+    return [(lo, exclude), (exclude + 1, hi)]
+
+  def fastest(self, min_accuracy, exclude=None, settled_only=False):
+    """Lowest-latency variant with accuracy >= min_accuracy, as (model, latency)"""
+    tree = self.settled_tree if settled_only else self.all_tree
+    exclude = self.slots.get(exclude.name) if exclude is not None else None
+    if exclude is None:
+      frontier = self.settled_frontier if settled_only else self.all_frontier
+      with self.lock:
+        level = frontier.first_at_or_above(bisect.bisect_left(self.level_accuracies, min_accuracy))
+        if level is None:
+          return None
+        best = tree.argmin(*self.level_range(level))
+      return self.models[best], self.latencies[best]
+    # The excluded variant may be the one on the frontier, so search around it instead
+    best = None
+    with self.lock:
+      for lo, hi in self.ranges_without(self.first_slot_with_accuracy(min_accuracy), len(self.models), exclude):
+        slot = tree.argmin(lo, hi)
+        if slot is not None and (best is None or tree.tree[tree.size + slot] < tree.tree[tree.size + best]):
+          best = slot
+    if best is None:
+      return None
+    return self.models[best], self.latencies[best]
+
+  def at_most(self, max_latency, min_accuracy, exclude=None, settled_only=False):
+    """Every variant with accuracy >= min_accuracy and latency <= max_latency, as (model, latency)"""
+    tree = self.settled_tree if settled_only else self.all_tree
+    with self.lock:
+      slots = tree.slots_at_most(self.first_slot_with_accuracy(min_accuracy), len(self.models), max_latency)
+    return [(self.models[slot], self.latencies[slot]) for slot in slots if self.models[slot] is not exclude]
+
+  def iter_most_accurate(self, max_latency, min_accuracy=0., exclude=None, settled_only=False):
+    """Variants with latency <= max_latency from most to least accurate, as (model, latency)"""
+    tree = self.settled_tree if settled_only else self.all_tree
+    lo = self.first_slot_with_accuracy(min_accuracy)
+    hi = len(self.models)
+    while True:
+      with self.lock:
+        slot = tree.rightmost_at_most(lo, hi, max_latency)
+      if slot is None:
+        return
+      if self.models[slot] is not exclude:
+        yield self.models[slot], self.latencies[slot]
+      hi = slot
+
+  def most_accurate(self, max_latency, min_accuracy=0., exclude=None, settled_only=False):
+    """Highest-accuracy variant with latency <= max_latency, as (model, latency)"""
+    tree = self.settled_tree if settled_only else self.all_tree
+    exclude = self.slots.get(exclude.name) if exclude is not None else None
+    if exclude is None:
+      frontier = self.settled_frontier if settled_only else self.all_frontier
+      with self.lock:
+        level = frontier.last_within(max_latency)
+        if level is None or self.level_accuracies[level] < min_accuracy:
+          return None
+        best = tree.argmin(*self.level_range(level))
+      return self.models[best], self.latencies[best]
+    best = None
+    with self.lock:
+      # Ranges are in increasing accuracy, so the first hit from the top range wins
+      for lo, hi in reversed(self.ranges_without(self.first_slot_with_accuracy(min_accuracy), len(self.models), exclude)):
+        best = tree.rightmost_at_most(lo, hi, max_latency)
+        if best is not None:
+          break
+    if best is None:
+      return None
+    return self.models[best], self.latencies[best]
+
+
+class ModelCatalog(object):
+  """
+  Per-application indexes over the available variants, kept current as endpoints record new latencies.
+
+  Queries return the best variant in O(log n), optionally restricted to variants that have finished profiling.
+  Leaving the application out searches every application. Latencies are compared by their mean unless a
+  percentile is given, in which case an index over that percentile is built on first use.
+  """
+  def __init__(self, models):
+    self.models = collections.defaultdict(list)
+    for model in models:
+      self.models[model.application].append(model)
+      if hasattr(model, "latency_listeners"):
+        model.latency_listeners.append(self.update)
+
+    self.lock = threading.Lock()
+    self.indexes = {}  # (application, percentile) -> ApplicationIndex
+    self.last_refresh = time.time()
+    for application in self.models:
+      self.get_index(application)
+
+  def update(self, model):
+    with self.lock:
+      indexes = [index for (application, _), index in self.indexes.items() if application == model.application]
+    for index in indexes:
+      index.update(model)
+
+  def get_index(self, application, percentile=None):
+    key = (application, percentile_key(percentile))
+    with self.lock:
+      if key not in self.indexes:
+        self.indexes[key] = ApplicationIndex(self.models[application], percentile=key[1])
+      return self.indexes[key]
+
+  def refresh_if_stale(self):
+    """Recomputes every cached latency now and then, since idle endpoints drift towards a cold start unobserved"""
+    now = time.time()
+    with self.lock:
+      if now - self.last_refresh < common.LATENCY_REFRESH_INTERVAL_IN_SECONDS:
+        return
+      self.last_refresh = now
+    for models in self.models.values():
+      for model in models:
+        self.update(model)
+
+  def get_indexes(self, application=None, percentile=None):
+    self.refresh_if_stale()
+    applications = list(self.models) if application is None else [application]
+    return [self.get_index(a, percentile) for a in applications if a in self.models]
+
+  def get_frontier(self, application=None, percentile=None):
+    """Pareto-optimal variants by accuracy and latency, and the variants they dominate"""
+    frontier, dominated = [], []
+    for index in self.get_indexes(application, percentile):
+      index_frontier, index_dominated = index.get_frontier()
+      frontier += index_frontier
+      dominated += index_dominated
+    return frontier, dominated
+
+  def _query(self, method, application, better, percentile=None, **kwargs):
+    best = None
+    for index in self.get_indexes(application, percentile):
+      candidate = getattr(index, method)(**kwargs)
+      if candidate is not None and (best is None or better(candidate, best)):
+        best = candidate
+    return best[0] if best is not None else None
+
+  def fastest(self, min_accuracy, application=None, exclude=None, settled_only=False, percentile=None):
+    return self._query(
+      "fastest", application, (lambda a, b: a[1] < b[1]), percentile=percentile,
+      min_accuracy=min_accuracy, exclude=exclude, settled_only=settled_only
+    )
+
+  def most_accurate(self, max_latency, min_accuracy=0., application=None, exclude=None, settled_only=False,
+                    percentile=None):
+    return self._query(
+      "most_accurate", application, (lambda a, b: a[0].accuracy > b[0].accuracy), percentile=percentile,
+      max_latency=max_latency, min_accuracy=min_accuracy, exclude=exclude, settled_only=settled_only
+    )
+
+  def at_most(self, max_latency, min_accuracy=0., application=None, exclude=None, settled_only=False,
+              percentile=None):
+    return [
+      model
+      for index in self.get_indexes(application, percentile)
+      for model, _ in index.at_most(max_latency, min_accuracy, exclude=exclude, settled_only=settled_only)
+    ]
+
+  def iter_most_accurate(self, max_latency, min_accuracy=0., application=None, exclude=None, settled_only=False,
+                         percentile=None):
+    """Variants meeting the latency bound across applications, from most to least accurate"""
+    variants = heapq.merge(*[
+      index.iter_most_accurate(max_latency, min_accuracy, exclude=exclude, settled_only=settled_only)
+      for index in self.get_indexes(application, percentile)
+    ], key=(lambda variant: -variant[0].accuracy))
+    for model, _ in variants:
+      yield model
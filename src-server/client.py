@@ -23,19 +23,20 @@ log = logging.getLogger("layercake")
 log.setLevel(logging.DEBUG)
 
 NUM_SAMPLES = 10
-RANDOM_DATA = base64.b64encode(random.randbytes(31000))
+RANDOM_BYTES = random.randbytes(31000)
+RANDOM_DATA = base64.b64encode(RANDOM_BYTES)
 
 class LayercakeClient:
-  def __init__(self):
-    self.channel = grpc.insecure_channel('3.235.51.141:50051')
-    #self.channel = grpc.insecure_channel('localhost:50051')
+  def __init__(self, target=f"localhost:{common.GRPC_PORT}"):
+    self.channel = grpc.insecure_channel(target)
     self.stub = inference_service_pb2_grpc.InferenceStub(self.channel)
     self.total_time = 0
     self.num_requests = 0
+    self.network_report = None  # Timing of our last call, sent along with the next so the server can learn our network
 
   def infer1(self, model_name="efficientnetb0"):
     request = inference_service_pb2.Message1(
-      application=inference_service_pb2.Application.CLASSIFICATION,
+      application=inference_service_pb2.Application.IMAGE,
       model_name=model_name,
       data=RANDOM_DATA
     )
@@ -43,57 +44,161 @@ class LayercakeClient:
     feature_future = self.stub.Infer1.future(request)
     response = feature_future.result()
     time_end = time.time()
-    response_dict = json.loads(response.response[0])
-    return (time_end - time_start), response_dict["model"], response_dict
+    return (time_end - time_start), response.model_name, response
+
+  def infer1_bytes(self, model_name="efficientnetb0"):
+    request = inference_service_pb2.Message1V2(
+      application=inference_service_pb2.Application.IMAGE,
+      model_name=model_name,
+      data=RANDOM_BYTES
+    )
+    time_start = time.time()
+    feature_future = self.stub.Infer1V2.future(request)
+    response = feature_future.result()
+    time_end = time.time()
+    return (time_end - time_start), response.model_name, response
+
+  def infer1_stream(self, model_name="efficientnetb0", num_requests=NUM_SAMPLES):
+    """Sends num_requests over a single InferStream, returning the latency of each as it comes back"""
+    send_times = {}
+    def _requests():
+      for request_id in range(num_requests):
+        send_times[request_id] = time.time()
+        yield inference_service_pb2.StreamRequest(
+          request_id=request_id,
+          infer1=inference_service_pb2.Message1V2(
+            application=inference_service_pb2.Application.IMAGE,
+            model_name=model_name,
+            data=RANDOM_BYTES
+          )
+        )
+    latencies = {}
+    for stream_response in self.stub.InferStream(_requests()):
+      latencies[stream_response.request_id] = time.time() - send_times[stream_response.request_id]
+      if stream_response.HasField("error"):
+        log.error(f"Request {stream_response.request_id} failed: {stream_response.error}")
+    return latencies
 
   def infer2_accuracy(self, accuracy_target=0.5):
     request = inference_service_pb2.Message2(
-      application=inference_service_pb2.Application.CLASSIFICATION,
+      application=inference_service_pb2.Application.IMAGE,
       slo_type=inference_service_pb2.SLOType.ACCURACY,
       slo_value=accuracy_target,
       data=RANDOM_DATA
     )
+    self.attach_network_report(request)
     time_start = time.time()
     feature_future = self.stub.Infer2.future(request)
     response = feature_future.result()
     time_end = time.time()
-    response_dict = json.loads(response.response[0])
-    return (time_end - time_start), response_dict["model"], response_dict
+    self.record_network_report(request, response, time_end - time_start, response.timing.overall_latency)
+    return (time_end - time_start), response.model_name, response
 
-  def infer2_latency(self, latency_target=1.0):
+  def infer2_latency(self, latency_target=1.0, latency_percentile=None):
     request = inference_service_pb2.Message2(
       slo_type=inference_service_pb2.SLOType.LATENCY,
-      application=inference_service_pb2.Application.CLASSIFICATION,
+      application=inference_service_pb2.Application.IMAGE,
       slo_value=latency_target,
       data=RANDOM_DATA
     )
+    if latency_percentile is not None:
+      request.latency_percentile = latency_percentile
+    self.attach_network_report(request)
     time_start = time.time()
     feature_future = self.stub.Infer2.future(request)
     response = feature_future.result()
     time_end = time.time()
-    response_dict = json.loads(response.response[0])
-    return (time_end - time_start), response_dict["model"], response_dict
+    self.record_network_report(request, response, time_end - time_start, response.timing.overall_latency)
+    return (time_end - time_start), response.model_name, response
 
-  def infer3_latency(self, accuracy_target=0.5, latency_target=1.0):
-    request = inference_service_pb2.Message3(
-      application=inference_service_pb2.Application.CLASSIFICATION,
+  def infer2_cheapest(self, accuracy_target=0.5, latency_target=1.0):
+    """Cheapest variant meeting both SLOs, returning what the server estimates the request cost as well"""
+    request = inference_service_pb2.Message2(
       slo_type=inference_service_pb2.SLOType.LATENCY,
+      application=inference_service_pb2.Application.IMAGE,
       slo_value=latency_target,
+      min_accuracy=accuracy_target,
+      minimize_cost=True,
       data=RANDOM_DATA
     )
+    self.attach_network_report(request)
+    time_start = time.time()
+    feature_future = self.stub.Infer2.future(request)
+    response = feature_future.result()
+    time_end = time.time()
+    self.record_network_report(request, response, time_end - time_start, response.timing.overall_latency)
+    return (time_end - time_start), response.model_name, response.cost
+
+  def infer2_latency_bytes(self, latency_target=1.0, latency_percentile=None):
+    request = inference_service_pb2.Message2V2(
+      slo_type=inference_service_pb2.SLOType.LATENCY,
+      application=inference_service_pb2.Application.IMAGE,
+      slo_value=latency_target,
+      data=RANDOM_BYTES
+    )
+    if latency_percentile is not None:
+      request.latency_percentile = latency_percentile
+    self.attach_network_report(request)
+    time_start = time.time()
+    feature_future = self.stub.Infer2V2.future(request)
+    response = feature_future.result()
+    time_end = time.time()
+    self.record_network_report(request, response, time_end - time_start, response.timing.overall_latency)
+    return (time_end - time_start), response.model_name, response
+
+  def measure_bandwidth(self, num_bytes=len(RANDOM_DATA)):
+    """Echoes num_bytes off the server, reporting the previous echo's timing so the server learns our network"""
+    request = inference_service_pb2.BandwidthMeasurementMessage(data=RANDOM_DATA[:num_bytes].decode("utf-8"))
+    self.attach_network_report(request)
+    time_start = time.time()
+    response = self.stub.BandwidthMeasurement(request)
+    time_end = time.time()
+    self.record_network_report(request, response, time_end - time_start)
+    return (time_end - time_start)
+
+  def get_frontier(self, latency_percentile=None):
+    """Which deployed variants are Pareto-optimal, and which are dominated"""
+    request = inference_service_pb2.FrontierRequest()
+    if latency_percentile is not None:
+      request.latency_percentile = latency_percentile
+    return self.stub.GetFrontier(request)
+
+  def get_stats(self):
+    """The server's metrics, in the Prometheus text exposition format"""
+    return self.stub.GetStats(inference_service_pb2.StatsRequest()).exposition
+
+  def attach_network_report(self, request):
+    if self.network_report is not None:
+      request.network_report.CopyFrom(self.network_report)
+
+  def record_network_report(self, request, response, elapsed, server_time=0.):
+    self.network_report = inference_service_pb2.NetworkReport(
+      bytes=(request.ByteSize() + response.ByteSize()),
+      elapsed=elapsed,
+      server_time=server_time
+    )
+
+  def infer3_latency(self, accuracy_target=0.5, latency_target=1.0, latency_percentile=None):
+    request = inference_service_pb2.Message3(
+      application=inference_service_pb2.Application.IMAGE,
+      accuracy_slo=accuracy_target,
+      latency_slo=latency_target,
+    )
+    if latency_percentile is not None:
+      request.latency_percentile = latency_percentile
     time_start = time.time()
     feature_future = self.stub.Infer3.future(request)
     response = feature_future.result()
     time_end = time.time()
-    response_dict = json.loads(response.response[0])
-    return f"{(time_end - time_start):0.3f}s", response_dict["model"], response_dict
+    return f"{(time_end - time_start):0.3f}s", list(response.endpoints)
 
 
   def get_average_latency(self):
     return self.total_time / self.num_requests
 
 def main():
-  client = LayercakeClient()
+  # Sends one request at a time, so this only checks single-request latency; use loadgen.py to put the server under load
+  client = LayercakeClient(sys.argv[1] if len(sys.argv) > 1 else f"localhost:{common.GRPC_PORT}")
   #client.run_inference("efficientnetb0")
 
   print("Testing infer1")
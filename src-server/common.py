@@ -33,20 +33,80 @@ DUMMY_EXEC_LATENCY = 0.000
 DUMMY_LOAD_LATENCY = 0.000
 DUMMY_UNLOAD_LATENCY = 0
 
-KEEP_ALIVE_IN_SECONDS = 2
+KEEP_ALIVE_IN_SECONDS = 2 # Assumed idle time before a serverless endpoint goes cold, until one is learned
+COLD_START_LATENCY_RATIO = 3 # Invocations this many times slower than the warm median are counted as cold starts
+LATENCY_REFRESH_INTERVAL_IN_SECONDS = 1. # How often cached latencies are recomputed as idle endpoints cool down
+
+DEFAULT_BANDWIDTH_BYTES_PER_SECOND = 1e6 # Assumed for a client until its reports span enough payload sizes
+NETWORK_ESTIMATE_DECAY = 0.9 # Weight each earlier NetworkReport keeps when a new one arrives
+NETWORK_MIN_SIZE_SPREAD = 0.1 # Reports' sizes must vary by this fraction of their mean before bandwidth is fitted
+MAX_TRACKED_PEERS = 1024
+
+KEEP_WARM_PINGS_PER_HOUR = 600 # Budget of synthetic invocations sent to keep endpoints warm
+KEEP_WARM_INTERVAL_IN_SECONDS = 0.5
+KEEP_WARM_MAX_COLD_RISK = 0.1 # Endpoints are pinged before their chance of a cold start passes this
+KEEP_WARM_MIN_REQUEST_PROBABILITY = 0.5 # ...but only if a request within one keep-alive is at least this likely
+KEEP_WARM_RATE_TIME_CONSTANT_IN_SECONDS = 300. # How quickly request rate estimates forget old traffic
 PLACEMENT_POLL_INTERVAL = 0.1
 
 MODEL_INFO_FRESHNESS = 5.
 MAX_MEMORY_IN_GB = 2.
 RNG_SEED = 0
 NUM_MEASUREMENTS = 100
+NUM_WARMUP_EXECUTIONS = 100
+WARMUP_CONCURRENCY = 8
+WARMUP_BUDGET_IN_SECONDS = 120
+MIN_PROFILING_SAMPLES = 10
 NUM_REQUESTS_PER_MEASUREMENT = 10
 MODEL_REPO = os.path.abspath("../models")
 MODELS_FILE = os.path.abspath("./model_stats.json")
+PROFILE_STORE_FILE = os.path.abspath("./profiles.db")
+PROFILE_MAX_AGE_IN_SECONDS = 24 * 3600. # Endpoints whose saved profile is older than this are profiled again
 
 NUM_EXECUTION_THREADS = 1
 SHUTDOWN_GRACE = 3
 
+GRPC_PORT = 50051
+NUM_GRPC_WORKERS = 10
+MAX_IN_FLIGHT_REQUESTS = 256
+MAX_STREAM_OUTSTANDING = 32 # Requests per InferStream accepted but not yet answered before we stop reading
+NUM_STREAM_WORKERS = 64
+
+SERVERLESS_MAX_CONCURRENCY = 1
+DEDICATED_CONCURRENCY = 4 # Concurrent invocations we send to a single dedicated instance
+SERVERLESS_MEMORY_SIZE_IN_MB = 6144
+DEDICATED_INSTANCE_TYPE = "ml.t2.medium"
+
+# Prices in USD (us-east-1), used to estimate what each invocation costs
+SERVERLESS_PRICE_PER_GB_SECOND = 0.00002
+INSTANCE_PRICE_PER_HOUR = {
+  "ml.t2.medium" : 0.056,
+  "ml.t2.large" : 0.111,
+  "ml.m5.large" : 0.115,
+  "ml.m5.xlarge" : 0.23,
+  "ml.c5.large" : 0.102,
+  "ml.c5.xlarge" : 0.204,
+  "ml.g4dn.xlarge" : 0.736,
+}
+
+MAX_BATCH_SIZE = 8
+BATCH_WINDOW_IN_SECONDS = 0.010
+
+HEDGE_PERCENTILE = 95
+DEFAULT_ACCURACY_FLOOR = 0.5 # Accuracy any variant picked for a request without its own floor has to meet
+
+LATENCY_WINDOW_SIZE = 1000 # Most recent measurements per endpoint and action that latency statistics cover
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MIN_VALUE = 1e-6 # Seconds; shorter latencies are counted as zero by the quantile sketch
+
+METRICS_LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+
+TRACE_SAMPLE_RATE = 0.01 # Fraction of requests traced, once tracing is turned on
+TRACE_BUFFER_SIZE = 65536 # Spans each thread holds before the oldest are dropped, if flushing falls behind
+TRACE_FLUSH_INTERVAL_IN_SECONDS = 1.
+
+JPEG_DRAFT_RATIO = 2 # Inputs at least this many times the target size (per side) are decoded at reduced resolution
+
 
 #############
 #############
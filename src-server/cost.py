@@ -0,0 +1,76 @@
+#!env python
+
+## Built-in imports
+import logging
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.cost")
+log.setLevel(logging.INFO)
+
+
+class CostModel(object):
+  """
+  What invocations on one endpoint cost, in USD.
+
+  Serverless endpoints are billed for their memory size times how long each invocation runs, and cost nothing while
+  idle. Dedicated instances are billed by the hour whether used or not, so each invocation is charged its share of
+  the instance: the time it runs, split among the invocations the instance serves at once.
+  """
+  def __init__(self, memory_size_in_mb=None, instance_type=None, concurrency=1):
+    if (memory_size_in_mb is None) == (instance_type is None):
+      raise ValueError("A cost model needs exactly one of a serverless memory size or an instance type")
+    if instance_type is not None and instance_type not in common.INSTANCE_PRICE_PER_HOUR:
+      raise ValueError(f"No price known for instance type {instance_type}")
+    self.memory_size_in_mb = memory_size_in_mb
+    self.instance_type = instance_type
+    self.concurrency = concurrency
+
+  @classmethod
+  def serverless(cls, memory_size_in_mb=common.SERVERLESS_MEMORY_SIZE_IN_MB):
+    return cls(memory_size_in_mb=memory_size_in_mb)
+
+  @classmethod
+  def dedicated(cls, instance_type=common.DEDICATED_INSTANCE_TYPE, concurrency=common.DEDICATED_CONCURRENCY):
+    return cls(instance_type=instance_type, concurrency=concurrency)
+
+  @property
+  def is_serverless(self):
+    return self.instance_type is None
+
+  @property
+  def hourly_cost(self):
+    """What keeping the endpoint deployed costs per hour regardless of traffic"""
+    if self.is_serverless:
+      return 0.
+    return common.INSTANCE_PRICE_PER_HOUR[self.instance_type]
+
+  def invocation_cost(self, duration):
+    """Cost of one invocation running for duration seconds"""
+    if self.is_serverless:
+      return (self.memory_size_in_mb / 1024.) * duration * common.SERVERLESS_PRICE_PER_GB_SECOND
+    return self.hourly_cost / 3600. * duration / self.concurrency
+
+  def to_dict(self):
+    return {
+      "memory_size_in_mb" : self.memory_size_in_mb,
+      "instance_type" : self.instance_type,
+      "concurrency" : self.concurrency,
+    }
+
+  @classmethod
+  def from_dict(cls, cost_dict):
+    """Inverse of to_dict; endpoints recorded before costs were tracked were all serverless at the default size"""
+    if cost_dict is None:
+      return cls.serverless()
+    return cls(**cost_dict)
+
+  def __str__(self):
+    if self.is_serverless:
+      return f"<serverless {self.memory_size_in_mb}MB>"
+    return f"<{self.instance_type} x{self.concurrency}>"
@@ -0,0 +1,120 @@
+#!env python
+
+## Built-in imports
+import logging
+import threading
+import time
+
+## pip'd imports
+import numpy as np
+
+## my imports
+import catalog
+import common
+import inference_service_pb2 as inference_service_pb2
+
+logging.basicConfig()
+log = logging.getLogger("layercake.discovery")
+log.setLevel(logging.INFO)
+
+
+def get_endpoint_information(model, percentile=None):
+  endpoint_info = inference_service_pb2.EndpointInformation(
+    model_name=model.name,
+    endpoint_name=model.endpoint.endpoint_name,
+    accuracy=model.accuracy,
+    latency=model.latency,
+    dimensions=model.dimensions[0],
+    profiling=model.is_profiling,
+    cost=model.expected_cost,
+    application=EndpointDirectory.to_proto_application(model.application),
+  )
+  if percentile is not None:
+    endpoint_info.latency_percentile = percentile
+    endpoint_info.percentile_latency = catalog.latency_at(model, percentile)
+  return endpoint_info
+
+
+class DirectoryView(object):
+  """The latency column and cached entries of an EndpointDirectory for one way of summarizing latency"""
+  def __init__(self, num_models, percentile=None):
+    self.percentile = percentile
+    self.latency = np.zeros(num_models, dtype=np.float64)  # What is both compared against the SLO and reported
+    self.entries = [b""] * num_models
+    self.dirty = set(range(num_models))
+
+
+class EndpointDirectory(object):
+  """
+  Columnar view of the endpoints for Infer3, so that filtering on an SLO is a single vectorized mask.
+
+  Each row also caches its EndpointInformation already serialized and framed as an entry of Endpoints.endpoints,
+  so a reply is the matching rows joined together. Rows are refreshed lazily, on the first query after their
+  endpoint records a new measurement. Queries on a latency percentile get their own latency column and entries,
+  created the first time that percentile is asked for.
+  """
+  def __init__(self, models):
+    self.models = list(models)
+    num_models = len(self.models)
+    self.accuracy = np.array([m.accuracy for m in self.models], dtype=np.float64)
+    self.warm_latency = np.zeros(num_models, dtype=np.float64)
+    self.cold_latency = np.zeros(num_models, dtype=np.float64)
+    self.application = np.array([self.to_proto_application(m.application) for m in self.models], dtype=np.int32)
+    self.dimensions = np.array([m.dimensions[0] for m in self.models], dtype=np.int32)
+
+    self.lock = threading.Lock()
+    self.rows = { m.name : i for i, m in enumerate(self.models) }
+    self.views = { None : DirectoryView(num_models) }
+    self.last_refresh = time.time()
+    for model in self.models:
+      if hasattr(model, "latency_listeners"):
+        model.latency_listeners.append(self.mark_dirty)
+
+  @staticmethod
+  def to_proto_application(application):
+    if application == common.Application.IMAGE:
+      return inference_service_pb2.Application.IMAGE
+    return inference_service_pb2.Application.TEXT
+
+  def mark_dirty(self, model):
+    with self.lock:
+      for view in self.views.values():
+        view.dirty.add(self.rows[model.name])
+
+  def get_view(self, percentile):
+    """Caller must hold the lock"""
+    key = catalog.percentile_key(percentile)
+    if key not in self.views:
+      self.views[key] = DirectoryView(len(self.models), percentile=key)
+    return self.views[key]
+
+  def refresh(self, view):
+    """Rebuilds the view's rows whose stats changed since it was last queried; caller must hold the lock"""
+    for i in view.dirty:
+      model = self.models[i]
+      self.warm_latency[i] = model.exec_latency
+      self.cold_latency[i] = model.coldexec_latency
+      view.latency[i] = catalog.latency_at(model, view.percentile)
+      # metadata is filled in per reply
+      view.entries[i] = inference_service_pb2.Endpoints(endpoints=[
+        get_endpoint_information(model, view.percentile)
+      ]).SerializePartialToString()
+    view.dirty.clear()
+
+  def find(self, application, min_accuracy, max_latency, percentile=None):
+    """
+    Serialized Endpoints.endpoints entries for every endpoint of the application that meets both SLOs.
+
+    With a percentile, max_latency bounds that percentile of latency rather than the mean.
+    """
+    with self.lock:
+      if time.time() - self.last_refresh >= common.LATENCY_REFRESH_INTERVAL_IN_SECONDS:
+        # Idle endpoints drift towards a cold start without recording anything, so recompute every row now and then
+        self.last_refresh = time.time()
+        for view in self.views.values():
+          view.dirty.update(range(len(self.models)))
+      view = self.get_view(percentile)
+      if len(view.dirty) > 0:
+        self.refresh(view)
+      mask = (self.application == application) & (self.accuracy >= min_accuracy) & (view.latency <= max_latency)
+      return b"".join([view.entries[i] for i in np.flatnonzero(mask)])
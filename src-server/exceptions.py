@@ -1,4 +1,8 @@
 #!env python
 
 class NoModelFound(Exception):
-  pass
\ No newline at end of file
+  pass
+
+class BatchSizeMismatch(Exception):
+  """An endpoint answered a batch with a different number of predictions than it was sent"""
+  pass
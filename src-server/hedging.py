@@ -0,0 +1,137 @@
+#!env python
+
+## Built-in imports
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent import futures
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+import serving_model
+import tracing
+
+logging.basicConfig()
+log = logging.getLogger("layercake.hedging")
+log.setLevel(logging.INFO)
+
+
+class Hedger(object):
+  """
+  Backs up latency-SLO requests whose primary endpoint is running late with a second model variant.
+
+  If the primary has not answered by the given percentile of its expected latency (queueing included), the same
+  input is queued on the hedge variant and whichever answers first is returned. A loser still waiting in its queue
+  is cancelled; one already running is left to finish and its response ignored.
+  """
+  def __init__(self, scheduler, percentile=common.HEDGE_PERCENTILE):
+    self.scheduler = scheduler
+    self.percentile = percentile
+
+    self.lock = threading.Lock()
+    self.num_requests = 0  # Requests that had a hedge variant available
+    self.num_hedged = 0
+    self.num_hedge_wins = 0
+    self.num_slo_rescued = 0  # Hedge met the SLO and the primary would not have
+
+  def hedge_delay(self, primary):
+    return (
+      self.scheduler.estimate_queue_delay(primary)
+      + primary.measurements[serving_model.ActionState.INFER].percentile(self.percentile)
+    )
+
+  def should_hedge(self, hedge_model, deadline):
+    """Only worth firing if the hedge could still make the deadline"""
+    return deadline is None or time.time() + hedge_model.expected_latency <= deadline
+
+  def new_hedge_request(self, inference_request, hedge_model, encoded_data):
+    """Copy of the request for the hedge variant, given the input already encoded for it"""
+    hedge_request = inference_request.__class__(
+      model_name=hedge_model.name, data=encoded_data, deadline=inference_request.deadline)
+    hedge_request.times["entry_time"] = inference_request.times["entry_time"]
+    hedge_request.set_model(hedge_model)
+    hedge_request.trace = inference_request.trace
+    return hedge_request
+
+  def run(self, inference_request, hedge_model, data):
+    """Waits on an already-submitted request, hedging it if needed, and returns whichever request finished first"""
+    primary_future = inference_request.future
+    with self.lock:
+      self.num_requests += 1
+    try:
+      return primary_future.result(timeout=self.hedge_delay(inference_request.model))
+    except futures.TimeoutError:
+      pass
+    if not self.should_hedge(hedge_model, inference_request.deadline):
+      return primary_future.result()
+
+    hedge_request = self.new_hedge_request(inference_request, hedge_model, hedge_model.encode_input(data))
+    hedge_future = self.scheduler.submit(hedge_request)
+    self.record_hedge(primary_future, hedge_future, inference_request.deadline)
+    for future in futures.as_completed([primary_future, hedge_future]):
+      if future.exception() is None:
+        break
+    (hedge_future if future is primary_future else primary_future).cancel()
+    return future.result()
+
+  async def run_async(self, inference_request, hedge_model, data, executor=None):
+    """run() for the event loop, encoding the hedge's input in executor so the loop is never held up by it"""
+    primary_future = inference_request.future
+    with self.lock:
+      self.num_requests += 1
+    done, _ = await asyncio.wait(
+      [asyncio.wrap_future(primary_future)], timeout=self.hedge_delay(inference_request.model))
+    if len(done) > 0 or not self.should_hedge(hedge_model, inference_request.deadline):
+      return await asyncio.wrap_future(primary_future)
+
+    encoded_data = await asyncio.get_running_loop().run_in_executor(
+      executor, tracing.bind(functools.partial(hedge_model.encode_input, data)))
+    hedge_request = self.new_hedge_request(inference_request, hedge_model, encoded_data)
+    hedge_future = self.scheduler.submit(hedge_request)
+    self.record_hedge(primary_future, hedge_future, inference_request.deadline)
+    pending = {asyncio.wrap_future(primary_future), asyncio.wrap_future(hedge_future)}
+    while len(pending) > 0:
+      done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+      winner = next((f for f in done if f.exception() is None), None)
+      if winner is not None:
+        break
+    for future in [primary_future, hedge_future]:
+      if not future.done():
+        future.cancel()
+    return await (winner if winner is not None else asyncio.wrap_future(primary_future))
+
+  def record_hedge(self, primary_future, hedge_future, deadline):
+    with self.lock:
+      self.num_hedged += 1
+
+    def _hedge_done(f):
+      if f.cancelled() or f.exception() is not None:
+        return
+      if not primary_future.done() or primary_future.cancelled():
+        with self.lock:
+          self.num_hedge_wins += 1
+        if deadline is not None and f.result().times["execution_end_time"] <= deadline:
+          primary_future.add_done_callback(_primary_done)
+
+    def _primary_done(f):
+      # The hedge answered within the SLO; it only rescued the request if the primary was never going to
+      if f.cancelled() or f.exception() is not None or f.result().times["execution_end_time"] > deadline:
+        with self.lock:
+          self.num_slo_rescued += 1
+
+    hedge_future.add_done_callback(_hedge_done)
+
+  def get_stats(self):
+    with self.lock:
+      return {
+        "requests" : self.num_requests,
+        "hedged" : self.num_hedged,
+        "hedge_rate" : (self.num_hedged / self.num_requests) if self.num_requests > 0 else 0.,
+        "hedge_wins" : self.num_hedge_wins,
+        "slo_rescued" : self.num_slo_rescued,
+      }
@@ -39,6 +39,31 @@ class InferenceStub(object):
                 request_serializer=inference__service__pb2.BandwidthMeasurementMessage.SerializeToString,
                 response_deserializer=inference__service__pb2.BandwidthMeasurementMessage.FromString,
                 )
+        self.Infer1V2 = channel.unary_unary(
+                '/inference_service.Inference/Infer1V2',
+                request_serializer=inference__service__pb2.Message1V2.SerializeToString,
+                response_deserializer=inference__service__pb2.InferenceResponse.FromString,
+                )
+        self.Infer2V2 = channel.unary_unary(
+                '/inference_service.Inference/Infer2V2',
+                request_serializer=inference__service__pb2.Message2V2.SerializeToString,
+                response_deserializer=inference__service__pb2.InferenceResponse.FromString,
+                )
+        self.InferStream = channel.stream_stream(
+                '/inference_service.Inference/InferStream',
+                request_serializer=inference__service__pb2.StreamRequest.SerializeToString,
+                response_deserializer=inference__service__pb2.StreamResponse.FromString,
+                )
+        self.GetFrontier = channel.unary_unary(
+                '/inference_service.Inference/GetFrontier',
+                request_serializer=inference__service__pb2.FrontierRequest.SerializeToString,
+                response_deserializer=inference__service__pb2.Frontier.FromString,
+                )
+        self.GetStats = channel.unary_unary(
+                '/inference_service.Inference/GetStats',
+                request_serializer=inference__service__pb2.StatsRequest.SerializeToString,
+                response_deserializer=inference__service__pb2.Stats.FromString,
+                )
 
 
 class InferenceServicer(object):
@@ -74,6 +99,36 @@ class InferenceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Infer1V2(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Infer2V2(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def InferStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetFrontier(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetStats(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_InferenceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -102,6 +157,31 @@ def add_InferenceServicer_to_server(servicer, server):
                     request_deserializer=inference__service__pb2.BandwidthMeasurementMessage.FromString,
                     response_serializer=inference__service__pb2.BandwidthMeasurementMessage.SerializeToString,
             ),
+            'Infer1V2': grpc.unary_unary_rpc_method_handler(
+                    servicer.Infer1V2,
+                    request_deserializer=inference__service__pb2.Message1V2.FromString,
+                    response_serializer=inference__service__pb2.InferenceResponse.SerializeToString,
+            ),
+            'Infer2V2': grpc.unary_unary_rpc_method_handler(
+                    servicer.Infer2V2,
+                    request_deserializer=inference__service__pb2.Message2V2.FromString,
+                    response_serializer=inference__service__pb2.InferenceResponse.SerializeToString,
+            ),
+            'InferStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.InferStream,
+                    request_deserializer=inference__service__pb2.StreamRequest.FromString,
+                    response_serializer=inference__service__pb2.StreamResponse.SerializeToString,
+            ),
+            'GetFrontier': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetFrontier,
+                    request_deserializer=inference__service__pb2.FrontierRequest.FromString,
+                    response_serializer=inference__service__pb2.Frontier.SerializeToString,
+            ),
+            'GetStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetStats,
+                    request_deserializer=inference__service__pb2.StatsRequest.FromString,
+                    response_serializer=inference__service__pb2.Stats.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'inference_service.Inference', rpc_method_handlers)
@@ -196,3 +276,88 @@ class Inference(object):
             inference__service__pb2.BandwidthMeasurementMessage.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Infer1V2(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/inference_service.Inference/Infer1V2',
+            inference__service__pb2.Message1V2.SerializeToString,
+            inference__service__pb2.InferenceResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Infer2V2(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/inference_service.Inference/Infer2V2',
+            inference__service__pb2.Message2V2.SerializeToString,
+            inference__service__pb2.InferenceResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def InferStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/inference_service.Inference/InferStream',
+            inference__service__pb2.StreamRequest.SerializeToString,
+            inference__service__pb2.StreamResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetFrontier(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/inference_service.Inference/GetFrontier',
+            inference__service__pb2.FrontierRequest.SerializeToString,
+            inference__service__pb2.Frontier.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/inference_service.Inference/GetStats',
+            inference__service__pb2.StatsRequest.SerializeToString,
+            inference__service__pb2.Stats.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -14,13 +14,14 @@ import asyncio.events
 
 ## my imports
 import common
+import tracing
 
 
 @total_ordering
 class InferenceRequest(object):
   _ids = itertools.count(1)
 
-  def __init__(self, model_name, data, id_num=None, allow_timeout=True):
+  def __init__(self, model_name, data, id_num=None, allow_timeout=True, deadline=None):
     if id_num is None:
       self.id = next(self._ids)
     else:
@@ -36,8 +37,12 @@ class InferenceRequest(object):
       "execution_start_time" : 0.,
       "execution_end_time" : 0.,
     }
+    self.deadline = deadline # Absolute time by which the response is needed, if the request has a latency SLO
     self.model_miss = False
     self.response = None
+    self.future = None
+    self.trace = tracing.current_trace()  # Set if the request is being traced, so its workers can add to the trace
+    self.assigned_ns = None
 
   def __repr__(self):
     return f"<{self.__class__.__name__}: {self.id}, {self.model_name}, \"{self.response}\">"
@@ -53,9 +58,12 @@ class InferenceRequest(object):
 
   def set_model(self, model):
     self.model = model
+    self.model_name = model.name
 
   def mark_assigned(self, miss=False):
     self.times["assignment_time"] = time.time()
+    if self.trace is not None:
+      self.assigned_ns = tracing.now()
     if miss:
       self.mark_model_miss()
 
@@ -77,14 +85,19 @@ class InferenceRequest(object):
   def is_started(self):
     return (self.times["execution_start_time"] != 0.)
 
-  def getResponse(self):
-    response_dict = {
-      "model" : self.model_name,
-      "response" : self.response,
+  def getTimes(self):
+    return {
       "placement_delay" : self.times["assignment_time"] - self.times["entry_time"],
       "queue_delay" : self.times["execution_start_time"] - self.times["assignment_time"],
       "execution_delay" : self.times["execution_end_time"] - self.times["execution_start_time"],
       "overall_latency" : self.times["execution_end_time"] - self.times["entry_time"],
+    }
+
+  def getResponse(self):
+    response_dict = {
+      "model" : self.model_name,
+      "response" : self.response,
+      **self.getTimes(),
       "model_miss" : self.model_miss,
     }
     return json.dumps(response_dict)
@@ -0,0 +1,168 @@
+#!env python
+
+## Built-in imports
+import logging
+import math
+import threading
+import time
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+import inferencerequest
+
+logging.basicConfig()
+log = logging.getLogger("layercake.keep_warm")
+log.setLevel(logging.INFO)
+
+
+class RequestRate(object):
+  """Exponentially decaying estimate of how many requests per second a model gets"""
+  def __init__(self, time_constant=common.KEEP_WARM_RATE_TIME_CONSTANT_IN_SECONDS):
+    self.time_constant = time_constant
+    self.rate = 0.
+    self.last_update = time.time()
+    self.last_request = None
+
+  def decayed(self, now):
+    return self.rate * math.exp(-(now - self.last_update) / self.time_constant)
+
+  def record(self, now):
+    self.rate = self.decayed(now) + 1. / self.time_constant
+    self.last_update = now
+    self.last_request = now
+
+  def probability_of_request(self, now, horizon):
+    """Chance of at least one request in the next horizon seconds, treating arrivals as Poisson"""
+    return 1. - math.exp(-self.decayed(now) * horizon)
+
+
+class KeepWarmScheduler(object):
+  """
+  Pings serverless endpoints with their default input just before they would go cold, if they are likely to be
+  requested again soon.
+
+  An endpoint is pinged once its odds of a cold start (see keepalive.KeepAliveEstimator) would pass
+  common.KEEP_WARM_MAX_COLD_RISK by the next check. The ping only goes out if the model's recent request rate makes a
+  request within one keep-alive likely enough, and if the hourly ping budget has room. Pings are queued through the
+  scheduler like any other request, so they respect endpoint concurrency. A real request that arrives warm on an
+  endpoint that would have gone cold without a ping since the last real request counts as a cold start avoided.
+  Each completed ping is priced with its endpoint's cost model, so the stats report what keeping warm spent in USD.
+  """
+  def __init__(self, endpoints, scheduler, pings_per_hour=common.KEEP_WARM_PINGS_PER_HOUR,
+               interval=common.KEEP_WARM_INTERVAL_IN_SECONDS):
+    self.endpoints = dict(endpoints)
+    self.scheduler = scheduler
+    self.pings_per_hour = pings_per_hour
+    self.interval = interval
+
+    self.lock = threading.Lock()
+    self.rates = { name : RequestRate() for name in self.endpoints }
+    self.last_ping = {}  # endpoint name -> when it was last pinged
+    self.pinging = set()  # endpoints with a ping queued or running
+    self.budget = float(pings_per_hour)  # Token bucket, refilled continuously up to pings_per_hour
+    self.last_refill = time.time()
+
+    self.num_pings = 0
+    self.num_failed_pings = 0
+    self.num_skipped_for_budget = 0
+    self.num_cold_starts_avoided = 0
+    self.spend = { name : 0. for name in self.endpoints }  # USD spent on pings, per endpoint
+
+    self.stopped = threading.Event()
+    self.thread = threading.Thread(target=self._run, name="keep-warm", daemon=True)
+
+  def start(self):
+    self.thread.start()
+
+  def stop(self):
+    self.stopped.set()
+
+  def record_request(self, model):
+    """Called for every real request placed on an endpoint"""
+    now = time.time()
+    with self.lock:
+      rate = self.rates[model.name]
+      last_ping = self.last_ping.get(model.name)
+      if (last_ping is not None and rate.last_request is not None and last_ping > rate.last_request
+          and now - rate.last_request > model.keep_alive.keep_alive
+          and model.cold_start_probability() < 1.):
+        self.num_cold_starts_avoided += 1
+      rate.record(now)
+
+  def _refill(self, now):
+    """Caller must hold the lock"""
+    self.budget = min(float(self.pings_per_hour), self.budget + (now - self.last_refill) * self.pings_per_hour / 3600.)
+    self.last_refill = now
+
+  def should_ping(self, endpoint, now):
+    if endpoint.name in self.pinging or not endpoint.is_loaded or endpoint.first_run:
+      return False
+    if self.scheduler.get_queue(endpoint).queue_depth > 0:
+      return False  # Queued work will keep it warm anyway
+    # Ping if it will be at risk by the time we next look, leaving room for the ping to reach it
+    lead = self.interval + endpoint.exec_latency
+    if endpoint.keep_alive.cold_start_probability(now + lead) < common.KEEP_WARM_MAX_COLD_RISK:
+      return False
+    horizon = endpoint.keep_alive.keep_alive
+    return self.rates[endpoint.name].probability_of_request(now, horizon) >= common.KEEP_WARM_MIN_REQUEST_PROBABILITY
+
+  def ping(self, endpoint):
+    request = inferencerequest.InferenceRequest(model_name=endpoint.name, data=endpoint.encode_input(None))
+    request.set_model(endpoint)
+    future = self.scheduler.submit(request)
+
+    def _done(f):
+      with self.lock:
+        self.pinging.discard(endpoint.name)
+        if f.cancelled() or f.exception() is not None:
+          self.num_failed_pings += 1
+          return
+        self.spend[endpoint.name] += endpoint.cost_model.invocation_cost(f.result().getTimes()["execution_delay"])
+    future.add_done_callback(_done)
+
+  def check(self):
+    now = time.time()
+    to_ping = []
+    with self.lock:
+      self._refill(now)
+      for endpoint in self.endpoints.values():
+        if not self.should_ping(endpoint, now):
+          continue
+        if self.budget < 1.:
+          self.num_skipped_for_budget += 1
+          continue
+        self.budget -= 1.
+        self.num_pings += 1
+        self.last_ping[endpoint.name] = now
+        self.pinging.add(endpoint.name)
+        to_ping.append(endpoint)
+    for endpoint in to_ping:
+      log.debug(f"Pinging {endpoint.name} to keep it warm")
+      self.ping(endpoint)
+
+  def _run(self):
+    while not self.stopped.wait(self.interval):
+      try:
+        self.check()
+      except Exception as e:
+        log.error(f"Keep-warm check failed: {e}")
+
+  def get_stats(self):
+    with self.lock:
+      spend = sum(self.spend.values())
+      return {
+        "pings" : self.num_pings,
+        "spend" : spend,
+        "spend_by_endpoint" : dict(self.spend),
+        "spend_per_cold_start_avoided" : (
+          (spend / self.num_cold_starts_avoided) if self.num_cold_starts_avoided > 0 else None),
+        "failed_pings" : self.num_failed_pings,
+        "skipped_for_budget" : self.num_skipped_for_budget,
+        "cold_starts_avoided" : self.num_cold_starts_avoided,
+        "pings_per_cold_start_avoided" : (
+          (self.num_pings / self.num_cold_starts_avoided) if self.num_cold_starts_avoided > 0 else None),
+        "cold_starts" : sum([e.keep_alive.num_cold_starts for e in self.endpoints.values()]),
+      }
@@ -0,0 +1,130 @@
+#!env python
+
+## Built-in imports
+import logging
+import threading
+import time
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.keepalive")
+log.setLevel(logging.INFO)
+
+
+class KeepAliveEstimator(object):
+  """
+  Tracks when an endpoint was last used and learns how long it stays warm once idle.
+
+  Every invocation that starts with nothing else in flight is evidence about the keep-alive: if it was warm, the
+  endpoint survived that long idle, and if it was a cold start (a latency far above the warm median) it did not.
+  The longest idle period survived and the shortest one that was not bound the keep-alive, and the chance of a
+  cold start rises linearly between them. Until a cold start has been seen, the upper bound is
+  common.KEEP_ALIVE_IN_SECONDS or twice the longest idle survived, whichever is larger.
+  """
+  def __init__(self, default_keep_alive=common.KEEP_ALIVE_IN_SECONDS):
+    self.default_keep_alive = default_keep_alive
+    self.lock = threading.Lock()
+    self.last_active = None  # When the endpoint last had an invocation running
+    self.in_flight = 0
+    self.max_warm_idle = 0.  # Longest idle period after which the endpoint was still warm
+    self.min_cold_idle = None  # Shortest idle period after which it started cold
+    self.num_cold_starts = 0
+
+  def begin(self, start_time):
+    """Marks an invocation starting, returning how long the endpoint had been idle (None if never used or busy)"""
+    with self.lock:
+      idle = None
+      if self.in_flight == 0 and self.last_active is not None:
+        idle = max(0., start_time - self.last_active)
+      self.in_flight += 1
+      self.last_active = start_time
+      return idle
+
+  def end(self, end_time, idle, cold):
+    """Marks an invocation finishing, learning from it if it started on an idle endpoint"""
+    with self.lock:
+      self.in_flight -= 1
+      self.last_active = end_time
+      if cold:
+        self.num_cold_starts += 1
+      if idle is None:
+        return
+      if cold:
+        self.min_cold_idle = idle if self.min_cold_idle is None else min(self.min_cold_idle, idle)
+        if idle <= self.max_warm_idle:
+          # The keep-alive got shorter than we had seen it survive, so forget the old lower bound
+          self.max_warm_idle = 0.
+      else:
+        self.max_warm_idle = max(self.max_warm_idle, idle)
+        if self.min_cold_idle is not None and idle >= self.min_cold_idle:
+          self.min_cold_idle = None
+
+  @staticmethod
+  def is_cold_start(latency, warm_latencies):
+    """Whether a latency is far enough above the warm median to have been a cold start"""
+    if len(warm_latencies) < common.MIN_PROFILING_SAMPLES:
+      return False
+    return latency > common.COLD_START_LATENCY_RATIO * warm_latencies.percentile(50)
+
+  def get_bounds(self):
+    with self.lock:
+      lower = self.max_warm_idle
+      if self.min_cold_idle is not None:
+        upper = self.min_cold_idle
+      else:
+        upper = max(self.default_keep_alive, 2 * self.max_warm_idle)
+      return lower, max(lower, upper)
+
+  @property
+  def keep_alive(self):
+    """Best guess at how long the endpoint stays warm once idle"""
+    lower, upper = self.get_bounds()
+    return (lower + upper) / 2
+
+  def cold_start_probability(self, now=None):
+    """Chance that an invocation sent now starts cold"""
+    if now is None:
+      now = time.time()
+    with self.lock:
+      if self.in_flight > 0:
+        return 0.
+      if self.last_active is None:
+        return 1.
+      idle = now - self.last_active
+    lower, upper = self.get_bounds()
+    if idle <= lower:
+      return 0.
+    if idle >= upper:
+      return 1.
+    return (idle - lower) / (upper - lower)
+
+  def to_dict(self):
+    """What has been learned about the keep-alive, leaving out when the endpoint was last used"""
+    with self.lock:
+      return {
+        "max_warm_idle" : self.max_warm_idle,
+        "min_cold_idle" : self.min_cold_idle,
+        "cold_starts" : self.num_cold_starts,
+      }
+
+  def load_dict(self, keep_alive_dict):
+    with self.lock:
+      self.max_warm_idle = keep_alive_dict["max_warm_idle"]
+      self.min_cold_idle = keep_alive_dict["min_cold_idle"]
+      self.num_cold_starts = keep_alive_dict["cold_starts"]
+
+  def get_stats(self):
+    lower, upper = self.get_bounds()
+    with self.lock:
+      return {
+        "keep_alive" : (lower + upper) / 2,
+        "max_warm_idle" : lower,
+        "min_cold_idle" : self.min_cold_idle,
+        "cold_starts" : self.num_cold_starts,
+        "idle" : (time.time() - self.last_active) if self.last_active is not None and self.in_flight == 0 else 0.,
+      }
@@ -0,0 +1,387 @@
+#!env python
+"""
+Open-loop load generator for the inference server.
+
+Requests are sent when the arrival process says they arrive, whether or not earlier ones have been answered, so the
+results show how the server behaves as it saturates rather than just the latency of one request at a time.
+Run from src-server/ as e.g. `python loadgen.py --target localhost:50051 --rate 200 --duration 60 --mix infer2=1`.
+"""
+
+## Built-in imports
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+
+## pip'd imports
+import grpc
+
+## my imports
+import common
+import inference_service_pb2 as inference_service_pb2
+import inference_service_pb2_grpc as inference_service_pb2_grpc
+import stats
+
+logging.basicConfig()
+log = logging.getLogger("layercake.loadgen")
+log.setLevel(logging.INFO)
+
+HGRM_PERCENTILE_TICKS_PER_HALF = 5  # Rows per halving of the distance to 100% in .hgrm output, as HdrHistogram does
+
+
+######################
+# Arrival Processes  #
+######################
+class PoissonArrivals(object):
+  """Independent arrivals at a steady average rate"""
+  def __init__(self, rate):
+    self.rate = rate
+
+  def arrival_times(self, duration):
+    t = random.expovariate(self.rate)
+    while t < duration:
+      yield t
+      t += random.expovariate(self.rate)
+
+
+class BurstyArrivals(object):
+  """
+  Poisson arrivals whose rate switches between a quiet rate and a burst rate.
+
+  Quiet spells last burst_interval seconds on average and bursts last burst_duration, both exponentially distributed
+  (a two-state Markov-modulated Poisson process).
+  """
+  def __init__(self, rate, burst_rate, burst_duration, burst_interval):
+    self.rate = rate
+    self.burst_rate = burst_rate
+    self.burst_duration = burst_duration
+    self.burst_interval = burst_interval
+
+  def arrival_times(self, duration):
+    t = 0.
+    bursting = False
+    while t < duration:
+      phase_end = min(duration, t + random.expovariate(1. / (self.burst_duration if bursting else self.burst_interval)))
+      rate = self.burst_rate if bursting else self.rate
+      # Arrivals are memoryless, so each phase can start its own Poisson process
+      t += random.expovariate(rate) if rate > 0 else math.inf
+      while t < phase_end:
+        yield t
+        t += random.expovariate(rate)
+      t = phase_end
+      bursting = not bursting
+
+
+class TraceArrivals(object):
+  """Replays arrival times from a file with one per line (seconds, first column), optionally sped up"""
+  def __init__(self, path, speedup=1.):
+    with open(path) as fid:
+      times = sorted([float(line.split(",")[0]) for line in fid if line.strip() != "" and not line.startswith("#")])
+    start = times[0] if len(times) > 0 else 0.
+    self.times = [(t - start) / speedup for t in times]
+
+  def arrival_times(self, duration):
+    for t in self.times:
+      if t >= duration:
+        return
+      yield t
+
+
+def get_arrivals(args):
+  if args.arrivals == "poisson":
+    return PoissonArrivals(args.rate)
+  if args.arrivals == "bursty":
+    return BurstyArrivals(args.rate, args.burst_rate, args.burst_duration, args.burst_interval)
+  return TraceArrivals(args.trace, args.trace_speedup)
+
+
+######################
+# Request Mix        #
+######################
+SentRequest = collections.namedtuple("SentRequest", ["group", "rpc", "request", "met_slo"])
+
+
+class RequestMix(object):
+  """
+  Draws each request's RPC and SLO.
+
+  Infer1 requests name one of the models. Infer2 requests carry a latency SLO latency_share of the time and an
+  accuracy SLO otherwise; Infer3 requests carry both. SLO values are drawn uniformly from the given lists, and
+  requests are grouped by RPC and SLO for reporting.
+  """
+  def __init__(self, weights, models, accuracy_slos, latency_slos, latency_share, data):
+    self.rpcs = list(weights.keys())
+    self.weights = [weights[rpc] for rpc in self.rpcs]
+    self.models = models
+    self.accuracy_slos = accuracy_slos
+    self.latency_slos = latency_slos
+    self.latency_share = latency_share
+    self.data = data
+
+  def next_request(self):
+    rpc = random.choices(self.rpcs, weights=self.weights)[0]
+    return getattr(self, f"new_{rpc}")()
+
+  def new_infer1(self):
+    model_name = random.choice(self.models)
+    request = inference_service_pb2.Message1V2(
+      application=inference_service_pb2.Application.IMAGE, model_name=model_name, data=self.data)
+    return SentRequest(f"infer1 {model_name}", "Infer1V2", request, None)
+
+  def new_infer2(self):
+    if random.random() < self.latency_share:
+      slo_value = random.choice(self.latency_slos)
+      request = inference_service_pb2.Message2V2(
+        application=inference_service_pb2.Application.IMAGE, slo_type=inference_service_pb2.SLOType.LATENCY,
+        slo_value=slo_value, data=self.data)
+      return SentRequest(f"infer2 latency<={slo_value}", "Infer2V2", request,
+                         (lambda latency, response: latency <= slo_value))
+    slo_value = random.choice(self.accuracy_slos)
+    request = inference_service_pb2.Message2V2(
+      application=inference_service_pb2.Application.IMAGE, slo_type=inference_service_pb2.SLOType.ACCURACY,
+      slo_value=slo_value, data=self.data)
+    return SentRequest(f"infer2 accuracy>={slo_value}", "Infer2V2", request,
+                       (lambda latency, response: response.endpoint.accuracy >= slo_value))
+
+  def new_infer3(self):
+    accuracy_slo = random.choice(self.accuracy_slos)
+    latency_slo = random.choice(self.latency_slos)
+    request = inference_service_pb2.Message3(
+      application=inference_service_pb2.Application.IMAGE, accuracy_slo=accuracy_slo, latency_slo=latency_slo)
+    # Infer3 only looks variants up, so it meets its SLO if it found one that should
+    return SentRequest(f"infer3 accuracy>={accuracy_slo} latency<={latency_slo}", "Infer3", request,
+                       (lambda latency, response: len(response.endpoints) > 0))
+
+
+def parse_mix(mix):
+  """"infer1=0.2,infer2=0.8" -> { "infer1" : 0.2, "infer2" : 0.8 }"""
+  weights = {}
+  for part in mix.split(","):
+    rpc, weight = part.split("=")
+    if rpc not in ("infer1", "infer2", "infer3"):
+      raise ValueError(f"Unknown RPC in mix: {rpc}")
+    weights[rpc] = float(weight)
+  return weights
+
+
+######################
+# Results            #
+######################
+class GroupResults(object):
+  """Latency histogram and SLO attainment for one group of requests"""
+  def __init__(self):
+    self.sketch = stats.LatencySketch()
+    self.max_latency = 0.
+    self.num_met = 0
+    self.num_with_slo = 0
+    self.errors = collections.Counter()
+
+  def record(self, latency, met_slo=None, error=None):
+    """met_slo is None for requests without an SLO; failed requests with one count as missing it"""
+    if error is not None:
+      self.errors[error] += 1
+    else:
+      self.sketch.add(latency)
+      self.max_latency = max(self.max_latency, latency)
+    if met_slo is not None:
+      self.num_with_slo += 1
+      self.num_met += 1 if met_slo else 0
+
+  @property
+  def count(self):
+    return self.sketch.count + sum(self.errors.values())
+
+  def summary(self):
+    return {
+      "count" : self.count,
+      "errors" : dict(self.errors),
+      "latency" : {
+        **{ f"p{q:g}" : min(self.sketch.quantile(q / 100.), self.max_latency) for q in [50, 90, 99, 99.9] },
+        "max" : self.max_latency,
+      },
+      "slo_attainment" : (self.num_met / self.num_with_slo) if self.num_with_slo > 0 else None,
+    }
+
+  def to_hgrm(self):
+    """Percentile distribution in HdrHistogram's .hgrm text format, values in milliseconds"""
+    lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+    total = self.sketch.count
+    if total == 0:
+      return "\n".join(lines) + "\n"
+    distribution = self.sketch.distribution()
+    cumulative = 0
+    index = 0
+    # Report at percentiles that get closer to 100% by halving the gap, like HdrHistogram's percentile iterator
+    for tick in itertools.count():
+      half = tick // HGRM_PERCENTILE_TICKS_PER_HALF
+      step = tick % HGRM_PERCENTILE_TICKS_PER_HALF
+      percentile = 1. - 0.5 ** half * (1. - step / HGRM_PERCENTILE_TICKS_PER_HALF * 0.5)
+      previous = cumulative
+      while index < len(distribution) and (cumulative == 0 or cumulative < percentile * total):
+        cumulative += distribution[index][1]
+        index += 1
+      if cumulative == previous and tick > 0:
+        continue  # One bucket can span several percentiles, but it only needs a row once
+      # Bucket midpoints can overshoot the largest value seen
+      value = min(distribution[index - 1][0], self.max_latency)
+      if cumulative >= total:
+        lines.append(f"{value * 1000:12.3f} {1.:14.12f} {total:10d}")
+        break
+      fraction = cumulative / total
+      lines.append(f"{value * 1000:12.3f} {fraction:14.12f} {cumulative:10d} {1. / (1. - fraction):14.2f}")
+    lines.append(f"#[Max     = {self.max_latency * 1000:12.3f}, Total count    = {total:12d}]")
+    return "\n".join(lines) + "\n"
+
+
+class LoadResults(object):
+  def __init__(self):
+    self.groups = collections.defaultdict(GroupResults)
+    self.num_sent = 0
+    self.num_dropped = 0  # Arrivals not sent because max_outstanding requests were already waiting
+    self.max_outstanding = 0
+    self.duration = 0.
+
+  def record(self, sent_request, latency, response=None, error=None):
+    """Files a finished request under its group; failed requests that had an SLO count as missing it"""
+    if error is not None:
+      met_slo = False if sent_request.met_slo is not None else None
+    else:
+      met_slo = sent_request.met_slo(latency, response) if sent_request.met_slo is not None else None
+    self.groups[sent_request.group].record(latency, met_slo=met_slo, error=error)
+
+  def summary(self):
+    num_answered = sum([group.sketch.count for group in self.groups.values()])
+    return {
+      "sent" : self.num_sent,
+      "dropped" : self.num_dropped,
+      "max_outstanding" : self.max_outstanding,
+      "duration" : self.duration,
+      "throughput" : (num_answered / self.duration) if self.duration > 0 else None,
+      "groups" : { name : self.groups[name].summary() for name in sorted(self.groups) },
+    }
+
+
+######################
+# Load Generation    #
+######################
+async def run_load(targets, arrivals, mix, duration, max_outstanding, num_channels, timeout=None, results=None):
+  """
+  Sends the mix at the arrival process's times for duration seconds, then waits for what is still outstanding.
+
+  mix is anything with next_request() returning a SentRequest, and results a LoadResults (new if not given).
+  """
+  if results is None:
+    results = LoadResults()
+  channels = [grpc.aio.insecure_channel(target) for target, _ in zip(itertools.cycle(targets), range(num_channels))]
+  stubs = itertools.cycle([inference_service_pb2_grpc.InferenceStub(channel) for channel in channels])
+  outstanding = set()
+
+  async def _send(stub, sent_request, scheduled):
+    # Latency is from when the request was due to be sent, so time spent behind schedule in the generator counts
+    # too (otherwise a backed-up generator hides exactly the tail it is meant to measure)
+    try:
+      response = await getattr(stub, sent_request.rpc)(sent_request.request, timeout=timeout)
+    except grpc.aio.AioRpcError as e:
+      results.record(sent_request, time.perf_counter() - scheduled, error=e.code().name)
+      return
+    results.record(sent_request, time.perf_counter() - scheduled, response=response)
+
+  try:
+    ts = time.perf_counter()
+    for arrival_time in arrivals.arrival_times(duration):
+      # Yields to the outstanding requests even when behind schedule
+      await asyncio.sleep(max(0., arrival_time - (time.perf_counter() - ts)))
+      if len(outstanding) >= max_outstanding:
+        results.num_dropped += 1
+        continue
+      task = asyncio.create_task(_send(next(stubs), mix.next_request(), ts + arrival_time))
+      outstanding.add(task)
+      task.add_done_callback(outstanding.discard)
+      results.num_sent += 1
+      results.max_outstanding = max(results.max_outstanding, len(outstanding))
+    if len(outstanding) > 0:
+      await asyncio.gather(*list(outstanding))
+    results.duration = time.perf_counter() - ts
+  finally:
+    for channel in channels:
+      await channel.close()
+  return results
+
+
+def print_summary(summary):
+  throughput = f"{summary['throughput']:0.1f}" if summary["throughput"] is not None else "-"
+  print(f"Sent {summary['sent']} ({summary['dropped']} dropped, at most {summary['max_outstanding']} outstanding) "
+        f"over {summary['duration']:0.1f}s: {throughput} answered/s")
+  print(f"{'group':<40} {'count':>7} {'errors':>6} "
+        + " ".join([f"{key:>8}" for key in ["p50", "p90", "p99", "p99.9", "max", "SLO met"]]))
+  for name, group in summary["groups"].items():
+    latency = group["latency"]
+    attainment = f"{group['slo_attainment'] * 100:0.1f}%" if group["slo_attainment"] is not None else "-"
+    print(
+      f"{name:<40} {group['count']:>7} {sum(group['errors'].values()):>6} "
+      + " ".join([f"{latency[key] * 1000:>6.1f}ms" for key in ["p50", "p90", "p99", "p99.9", "max"]])
+      + f" {attainment:>8}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Open-loop load generator for the LayerCake inference server")
+  parser.add_argument("--target", nargs="+", default=[f"localhost:{common.GRPC_PORT}"],
+                      help="host:port of the server(s); channels are spread across them")
+  parser.add_argument("--duration", type=float, default=60., help="Seconds to send requests for")
+  parser.add_argument("--arrivals", choices=["poisson", "bursty", "trace"], default="poisson")
+  parser.add_argument("--rate", type=float, default=10., help="Requests per second (between bursts, if bursty)")
+  parser.add_argument("--burst_rate", type=float, default=100., help="Requests per second during a burst")
+  parser.add_argument("--burst_duration", type=float, default=2., help="Average length of a burst in seconds")
+  parser.add_argument("--burst_interval", type=float, default=10., help="Average time between bursts in seconds")
+  parser.add_argument("--trace", default=None, help="File of arrival times in seconds, one per line")
+  parser.add_argument("--trace_speedup", type=float, default=1., help="Replay the trace this many times faster")
+  parser.add_argument("--mix", default="infer2=1", help="Weights of each RPC, e.g. infer1=0.2,infer2=0.7,infer3=0.1")
+  parser.add_argument("--models", default="efficientnetb0", help="Comma-separated models Infer1 requests ask for")
+  parser.add_argument("--accuracy_slos", default="0.75,0.8", help="Accuracy SLOs to draw from")
+  parser.add_argument("--latency_slos", default="0.2,0.5,1.0", help="Latency SLOs in seconds to draw from")
+  parser.add_argument("--latency_share", type=float, default=0.5,
+                      help="Fraction of Infer2 requests with a latency rather than an accuracy SLO")
+  parser.add_argument("--image", default="mug.jpg")
+  parser.add_argument("--max_outstanding", type=int, default=10000,
+                      help="Arrivals beyond this many unanswered requests are dropped (and counted)")
+  parser.add_argument("--num_channels", type=int, default=8,
+                      help="gRPC channels to spread requests over, since each has a limit on concurrent streams")
+  parser.add_argument("--timeout", type=float, default=None, help="Per-request deadline in seconds")
+  parser.add_argument("--output", default=None, help="Write the summary as JSON to this file")
+  parser.add_argument("--hgrm_dir", default=None, help="Write each group's latency distribution as .hgrm here")
+  parser.add_argument("--seed", type=int, default=common.RNG_SEED)
+  args = parser.parse_args()
+  if args.arrivals == "trace" and args.trace is None:
+    parser.error("--arrivals trace needs --trace")
+
+  random.seed(args.seed)
+  with open(args.image, "rb") as fid:
+    data = fid.read()
+  mix = RequestMix(
+    parse_mix(args.mix), args.models.split(","), [float(s) for s in args.accuracy_slos.split(",")],
+    [float(s) for s in args.latency_slos.split(",")], args.latency_share, data)
+
+  results = asyncio.run(run_load(
+    args.target, get_arrivals(args), mix, args.duration, args.max_outstanding, args.num_channels, args.timeout))
+  summary = results.summary()
+  print_summary(summary)
+
+  if args.output is not None:
+    with open(args.output, "w") as fid:
+      json.dump(summary, fid, indent=2, sort_keys=True)
+  if args.hgrm_dir is not None:
+    os.makedirs(args.hgrm_dir, exist_ok=True)
+    for name, group in results.groups.items():
+      file_name = name.replace(" ", "_").replace("<=", "_le_").replace(">=", "_ge_") + ".hgrm"
+      with open(os.path.join(args.hgrm_dir, file_name), "w") as fid:
+        fid.write(group.to_hgrm())
+
+
+if __name__ == "__main__":
+  main()
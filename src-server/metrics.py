@@ -0,0 +1,211 @@
+#!env python
+
+## Built-in imports
+import bisect
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.metrics")
+log.setLevel(logging.INFO)
+
+
+def format_labels(label_names, label_values, **extra):
+  pairs = list(zip(label_names, label_values)) + list(extra.items())
+  if len(pairs) == 0:
+    return ""
+  return "{" + ",".join([f'{name}="{value}"' for name, value in pairs]) + "}"
+
+
+def format_value(value):
+  if value == math.inf:
+    return "+Inf"
+  return repr(float(value))
+
+
+class Metric(object):
+  """A named family of values, one per combination of label values"""
+  kind = None
+
+  def __init__(self, name, description, labels=()):
+    self.name = name
+    self.description = description
+    self.labels = tuple(labels)
+    self.lock = threading.Lock()
+
+  def key(self, labels):
+    if len(labels) != len(self.labels) or any(label not in labels for label in self.labels):
+      raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+    return tuple([str(labels[label]) for label in self.labels])
+
+  def samples(self):
+    """(suffix, label values, extra labels, value) for every sample the metric currently has"""
+    raise NotImplementedError
+
+  def expose(self):
+    lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+    for suffix, label_values, extra, value in self.samples():
+      lines.append(f"{self.name}{suffix}{format_labels(self.labels, label_values, **extra)} {format_value(value)}")
+    return "\n".join(lines)
+
+
+class Counter(Metric):
+  kind = "counter"
+
+  def __init__(self, name, description, labels=()):
+    super().__init__(name, description, labels)
+    self.values = {}
+
+  def inc(self, amount=1, **labels):
+    key = self.key(labels)
+    with self.lock:
+      self.values[key] = self.values.get(key, 0) + amount
+
+  def get(self, **labels):
+    with self.lock:
+      return self.values.get(self.key(labels), 0)
+
+  def samples(self):
+    with self.lock:
+      return [("_total", key, {}, value) for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+  """A value that is read when metrics are exposed, through a function returning { label values : value }"""
+  kind = "gauge"
+
+  def __init__(self, name, description, labels=(), function=None):
+    super().__init__(name, description, labels)
+    self.function = function
+
+  def set_function(self, function):
+    self.function = function
+
+  def samples(self):
+    if self.function is None:
+      return []
+    return [("", tuple(map(str, key)), {}, value) for key, value in sorted(self.function().items())]
+
+
+class Histogram(Metric):
+  """
+  Counts of observations falling into fixed buckets, plus their sum.
+
+  Buckets are upper bounds, so observing a value is a binary search and an increment. Counts are stored per bucket
+  and only made cumulative when exposed.
+  """
+  kind = "histogram"
+
+  def __init__(self, name, description, labels=(), buckets=common.METRICS_LATENCY_BUCKETS):
+    super().__init__(name, description, labels)
+    self.buckets = tuple(sorted(buckets))
+    self.counts = {}  # label values -> per-bucket counts, with one extra for observations above every bucket
+    self.sums = {}
+
+  def observe(self, value, **labels):
+    key = self.key(labels)
+    index = bisect.bisect_left(self.buckets, value)
+    with self.lock:
+      if key not in self.counts:
+        self.counts[key] = [0] * (len(self.buckets) + 1)
+        self.sums[key] = 0.
+      self.counts[key][index] += 1
+      self.sums[key] += value
+
+  def time(self, **labels):
+    """Observes the time taken, as a context manager or as a decorator on a function or coroutine"""
+    return Timer(self, labels)
+
+  def get_count(self, **labels):
+    with self.lock:
+      return sum(self.counts.get(self.key(labels), []))
+
+  def samples(self):
+    samples = []
+    with self.lock:
+      for key in sorted(self.counts):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts[key]):
+          cumulative += count
+          samples.append(("_bucket", key, { "le" : format_value(bound) }, cumulative))
+        samples.append(("_sum", key, {}, self.sums[key]))
+        samples.append(("_count", key, {}, cumulative))
+    return samples
+
+
+class Timer(object):
+  def __init__(self, histogram, labels):
+    self.histogram = histogram
+    self.labels = labels
+    self.start = None
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+  def __call__(self, fn):
+    if inspect.iscoroutinefunction(fn):
+      @functools.wraps(fn)
+      async def _async_impl(*args, **kwargs):
+        with Timer(self.histogram, self.labels):
+          return await fn(*args, **kwargs)
+      return _async_impl
+
+    @functools.wraps(fn)
+    def _impl(*args, **kwargs):
+      with Timer(self.histogram, self.labels):
+        return fn(*args, **kwargs)
+    return _impl
+
+
+class MetricsRegistry(object):
+  """Metrics by name; asking for one that already exists returns it, so modules can share them without coordinating"""
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.metrics = {}
+
+  def _get_or_create(self, cls, name, *args, **kwargs):
+    with self.lock:
+      if name not in self.metrics:
+        self.metrics[name] = cls(name, *args, **kwargs)
+      metric = self.metrics[name]
+    if not isinstance(metric, cls):
+      raise ValueError(f"{name} is already registered as a {metric.kind}")
+    return metric
+
+  def counter(self, name, description, labels=()):
+    return self._get_or_create(Counter, name, description, labels)
+
+  def gauge(self, name, description, labels=(), function=None):
+    gauge = self._get_or_create(Gauge, name, description, labels)
+    if function is not None:
+      gauge.set_function(function)
+    return gauge
+
+  def histogram(self, name, description, labels=(), buckets=common.METRICS_LATENCY_BUCKETS):
+    return self._get_or_create(Histogram, name, description, labels, buckets)
+
+  def expose(self):
+    """Every metric in the Prometheus text exposition format"""
+    with self.lock:
+      metrics = [self.metrics[name] for name in sorted(self.metrics)]
+    return "\n".join([metric.expose() for metric in metrics]) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+  "layercake_stage_seconds", "Time spent in each step of serving a request", labels=("stage",))
@@ -1,5 +1,7 @@
 #!env python
 import functools
+import math
+import random
 import logging
 logging.basicConfig()
 log = logging.getLogger("layercake")
@@ -8,8 +10,11 @@ log.setLevel(logging.DEBUG)
 
 import abc
 
+import catalog
+import common
 import serving_model
 import exceptions
+import tracing
 
 class ModelPicker(abc.ABC):
   def __init__(self, available_models):
@@ -40,55 +45,129 @@ class INFaaSModelPicker(ModelPicker):
         return response
       return _impl
 
-  def __init__(self, available_models: list[serving_model.SageMakerModel]):
+  def __init__(self, available_models: list[serving_model.SageMakerModel], load_estimator=None,
+               power_of_two_choices=False):
     super().__init__(available_models)
     self.active_models = set(available_models)
-
-
-
-
-  @classmethod
-  def find_least_loaded_variant(cls, potential_variants):
-    return potential_variants[0]
+    self.catalog = catalog.ModelCatalog(available_models)
+    self.load_estimator = load_estimator  # Anything with estimate_queue_delay(model), e.g. the scheduler
+    self.power_of_two_choices = power_of_two_choices
+
+  def expected_completion_time(self, model, percentile=None):
+    latency = catalog.latency_at(model, catalog.percentile_key(percentile))
+    if self.load_estimator is None:
+      return latency
+    return self.load_estimator.estimate_queue_delay(model) + latency
+
+  def find_least_loaded_variant(self, potential_variants, percentile=None):
+    """Variant expected to finish a request arriving now soonest, comparing just two at random if asked to"""
+    if self.power_of_two_choices and len(potential_variants) > 2:
+      potential_variants = random.sample(potential_variants, 2)
+    return min(potential_variants, key=(lambda m: self.expected_completion_time(m, percentile)))
 
   @Decorators.mark_model_active
+  @tracing.traced("pick_model")
   def pick_model(self, *args, **kwargs) -> serving_model.SageMakerModel:
-    log.info(f"pick_model: {kwargs}")
-    for m_name in sorted(self.models.keys()):
-      log.info(f"{m_name} : {self.models[m_name]._exec_latency} ({self.models[m_name].latency})")
+    log.debug(f"pick_model: {kwargs}")
 
-    min_accuracy = 0.5 if "min_accuracy" not in kwargs else kwargs["min_accuracy"]
-    max_latency = 100 if "max_latency" not in kwargs else kwargs["max_latency"]
+    accuracy_floor = kwargs.setdefault("accuracy_floor", common.DEFAULT_ACCURACY_FLOOR)
+    min_accuracy = kwargs.get("min_accuracy", accuracy_floor)
+    application = kwargs.pop("application", None)
 
     if "model_name" in kwargs:
       return self.models[kwargs["model_name"]]
-    elif "min_accuracy" in kwargs:
-      potential_variants = sorted(list(filter(
-        (lambda m: (m.accuracy >= min_accuracy)),
-        self.active_models
-      )), key=(lambda m: m.latency), reverse=False)
-    elif "max_latency" in kwargs:
-      for m in self.active_models:
-        log.info(f"{m} : {m.latency}")
-      potential_variants = sorted(list(filter(
-        (lambda m: (m.latency <= max_latency)),
-        self.active_models
-      )), key=(lambda m: m.accuracy), reverse=True)
-    else:
-      potential_variants = []
-    log.info(f"potential_variants: {[str(m) for m in potential_variants]}")
-
-    if len(potential_variants) > 0:
-      return self.find_least_loaded_variant(potential_variants)
-
-    # Next, search for any variant that satisfies with the lowest latency
-    potential_variants = list(filter(
-      (lambda m: (m.accuracy >= min_accuracy)),
-      self.models.values()
-    ))
-    if len(potential_variants) == 0:
+
+    model = self.find_variant(application=application, **kwargs)
+    if model is not None:
+      return model
+
+    # Next, settle for the fastest variant that still meets the accuracy the request asked for
+    model = self.catalog.fastest(min_accuracy, application=application)
+    if model is None:
       raise exceptions.NoModelFound("No model found that can satisfy requirements")
-    return min(potential_variants, key=(lambda m: m.latency))
+    return model
+
+  def pick_hedge_model(self, primary, *args, **kwargs):
+    """Next-best variant to hedge a request against, as long as it meets the request's accuracy floor"""
+    kwargs.setdefault("accuracy_floor", common.DEFAULT_ACCURACY_FLOOR)
+    return self.find_variant(application=primary.application, exclude=primary, **kwargs)
+
+  def find_variant(self, application=None, exclude=None, accuracy_floor=0., *args, **kwargs):
+    """Best variant meeting the SLO, preferring variants that have finished profiling"""
+    for settled_only in [True, False]:
+      if kwargs.get("minimize_cost", False):
+        model = self.find_cheapest_variant(
+          kwargs.get("max_latency", math.inf), kwargs.get("min_accuracy", accuracy_floor), application, exclude,
+          settled_only, percentile=kwargs.get("latency_percentile"))
+      elif "min_accuracy" in kwargs:
+        model = self.find_fastest_variant(kwargs["min_accuracy"], application, exclude, settled_only)
+      elif "max_latency" in kwargs:
+        model = self.find_accurate_variant(
+          kwargs["max_latency"], accuracy_floor, application, exclude, settled_only,
+          percentile=kwargs.get("latency_percentile"))
+      else:
+        return None
+      if model is not None:
+        return model
+    return None
+
+  def find_fastest_variant(self, min_accuracy, application, exclude, settled_only):
+    """Variant meeting the accuracy SLO that should finish soonest once queueing is accounted for"""
+    fastest = self.catalog.fastest(min_accuracy, application=application, exclude=exclude, settled_only=settled_only)
+    if fastest is None:
+      return None
+    completion_time = self.expected_completion_time(fastest)
+    if completion_time <= fastest.latency:
+      return fastest  # Nothing is queued on it, so nothing else can beat it
+    # Only variants whose latency alone is below the fastest one's completion time can finish sooner
+    return self.find_least_loaded_variant(self.catalog.at_most(
+      completion_time, min_accuracy, application=application, exclude=exclude, settled_only=settled_only))
+
+  def find_accurate_variant(self, max_latency, min_accuracy, application, exclude, settled_only, percentile=None):
+    """
+    Most accurate variant expected to meet the latency SLO once queueing is accounted for.
+
+    With a percentile, the SLO bounds that percentile of the variant's latency rather than its mean. The Pareto
+    frontier gives the answer outright unless queueing pushes its pick past the SLO, and only then are the variants
+    under the SLO walked from the most accurate down.
+    """
+    best = self.catalog.most_accurate(
+      max_latency, min_accuracy, application=application, exclude=exclude, settled_only=settled_only,
+      percentile=percentile)
+    if best is None:
+      return None
+    if self.expected_completion_time(best, percentile) <= max_latency:
+      return best
+    potential_variants = []
+    for model in self.catalog.iter_most_accurate(
+        max_latency, min_accuracy, application=application, exclude=exclude, settled_only=settled_only,
+        percentile=percentile):
+      if self.expected_completion_time(model, percentile) <= max_latency:
+        return model
+      potential_variants.append(model)
+    if len(potential_variants) == 0:
+      return None
+    # Every variant is too backed up to make the SLO, so go with whichever should come closest
+    return self.find_least_loaded_variant(potential_variants, percentile)
+
+  def find_cheapest_variant(self, max_latency, min_accuracy, application, exclude, settled_only, percentile=None):
+    """
+    Cheapest variant meeting both the accuracy and latency SLOs once queueing is accounted for.
+
+    Cost is not ordered along the accuracy/latency frontier (a dominated variant can be the cheapest), so this one
+    has to look at every variant under the SLO.
+    """
+    potential_variants = [
+      model
+      for model in self.catalog.at_most(
+        max_latency, min_accuracy, application=application, exclude=exclude, settled_only=settled_only,
+        percentile=percentile)
+      if self.expected_completion_time(model, percentile) <= max_latency
+    ]
+    if len(potential_variants) == 0:
+      return None
+    # Between equally cheap variants, take the more accurate one
+    return min(potential_variants, key=(lambda m: (m.expected_cost, -m.accuracy)))
 
   def get_models(self):
     return self.models.values()
@@ -0,0 +1,124 @@
+#!env python
+
+## Built-in imports
+import collections
+import enum
+import io
+import logging
+import threading
+import time
+
+## pip'd imports
+from PIL import Image
+
+## my imports
+import common
+import metrics
+
+logging.basicConfig()
+log = logging.getLogger("layercake.preprocessing")
+log.setLevel(logging.INFO)
+
+
+class PreprocessPath(enum.Enum):
+  PASSTHROUGH = 1,  # Input is already a JPEG of the endpoint's dimensions, so it is sent untouched
+  DRAFT = 2,        # JPEG decoded at reduced resolution through DCT scaling, then resized and re-encoded
+  FULL = 3          # Full decode, resize and re-encode
+
+
+class ImagePreprocessor(object):
+  """
+  Turns request images into the JPEG bytes an image endpoint expects, taking the cheapest path the input allows.
+
+  CPU time is tracked per path. Savings are estimated against the full path's cost per source pixel, taken from
+  full-path requests and from calibrate(), which the server runs once at startup so that no request pays for it.
+  Until either has been seen, savings are reported as 0.
+  """
+  def __init__(self, draft_ratio=common.JPEG_DRAFT_RATIO):
+    self.draft_ratio = draft_ratio
+
+    self.lock = threading.Lock()
+    self.counts = collections.defaultdict(int)
+    self.cpu_time = collections.defaultdict(float)
+    self.pixels = collections.defaultdict(int)
+    self.full_cpu_time = 0.
+    self.full_pixels = 0
+
+  def prepare(self, data, dimensions):
+    ts = time.thread_time()
+    img = Image.open(io.BytesIO(data))  # Only reads the header
+    source_size = img.size
+    dimensions = tuple(dimensions)
+    if img.format == "JPEG" and img.size == dimensions:
+      path = PreprocessPath.PASSTHROUGH
+      encoded = bytes(data)
+    elif (img.format == "JPEG"
+          and img.size[0] >= self.draft_ratio * dimensions[0]
+          and img.size[1] >= self.draft_ratio * dimensions[1]):
+      path = PreprocessPath.DRAFT
+      img.draft("RGB", dimensions)
+      encoded = self._resize_and_encode(img, dimensions)
+    else:
+      path = PreprocessPath.FULL
+      encoded = self._resize_and_encode(img, dimensions)
+    cpu_time = time.thread_time() - ts
+
+    self.record(path, cpu_time, source_size[0] * source_size[1])
+    return encoded
+
+  @staticmethod
+  def _resize_and_encode(img, dimensions, record_stages=True):
+    ts = time.perf_counter()
+    img.load()
+    td = time.perf_counter()
+    resized = img.resize(dimensions)
+    tr = time.perf_counter()
+    img_byte_arr = io.BytesIO()
+    resized.save(img_byte_arr, format="JPEG")
+    te = time.perf_counter()
+    if record_stages:
+      metrics.STAGE_LATENCY.observe(td - ts, stage="pil_decode")
+      metrics.STAGE_LATENCY.observe(tr - td, stage="resize")
+      metrics.STAGE_LATENCY.observe(te - tr, stage="jpeg_encode")
+    return img_byte_arr.getvalue()
+
+  def calibrate(self, data, dimensions):
+    """Runs the full path once so that fast-path savings have something to be measured against"""
+    ts = time.thread_time()
+    img = Image.open(io.BytesIO(data))
+    self._resize_and_encode(img, dimensions, record_stages=False)
+    with self.lock:
+      self.full_cpu_time += time.thread_time() - ts
+      self.full_pixels += img.size[0] * img.size[1]
+
+  def record(self, path, cpu_time, num_pixels):
+    with self.lock:
+      self.counts[path] += 1
+      self.cpu_time[path] += cpu_time
+      self.pixels[path] += num_pixels
+      if path == PreprocessPath.FULL:
+        self.full_cpu_time += cpu_time
+        self.full_pixels += num_pixels
+
+  def cpu_saved(self, path):
+    """Full-path CPU time the path's inputs would have cost, less what they did cost; caller must hold the lock"""
+    if path == PreprocessPath.FULL or self.full_pixels == 0:
+      return 0.
+    return max(0., (self.full_cpu_time / self.full_pixels) * self.pixels[path] - self.cpu_time[path])
+
+  def get_stats(self):
+    with self.lock:
+      return {
+        path.name.lower() : {
+          "count" : self.counts[path],
+          "cpu_time" : self.cpu_time[path],
+          "cpu_saved" : self.cpu_saved(path),
+        }
+        for path in PreprocessPath
+      }
+
+  def __str__(self):
+    return ", ".join([
+      f"{name}: {stats['count']} ({stats['cpu_time']:0.3f}s cpu, {stats['cpu_saved']:0.3f}s saved)"
+      for name, stats in self.get_stats().items()
+    ])
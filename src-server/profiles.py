@@ -0,0 +1,98 @@
+#!env python
+
+## Built-in imports
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.profiles")
+log.setLevel(logging.INFO)
+
+
+class ProfileStore(object):
+  """
+  Endpoint latency profiles kept in SQLite across restarts, keyed by endpoint name.
+
+  The database is in WAL mode so that saving profiles never blocks a reader, such as another server booting from
+  the same file. A profile is fresh if it is younger than max_age and has enough warm measurements to be trusted;
+  only endpoints without a fresh profile need to be profiled again at startup. A redeployed model gets a new
+  endpoint name, so it never inherits the old deployment's profile.
+  """
+  def __init__(self, path=common.PROFILE_STORE_FILE, max_age=common.PROFILE_MAX_AGE_IN_SECONDS):
+    self.path = path
+    self.max_age = max_age
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    with self.lock, self.connection:
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute("PRAGMA synchronous=NORMAL")
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS profiles ("
+        "  endpoint_name TEXT PRIMARY KEY,"
+        "  model_name TEXT NOT NULL,"
+        "  updated REAL NOT NULL,"
+        "  profile TEXT NOT NULL"
+        ")"
+      )
+
+  def save(self, endpoints):
+    """Writes the current profile of every endpoint in one transaction"""
+    now = time.time()
+    rows = [
+      (endpoint.endpoint.endpoint_name, endpoint.name, now, json.dumps(endpoint.get_profile()))
+      for endpoint in endpoints
+    ]
+    with self.lock, self.connection:
+      self.connection.executemany(
+        "INSERT INTO profiles (endpoint_name, model_name, updated, profile) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(endpoint_name) DO UPDATE SET "
+        "  model_name=excluded.model_name, updated=excluded.updated, profile=excluded.profile",
+        rows
+      )
+    log.info(f"Saved {len(rows)} profiles to {self.path}")
+
+  def get(self, endpoint_name):
+    """(when it was saved, profile) for an endpoint, or None if it has never been profiled"""
+    with self.lock:
+      row = self.connection.execute(
+        "SELECT updated, profile FROM profiles WHERE endpoint_name = ?", (endpoint_name,)).fetchone()
+    if row is None:
+      return None
+    return row[0], json.loads(row[1])
+
+  def is_fresh(self, updated, profile, now=None):
+    if now is None:
+      now = time.time()
+    num_warm = profile["measurements"].get("INFER", {}).get("total_count", 0)
+    return now - updated <= self.max_age and num_warm >= common.MIN_PROFILING_SAMPLES
+
+  def load(self, endpoints):
+    """Restores fresh profiles into endpoints (a dict of name to endpoint), returning the names still to profile"""
+    stale = []
+    now = time.time()
+    for name, endpoint in endpoints.items():
+      # A profile that can't be read, whether the row or the whole file is damaged or locked, is just a cache miss
+      try:
+        saved = self.get(endpoint.endpoint.endpoint_name)
+        if saved is None or not self.is_fresh(*saved, now=now):
+          stale.append(name)
+          continue
+        endpoint.load_profile(saved[1])
+      except (KeyError, ValueError, sqlite3.Error) as e:
+        log.warning(f"Could not restore the profile of {name}: {e}")
+        stale.append(name)
+    log.info(f"Restored {len(endpoints) - len(stale)} of {len(endpoints)} profiles from {self.path}")
+    return stale
+
+  def close(self):
+    with self.lock:
+      self.connection.close()
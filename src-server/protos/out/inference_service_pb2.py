@@ -2,10 +2,9 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: inference_service.proto
 """Generated protocol buffer code."""
-from google.protobuf.internal import enum_type_wrapper
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
 # @@protoc_insertion_point(imports)
 
@@ -14,175 +13,59 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='inference_service.proto',
-  package='inference_service',
-  syntax='proto2',
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\x17inference_service.proto\x12\x11inference_service\"q\n\x10InferenceRequest\x12\x12\n\nmodel_name\x18\x01 \x03(\t\x12,\n\x04type\x18\x02 \x02(\x0e\x32\x1e.inference_service.RequestType\x12\x0c\n\x04\x64\x61ta\x18\x03 \x03(\t\x12\r\n\x05\x66lags\x18\x04 \x01(\t\"%\n\x11InferenceResponse\x12\x10\n\x08response\x18\x01 \x03(\t*\'\n\x0bRequestType\x12\x08\n\x04INFO\x10\x00\x12\x0e\n\nSUBMISSION\x10\x01\x32\x61\n\tInference\x12T\n\x05Infer\x12#.inference_service.InferenceRequest\x1a$.inference_service.InferenceResponse\"\x00'
-)
-
-_REQUESTTYPE = _descriptor.EnumDescriptor(
-  name='RequestType',
-  full_name='inference_service.RequestType',
-  filename=None,
-  file=DESCRIPTOR,
-  create_key=_descriptor._internal_create_key,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='INFO', index=0, number=0,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='SUBMISSION', index=1, number=1,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-  ],
-  containing_type=None,
-  serialized_options=None,
-  serialized_start=200,
-  serialized_end=239,
-)
-_sym_db.RegisterEnumDescriptor(_REQUESTTYPE)
-
-RequestType = enum_type_wrapper.EnumTypeWrapper(_REQUESTTYPE)
-INFO = 0
-SUBMISSION = 1
-
-
-
-_INFERENCEREQUEST = _descriptor.Descriptor(
-  name='InferenceRequest',
-  full_name='inference_service.InferenceRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='model_name', full_name='inference_service.InferenceRequest.model_name', index=0,
-      number=1, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='type', full_name='inference_service.InferenceRequest.type', index=1,
-      number=2, type=14, cpp_type=8, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='data', full_name='inference_service.InferenceRequest.data', index=2,
-      number=3, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='flags', full_name='inference_service.InferenceRequest.flags', index=3,
-      number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=46,
-  serialized_end=159,
-)
-
-
-_INFERENCERESPONSE = _descriptor.Descriptor(
-  name='InferenceResponse',
-  full_name='inference_service.InferenceResponse',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='response', full_name='inference_service.InferenceResponse.response', index=0,
-      number=1, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=161,
-  serialized_end=198,
-)
-
-_INFERENCEREQUEST.fields_by_name['type'].enum_type = _REQUESTTYPE
-DESCRIPTOR.message_types_by_name['InferenceRequest'] = _INFERENCEREQUEST
-DESCRIPTOR.message_types_by_name['InferenceResponse'] = _INFERENCERESPONSE
-DESCRIPTOR.enum_types_by_name['RequestType'] = _REQUESTTYPE
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-InferenceRequest = _reflection.GeneratedProtocolMessageType('InferenceRequest', (_message.Message,), {
-  'DESCRIPTOR' : _INFERENCEREQUEST,
-  '__module__' : 'inference_service_pb2'
-  # @@protoc_insertion_point(class_scope:inference_service.InferenceRequest)
-  })
-_sym_db.RegisterMessage(InferenceRequest)
-
-InferenceResponse = _reflection.GeneratedProtocolMessageType('InferenceResponse', (_message.Message,), {
-  'DESCRIPTOR' : _INFERENCERESPONSE,
-  '__module__' : 'inference_service_pb2'
-  # @@protoc_insertion_point(class_scope:inference_service.InferenceResponse)
-  })
-_sym_db.RegisterMessage(InferenceResponse)
-
-
-
-_INFERENCE = _descriptor.ServiceDescriptor(
-  name='Inference',
-  full_name='inference_service.Inference',
-  file=DESCRIPTOR,
-  index=0,
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_start=241,
-  serialized_end=338,
-  methods=[
-  _descriptor.MethodDescriptor(
-    name='Infer',
-    full_name='inference_service.Inference.Infer',
-    index=0,
-    containing_service=None,
-    input_type=_INFERENCEREQUEST,
-    output_type=_INFERENCERESPONSE,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-])
-_sym_db.RegisterServiceDescriptor(_INFERENCE)
-
-DESCRIPTOR.services_by_name['Inference'] = _INFERENCE
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x17inference_service.proto\x12\x11inference_service\"\xab\x01\n\x10InferenceRequest\x12=\n\x04type\x18\x01 \x02(\x0e\x32/.inference_service.InferenceRequest.RequestType\x12\x12\n\nmodel_name\x18\x02 \x03(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x03(\t\x12\r\n\x05\x66lags\x18\x04 \x01(\t\"\'\n\x0bRequestType\x12\x08\n\x04INFO\x10\x00\x12\x0e\n\nSUBMISSION\x10\x01\"\xee\x02\n\x11InferenceResponse\x12\x10\n\x08response\x18\x01 \x03(\t\x12\x38\n\x08\x65ndpoint\x18\x02 \x01(\x0b\x32&.inference_service.EndpointInformation\x12\x33\n\x08metadata\x18\x03 \x02(\x0b\x32!.inference_service.ServerMetadata\x12\x12\n\nprediction\x18\x04 \x01(\t\x12\x12\n\nmodel_name\x18\x05 \x01(\t\x12\x37\n\x0c\x63old_latency\x18\x06 \x01(\x0b\x32!.inference_service.LatencySummary\x12\x37\n\x0cwarm_latency\x18\x07 \x01(\x0b\x32!.inference_service.LatencySummary\x12\x30\n\x06timing\x18\x08 \x01(\x0b\x32 .inference_service.RequestTiming\x12\x0c\n\x04\x63ost\x18\t \x01(\x01\"=\n\x0eLatencySummary\x12\x0c\n\x04mean\x18\x01 \x02(\x01\x12\x0e\n\x06stddev\x18\x02 \x02(\x01\x12\r\n\x05\x63ount\x18\x03 \x01(\x04\"o\n\rRequestTiming\x12\x17\n\x0fplacement_delay\x18\x01 \x02(\x01\x12\x13\n\x0bqueue_delay\x18\x02 \x02(\x01\x12\x17\n\x0f\x65xecution_delay\x18\x03 \x02(\x01\x12\x17\n\x0foverall_latency\x18\x04 \x02(\x01\"a\n\x08Message1\x12\x33\n\x0b\x61pplication\x18\x01 \x02(\x0e\x32\x1e.inference_service.Application\x12\x12\n\nmodel_name\x18\x02 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x02(\t\"\x91\x02\n\x08Message2\x12\x33\n\x0b\x61pplication\x18\x01 \x02(\x0e\x32\x1e.inference_service.Application\x12,\n\x08slo_type\x18\x02 \x02(\x0e\x32\x1a.inference_service.SLOType\x12\x11\n\tslo_value\x18\x03 \x02(\x01\x12\x0c\n\x04\x64\x61ta\x18\x04 \x02(\t\x12\x1a\n\x12latency_percentile\x18\x05 \x01(\x01\x12\x38\n\x0enetwork_report\x18\x06 \x01(\x0b\x32 .inference_service.NetworkReport\x12\x14\n\x0cmin_accuracy\x18\x07 \x01(\x01\x12\x15\n\rminimize_cost\x18\x08 \x01(\x08\"c\n\nMessage1V2\x12\x33\n\x0b\x61pplication\x18\x01 \x02(\x0e\x32\x1e.inference_service.Application\x12\x12\n\nmodel_name\x18\x02 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x02(\x0c\"\x93\x02\n\nMessage2V2\x12\x33\n\x0b\x61pplication\x18\x01 \x02(\x0e\x32\x1e.inference_service.Application\x12,\n\x08slo_type\x18\x02 \x02(\x0e\x32\x1a.inference_service.SLOType\x12\x11\n\tslo_value\x18\x03 \x02(\x01\x12\x0c\n\x04\x64\x61ta\x18\x04 \x02(\x0c\x12\x1a\n\x12latency_percentile\x18\x05 \x01(\x01\x12\x38\n\x0enetwork_report\x18\x06 \x01(\x0b\x32 .inference_service.NetworkReport\x12\x14\n\x0cmin_accuracy\x18\x07 \x01(\x01\x12\x15\n\rminimize_cost\x18\x08 \x01(\x08\"\x90\x01\n\rStreamRequest\x12\x12\n\nrequest_id\x18\x01 \x02(\x04\x12/\n\x06infer1\x18\x02 \x01(\x0b\x32\x1d.inference_service.Message1V2H\x00\x12/\n\x06infer2\x18\x03 \x01(\x0b\x32\x1d.inference_service.Message2V2H\x00\x42\t\n\x07request\"k\n\x0eStreamResponse\x12\x12\n\nrequest_id\x18\x01 \x02(\x04\x12\x36\n\x08response\x18\x02 \x01(\x0b\x32$.inference_service.InferenceResponse\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"\x94\x01\n\x08Message3\x12\x33\n\x0b\x61pplication\x18\x01 \x02(\x0e\x32\x1e.inference_service.Application\x12\x14\n\x0c\x61\x63\x63uracy_slo\x18\x02 \x02(\x01\x12\x13\n\x0blatency_slo\x18\x03 \x02(\x01\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\t\x12\x1a\n\x12latency_percentile\x18\x05 \x01(\x01\"{\n\tEndpoints\x12\x39\n\tendpoints\x18\x01 \x03(\x0b\x32&.inference_service.EndpointInformation\x12\x33\n\x08metadata\x18\x02 \x02(\x0b\x32!.inference_service.ServerMetadata\"b\n\x0f\x46rontierRequest\x12\x33\n\x0b\x61pplication\x18\x01 \x01(\x0e\x32\x1e.inference_service.Application\x12\x1a\n\x12latency_percentile\x18\x02 \x01(\x01\"\xb4\x01\n\x08\x46rontier\x12\x38\n\x08\x66rontier\x18\x01 \x03(\x0b\x32&.inference_service.EndpointInformation\x12\x39\n\tdominated\x18\x02 \x03(\x0b\x32&.inference_service.EndpointInformation\x12\x33\n\x08metadata\x18\x03 \x02(\x0b\x32!.inference_service.ServerMetadata\"\x0e\n\x0cStatsRequest\"P\n\x05Stats\x12\x12\n\nexposition\x18\x01 \x02(\t\x12\x33\n\x08metadata\x18\x02 \x02(\x0b\x32!.inference_service.ServerMetadata\"\x99\x02\n\x13\x45ndpointInformation\x12\x12\n\nmodel_name\x18\x01 \x02(\t\x12\x15\n\rendpoint_name\x18\x02 \x02(\t\x12\x10\n\x08\x61\x63\x63uracy\x18\x03 \x02(\x01\x12\x0f\n\x07latency\x18\x04 \x02(\x01\x12\x12\n\ndimensions\x18\x05 \x01(\x05\x12\x33\n\x0b\x61pplication\x18\x06 \x02(\x0e\x32\x1e.inference_service.Application\x12\x12\n\nload_ratio\x18\x07 \x01(\x01\x12\x11\n\tprofiling\x18\x08 \x01(\x08\x12\x1a\n\x12latency_percentile\x18\t \x01(\x01\x12\x1a\n\x12percentile_latency\x18\n \x01(\x01\x12\x0c\n\x04\x63ost\x18\x0b \x01(\x01\"e\n\x1b\x42\x61ndwidthMeasurementMessage\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\t\x12\x38\n\x0enetwork_report\x18\x02 \x01(\x0b\x32 .inference_service.NetworkReport\"D\n\rNetworkReport\x12\r\n\x05\x62ytes\x18\x01 \x02(\x04\x12\x0f\n\x07\x65lapsed\x18\x02 \x02(\x01\x12\x13\n\x0bserver_time\x18\x03 \x01(\x01\",\n\x0eServerMetadata\x12\x1a\n\x12processing_latency\x18\x01 \x02(\x01*\"\n\x0b\x41pplication\x12\t\n\x05IMAGE\x10\x00\x12\x08\n\x04TEXT\x10\x01*$\n\x07SLOType\x12\x0c\n\x08\x41\x43\x43URACY\x10\x00\x12\x0b\n\x07LATENCY\x10\x01\x32\xdb\x06\n\tInference\x12T\n\x05Infer\x12#.inference_service.InferenceRequest\x1a$.inference_service.InferenceResponse\"\x00\x12M\n\x06Infer1\x12\x1b.inference_service.Message1\x1a$.inference_service.InferenceResponse\"\x00\x12M\n\x06Infer2\x12\x1b.inference_service.Message2\x1a$.inference_service.InferenceResponse\"\x00\x12\x45\n\x06Infer3\x12\x1b.inference_service.Message3\x1a\x1c.inference_service.Endpoints\"\x00\x12x\n\x14\x42\x61ndwidthMeasurement\x12..inference_service.BandwidthMeasurementMessage\x1a..inference_service.BandwidthMeasurementMessage\"\x00\x12Q\n\x08Infer1V2\x12\x1d.inference_service.Message1V2\x1a$.inference_service.InferenceResponse\"\x00\x12Q\n\x08Infer2V2\x12\x1d.inference_service.Message2V2\x1a$.inference_service.InferenceResponse\"\x00\x12X\n\x0bInferStream\x12 .inference_service.StreamRequest\x1a!.inference_service.StreamResponse\"\x00(\x01\x30\x01\x12P\n\x0bGetFrontier\x12\".inference_service.FrontierRequest\x1a\x1b.inference_service.Frontier\"\x00\x12G\n\x08GetStats\x12\x1f.inference_service.StatsRequest\x1a\x18.inference_service.Stats\"\x00')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'inference_service_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _APPLICATION._serialized_start=2935
+  _APPLICATION._serialized_end=2969
+  _SLOTYPE._serialized_start=2971
+  _SLOTYPE._serialized_end=3007
+  _INFERENCEREQUEST._serialized_start=47
+  _INFERENCEREQUEST._serialized_end=218
+  _INFERENCEREQUEST_REQUESTTYPE._serialized_start=179
+  _INFERENCEREQUEST_REQUESTTYPE._serialized_end=218
+  _INFERENCERESPONSE._serialized_start=221
+  _INFERENCERESPONSE._serialized_end=587
+  _LATENCYSUMMARY._serialized_start=589
+  _LATENCYSUMMARY._serialized_end=650
+  _REQUESTTIMING._serialized_start=652
+  _REQUESTTIMING._serialized_end=763
+  _MESSAGE1._serialized_start=765
+  _MESSAGE1._serialized_end=862
+  _MESSAGE2._serialized_start=865
+  _MESSAGE2._serialized_end=1138
+  _MESSAGE1V2._serialized_start=1140
+  _MESSAGE1V2._serialized_end=1239
+  _MESSAGE2V2._serialized_start=1242
+  _MESSAGE2V2._serialized_end=1517
+  _STREAMREQUEST._serialized_start=1520
+  _STREAMREQUEST._serialized_end=1664
+  _STREAMRESPONSE._serialized_start=1666
+  _STREAMRESPONSE._serialized_end=1773
+  _MESSAGE3._serialized_start=1776
+  _MESSAGE3._serialized_end=1924
+  _ENDPOINTS._serialized_start=1926
+  _ENDPOINTS._serialized_end=2049
+  _FRONTIERREQUEST._serialized_start=2051
+  _FRONTIERREQUEST._serialized_end=2149
+  _FRONTIER._serialized_start=2152
+  _FRONTIER._serialized_end=2332
+  _STATSREQUEST._serialized_start=2334
+  _STATSREQUEST._serialized_end=2348
+  _STATS._serialized_start=2350
+  _STATS._serialized_end=2430
+  _ENDPOINTINFORMATION._serialized_start=2433
+  _ENDPOINTINFORMATION._serialized_end=2714
+  _BANDWIDTHMEASUREMENTMESSAGE._serialized_start=2716
+  _BANDWIDTHMEASUREMENTMESSAGE._serialized_end=2817
+  _NETWORKREPORT._serialized_start=2819
+  _NETWORKREPORT._serialized_end=2887
+  _SERVERMETADATA._serialized_start=2889
+  _SERVERMETADATA._serialized_end=2933
+  _INFERENCE._serialized_start=3010
+  _INFERENCE._serialized_end=3869
 # @@protoc_insertion_point(module_scope)
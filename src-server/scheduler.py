@@ -0,0 +1,172 @@
+#!env python
+
+## Built-in imports
+import heapq
+import logging
+import threading
+import time
+from concurrent import futures
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+import exceptions
+import inferencerequest
+import tracing
+
+logging.basicConfig()
+log = logging.getLogger("layercake.scheduler")
+log.setLevel(logging.INFO)
+
+
+class EndpointQueue(object):
+  """
+  Queue of InferenceRequests for one endpoint, drained by as many workers as the endpoint allows concurrent calls.
+
+  Requests are served oldest first. Endpoints that support it get batches: a worker sends a batch once it is full,
+  once the batch window since its oldest request runs out, or once waiting any longer would push the tightest
+  latency SLO in the batch past its deadline.
+  """
+  def __init__(self, endpoint, max_batch_size=common.MAX_BATCH_SIZE, batch_window=common.BATCH_WINDOW_IN_SECONDS):
+    self.endpoint = endpoint
+    self.concurrency = endpoint.concurrency
+    self.max_batch_size = max_batch_size if endpoint.supports_batching else 1
+    self.batch_window = batch_window
+
+    self.pending = []  # heap, ordered by entry time
+    self.in_flight = 0
+    self.condition = threading.Condition()
+
+    self.workers = [
+      threading.Thread(target=self._worker_loop, name=f"{endpoint.name}-{i}", daemon=True)
+      for i in range(self.concurrency)
+    ]
+    for worker in self.workers:
+      worker.start()
+
+  @property
+  def queue_depth(self):
+    return len(self.pending)
+
+  def submit(self, request: inferencerequest.InferenceRequest) -> futures.Future:
+    request.future = futures.Future()
+    with self.condition:
+      heapq.heappush(self.pending, request)
+      request.mark_assigned()
+      self.condition.notify()
+    return request.future
+
+  def get_stats(self):
+    with self.condition:
+      return {
+        "queue_depth" : len(self.pending),
+        "in_flight" : self.in_flight,
+        "concurrency" : self.concurrency,
+      }
+
+  def estimate_queue_delay(self):
+    """How long a request arriving now would wait before an endpoint call picks it up"""
+    with self.condition:
+      backlog = len(self.pending) + self.in_flight
+    # Each wave of calls serves up to concurrency batches at once
+    waves_ahead = backlog // (self.concurrency * self.max_batch_size)
+    return waves_ahead * self.endpoint.expected_latency
+
+  def batch_close_time(self):
+    """When the current batch has to be sent; caller must hold the condition"""
+    close_time = self.pending[0].times["entry_time"] + self.batch_window
+    deadlines = [r.deadline for r in self.pending if r.deadline is not None]
+    if len(deadlines) > 0:
+      close_time = min(close_time, min(deadlines) - self.endpoint.expected_latency)
+    return close_time
+
+  def _next_batch(self):
+    with self.condition:
+      while True:
+        while len(self.pending) == 0:
+          self.condition.wait()
+        if len(self.pending) >= self.max_batch_size:
+          break
+        time_remaining = self.batch_close_time() - time.time()
+        if time_remaining <= 0:
+          break
+        self.condition.wait(time_remaining)
+      batch = [heapq.heappop(self.pending) for _ in range(min(self.max_batch_size, len(self.pending)))]
+      self.in_flight += len(batch)
+      return batch
+
+  def _run_batch(self, batch):
+    """Runs the batch, continuing the trace of its first traced request"""
+    traces = [request.trace for request in batch if request.trace is not None]
+    if len(traces) == 0:
+      return self._invoke(batch)
+    start = tracing.now()
+    for request in batch:
+      tracing.record("queued", request.trace, request.assigned_ns, start, model=self.endpoint.name)
+    with tracing.resume(traces[0]):
+      try:
+        return self._invoke(batch)
+      finally:
+        end = tracing.now()
+        for trace in traces:
+          tracing.record("execute", trace, start, end, model=self.endpoint.name, batch_size=len(batch))
+
+  def _invoke(self, batch):
+    if self.endpoint.supports_batching:
+      return self.endpoint.infer_batch([request.data for request in batch])
+    return [self.endpoint.infer(request.data) for request in batch]
+
+  def _worker_loop(self):
+    while True:
+      batch = self._next_batch()
+      # Requests whose caller gave up on them while queued (e.g. the losing side of a hedge) are dropped here
+      live_batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+      if len(live_batch) < len(batch):
+        with self.condition:
+          self.in_flight -= (len(batch) - len(live_batch))
+        batch = live_batch
+        if len(batch) == 0:
+          continue
+      for request in batch:
+        request.mark_execution_start()
+      try:
+        responses = self._run_batch(batch)
+        if len(responses) != len(batch):
+          raise exceptions.BatchSizeMismatch(f"Got {len(responses)} responses for a batch of {len(batch)}")
+      except Exception as e:
+        log.error(f"Batch of {len(batch)} on {self.endpoint.name} failed: {e}")
+        responses = None
+        error = e
+      with self.condition:
+        self.in_flight -= len(batch)
+      for i, request in enumerate(batch):
+        request.mark_execution_end()
+        if responses is None:
+          request.future.set_exception(error)
+        else:
+          request.response = responses[i]
+          request.future.set_result(request)
+
+
+class Scheduler(object):
+  """Places requests onto per-endpoint queues and reports live queue state"""
+  def __init__(self, endpoints, max_batch_size=common.MAX_BATCH_SIZE, batch_window=common.BATCH_WINDOW_IN_SECONDS):
+    self.queues = {
+      name : EndpointQueue(endpoint, max_batch_size=max_batch_size, batch_window=batch_window)
+      for name, endpoint in endpoints.items()
+    }
+
+  def submit(self, request: inferencerequest.InferenceRequest) -> futures.Future:
+    """Queues a request whose model has been set, returning a future that resolves to the completed request"""
+    return self.queues[request.model.name].submit(request)
+
+  def estimate_queue_delay(self, model):
+    return self.queues[model.name].estimate_queue_delay()
+
+  def get_queue(self, model) -> EndpointQueue:
+    return self.queues[model.name]
+
+  def get_stats(self):
+    return { name : queue.get_stats() for name, queue in self.queues.items() }
@@ -1,8 +1,13 @@
 #!env python
 
 # Built-in imports
+import argparse
+import asyncio
+import functools
 import io
 import json
+import queue
+import sqlite3
 import threading
 from concurrent import futures
 import time
@@ -20,36 +25,141 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 # my imports
 import inference_service_pb2 as inference_service_pb2
 import inference_service_pb2_grpc as inference_service_pb2_grpc
+import hedging
 import inferencerequest
+import keep_warm
 import common
 import model_selection
+import scheduler
 import serving_model
+import bandwidth
+import catalog
 import deployment_monitor
+import discovery
+import metrics
+import profiles
+import tracing
 
 logging.basicConfig()
 log = logging.getLogger("layercake")
 log.setLevel(logging.INFO)
 logging.getLogger("botocore").setLevel(logging.WARNING)
 
+RPC_LATENCY = metrics.REGISTRY.histogram(
+  "layercake_rpc_seconds", "Time to answer each RPC, from the handler's point of view", labels=("rpc",))
 
 
 class InferenceServicer(inference_service_pb2_grpc.InferenceServicer):
-  def __init__(self, *args, **kwargs):
+  def __init__(self, endpoints=None, warmup=True,
+               max_batch_size=common.MAX_BATCH_SIZE, batch_window=common.BATCH_WINDOW_IN_SECONDS,
+               max_stream_outstanding=common.MAX_STREAM_OUTSTANDING, hedge_percentile=None,
+               power_of_two_choices=False, keep_warm_pings_per_hour=None, profile_store=None, reprofile=False,
+               *args, **kwargs):
     super().__init__()
+    self.max_stream_outstanding = max_stream_outstanding
 
-    endpoints = serving_model.SageMakerModel.setup_available_models()
-    self.model_selection = model_selection.INFaaSModelPicker(endpoints.values())
+    if endpoints is None:
+      endpoints = serving_model.SageMakerModel.setup_available_models()
+    self.endpoints = endpoints
+    # Saved profiles are restored before anything reads the endpoints' latencies
+    self.profile_store = None
+    to_profile = list(endpoints.keys())
+    if profile_store is not None:
+      try:
+        self.profile_store = profiles.ProfileStore(profile_store)
+        if not reprofile:
+          to_profile = self.profile_store.load(endpoints)
+      except sqlite3.Error as e:
+        log.error(f"Could not open the profile store {profile_store}, so every endpoint will be profiled: {e}")
+        self.profile_store = None
+        to_profile = list(endpoints.keys())
+    self.scheduler = scheduler.Scheduler(endpoints, max_batch_size=max_batch_size, batch_window=batch_window)
+    self.model_selection = model_selection.INFaaSModelPicker(
+      endpoints.values(), load_estimator=self.scheduler, power_of_two_choices=power_of_two_choices)
+    self.endpoint_directory = discovery.EndpointDirectory(endpoints.values())
+    self.network_estimator = bandwidth.NetworkEstimator()
+    self.hedger = None
+    if hedge_percentile is not None:
+      self.hedger = hedging.Hedger(self.scheduler, percentile=hedge_percentile)
+    # Every scheduler worker may hold a runtime connection at once; warm-up goes through the workers too
+    serving_model.SageMakerRuntime.configure(max_pool_connections=sum([e.concurrency for e in endpoints.values()]))
+    self.keep_warm = None
+    if keep_warm_pings_per_hour is not None:
+      self.keep_warm = keep_warm.KeepWarmScheduler(endpoints, self.scheduler, pings_per_hour=keep_warm_pings_per_hour)
+      self.keep_warm.start()
+    # The preprocessor is shared by every image endpoint, so one calibration covers them all
+    image_endpoints = [e for e in endpoints.values() if isinstance(e, serving_model.SageMakerModelEndpoint_Image)]
+    if len(image_endpoints) > 0:
+      try:
+        image_endpoints[0].calibrate_preprocessing()
+      except Exception as e:
+        log.warning(f"Could not calibrate image preprocessing: {e}")
+    self.stream_executor = futures.ThreadPoolExecutor(
+      max_workers=common.NUM_STREAM_WORKERS, thread_name_prefix="stream")
+    metrics.REGISTRY.gauge(
+      "layercake_queue_depth", "Requests waiting for each endpoint", labels=("model",),
+      function=(lambda: {
+        (name,) : endpoint_queue.queue_depth for name, endpoint_queue in self.scheduler.queues.items()
+      }))
     self.monitor = deployment_monitor.DeploymentMonitor()
     #for endpoint in self.monitor.get_all_endpoints():
     #  self.monitor.check_endpoint(endpoint)
-    for model_name in sorted(endpoints.keys()):
+    self.warmup_thread = None
+    if warmup and len(to_profile) > 0:
+      # Warm-up runs in the background so the port can open straight away; until a model has enough measurements
+      # it is flagged as profiling and the picker makes do with what has been measured so far
+      self.warmup_thread = threading.Thread(
+        target=self.warm_up_and_save, args=({ name : endpoints[name] for name in to_profile },),
+        name="warmup", daemon=True)
+      self.warmup_thread.start()
+
+  def warm_up_and_save(self, endpoints):
+    self.warm_up_endpoints(endpoints)
+    self.save_profiles()
+
+  def save_profiles(self):
+    if self.profile_store is None:
+      return
+    try:
+      self.profile_store.save(self.endpoints.values())
+    except Exception as e:
+      log.error(f"Saving profiles failed: {e}")
+
+  def warm_up_endpoints(self, endpoints, num_executions=common.NUM_WARMUP_EXECUTIONS,
+                        max_concurrency=common.WARMUP_CONCURRENCY, budget=common.WARMUP_BUDGET_IN_SECONDS):
+    """
+    Profiles all endpoints at once, sharing a concurrency limit and an overall time budget.
+
+    Warm-up overlaps with live traffic, so its invocations are queued on the scheduler like any other request
+    rather than competing with the scheduler's workers for the endpoint's concurrency.
+    """
+    ts = time.time()
+    deadline = ts + budget
+
+    def _warm_up(model_name):
       log.info(f"Cycling {model_name} ({endpoints[model_name]})")
-      endpoints[model_name].cycle_model(num_executions=100)
+      endpoints[model_name].profile(num_executions=num_executions, deadline=deadline, invoke=self.invoke_scheduled)
       log.info(f"Deployed {model_name} as {endpoints[model_name].endpoint.endpoint_name} ")
 
+    with futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="warmup") as executor:
+      for model_name, future in [(m, executor.submit(_warm_up, m)) for m in sorted(endpoints.keys())]:
+        try:
+          future.result()
+        except Exception as e:
+          log.error(f"Warm-up of {model_name} failed: {e}")
+
+    log.info(f"Warm-up finished in {time.time() - ts:0.1f}s")
     for model_name in sorted(endpoints.keys()):
-      log.info(f"{model_name} ({endpoints[model_name].exec_latency})")
+      log.info(f"{model_name} ({endpoints[model_name].exec_latency}){' (profiling)' if endpoints[model_name].is_profiling else ''}")
 
+  def invoke_scheduled(self, endpoint):
+    """Runs one invocation of the endpoint's default input through its queue, as keep-warm pings do"""
+    request = inferencerequest.InferenceRequest(model_name=endpoint.name, data=endpoint.encode_input(None))
+    request.set_model(endpoint)
+    return self.scheduler.submit(request).result()
+
+  @RPC_LATENCY.time(rpc="Infer")
+  @tracing.traced("Infer", root=True)
   def Infer(self, request, context):
     log.debug(f"Got request: {request} for {request.model_name}")
     request_type = request.type
@@ -61,138 +171,494 @@ class InferenceServicer(inference_service_pb2_grpc.InferenceServicer):
     else:
       flags = {}
 
+    inference_request = self.new_request()
     model_to_use = self.model_selection.pick_model()
-    response = model_to_use.infer(do_resize=True)
-
-    response_dict = {
-      "time" : time.time(), # In case we want to synchronize time in the most basic way
-      "estimated_queue_delay" : 0.0, # Estimated time for a request to wait if it were in the system now
-      "estimated_exec_delay" : 0.0, # Estimated execution latency
-      #"models_loaded" : list(self.server.available_models.keys()), # List of models that would be loaded if the request arrived right now
-      "response": response
-    }
-    response = inference_service_pb2.InferenceResponse(response=[json.dumps(response_dict)])
-    return response
+    self.run_inference(inference_request, model_to_use, None, do_resize=True)
+    return self.build_infer_response(model_to_use, inference_request)
 
+  @RPC_LATENCY.time(rpc="Infer1")
+  @tracing.traced("Infer1", root=True)
   def Infer1(self, request, context):
     ts = time.time()
     print(f"Infer1")
-    application = request.application
-    model_name = request.model_name
-
-    model_to_use = self.model_selection.pick_model(model_name=model_name.lower())
-
+    inference_request = self.new_request()
+    model_to_use = self.pick_model_infer1(request)
     data = self.process_data(model_to_use, request)
-    response = model_to_use.infer(data)
-    return inference_service_pb2.InferenceResponse(metadata=inference_service_pb2.ServerMetadata(processing_latency=(time.time()-ts)), response=[json.dumps({"response" : response, "model" : model_to_use.name, "infer_cold": str(model_to_use.measurements[serving_model.ActionState.INFER_COLD]), "infer": str(model_to_use.measurements[serving_model.ActionState.INFER])})])
+    self.run_inference(inference_request, model_to_use, data)
+    return self.build_infer1_response(model_to_use, inference_request, ts)
 
+  @RPC_LATENCY.time(rpc="Infer2")
+  @tracing.traced("Infer2", root=True)
   def Infer2(self, request, context):
     ts = time.time()
     print(f"Infer2:")
+    transfer_time = self.get_transfer_time(request, context)
+    inference_request = self.new_request(deadline=self.get_deadline(request, ts, transfer_time))
+    model_to_use = self.pick_model_infer2(request, transfer_time)
+    data = self.process_data(model_to_use, request)
+    inference_request = self.run_inference(
+      inference_request, model_to_use, data, hedge_model=self.pick_hedge_model(model_to_use, request, transfer_time))
+    return self.build_infer2_response(
+      inference_request.model, inference_request, ts, percentile=self.get_latency_percentile(request))
+
+  @RPC_LATENCY.time(rpc="Infer3")
+  @tracing.traced("Infer3", root=True)
+  def Infer3(self, request, context):
+    ts = time.time()
+    response = inference_service_pb2.Endpoints()
+    response.MergeFromString(self.endpoint_directory.find(
+      request.application, request.accuracy_slo, request.latency_slo,
+      percentile=self.get_latency_percentile(request)))
+    response.metadata.processing_latency = (time.time() - ts)
+    return response
+
+  @RPC_LATENCY.time(rpc="BandwidthMeasurement")
+  def BandwidthMeasurement(self, request, context):
+    """Just return the data so we can get a measurement on the other end"""
+    log.info(f"BandwidthMeasurement recieved ({len(request.data)}bytes)")
+    if request.HasField("network_report"):
+      self.network_estimator.record(context.peer(), request.network_report)
+    return inference_service_pb2.BandwidthMeasurementMessage(data=request.data)
+
+  @RPC_LATENCY.time(rpc="GetFrontier")
+  def GetFrontier(self, request, context):
+    """Which variants are Pareto-optimal in accuracy and latency, and which are dominated and could be torn down"""
+    ts = time.time()
+    application = self.get_application(request) if request.HasField("application") else None
+    percentile = catalog.percentile_key(self.get_latency_percentile(request))
+    frontier, dominated = self.model_selection.catalog.get_frontier(application=application, percentile=percentile)
+    return inference_service_pb2.Frontier(
+      frontier=[discovery.get_endpoint_information(model, percentile) for model in frontier],
+      dominated=[discovery.get_endpoint_information(model, percentile) for model in dominated],
+      metadata=inference_service_pb2.ServerMetadata(processing_latency=(time.time() - ts)),
+    )
+
+  @RPC_LATENCY.time(rpc="GetStats")
+  def GetStats(self, request, context):
+    ts = time.time()
+    return inference_service_pb2.Stats(
+      exposition=metrics.REGISTRY.expose(),
+      metadata=inference_service_pb2.ServerMetadata(processing_latency=(time.time() - ts)),
+    )
+
+  def Infer1V2(self, request, context):
+    return self.Infer1(request, context)
+
+  def Infer2V2(self, request, context):
+    return self.Infer2(request, context)
+
+  def InferStream(self, request_iterator, context):
+    """
+    Serves tagged requests from one stream, answering each as soon as its endpoint finishes.
+
+    At most max_stream_outstanding requests per stream are accepted but not yet written back. Past that the stream
+    stops being read, so HTTP/2 flow control pushes back on a client that sends faster than it reads.
+    """
+    outstanding = threading.BoundedSemaphore(self.max_stream_outstanding)
+    responses = queue.Queue()
+
+    def _handle(stream_request):
+      responses.put(self.handle_stream_request(stream_request, context))
+
+    def _acquire():
+      """Waits for room in the window, giving up if the client has gone away (cancelled or disconnected)"""
+      while not outstanding.acquire(timeout=(common.POLL_SLEEP_MS / 1000.)):
+        if not context.is_active():
+          return False
+      return True
+
+    def _read():
+      pending = []
+      try:
+        for stream_request in request_iterator:
+          if not _acquire():
+            break
+          pending.append(self.stream_executor.submit(_handle, stream_request))
+        futures.wait(pending)
+      finally:
+        responses.put(None)
+
+    threading.Thread(target=_read, name="stream-reader", daemon=True).start()
+    while (stream_response := responses.get()) is not None:
+      yield stream_response
+      outstanding.release()
+
+  ######################
+  # Execution Helpers  #
+  ######################
+  def get_stream_handler(self, stream_request):
+    return {
+      "infer1" : self.Infer1V2,
+      "infer2" : self.Infer2V2,
+    }[stream_request.WhichOneof("request")]
+
+  def handle_stream_request(self, stream_request, context):
+    try:
+      response = self.get_stream_handler(stream_request)(
+        getattr(stream_request, stream_request.WhichOneof("request")), context)
+    except Exception as e:
+      log.error(f"Stream request {stream_request.request_id} failed: {e}")
+      return inference_service_pb2.StreamResponse(request_id=stream_request.request_id, error=str(e))
+    return inference_service_pb2.StreamResponse(request_id=stream_request.request_id, response=response)
+
+  @staticmethod
+  def new_request(deadline=None):
+    """Starts tracking a request; its model and data are filled in once they are known"""
+    return inferencerequest.InferenceRequest(model_name=None, data=None, deadline=deadline)
+
+  def run_inference(self, inference_request, model_to_use, data, hedge_model=None, **kwargs):
+    """Queues the request on the chosen endpoint and waits for it, returning the request that completed"""
+    inference_request.set_model(model_to_use)
+    self.record_request(model_to_use)
+    inference_request.data = model_to_use.encode_input(data, **kwargs)
+    future = self.scheduler.submit(inference_request)
+    if hedge_model is not None:
+      return self.hedger.run(inference_request, hedge_model, data)
+    return future.result()
+
+  def record_request(self, model_to_use):
+    if self.keep_warm is not None:
+      self.keep_warm.record_request(model_to_use)
+
+  def pick_hedge_model(self, model_to_use, request, transfer_time=0.):
+    """Variant to back a latency-SLO request up with, if hedging is on"""
+    if self.hedger is None or request.slo_type != inference_service_pb2.SLOType.LATENCY:
+      return None
+    if request.minimize_cost:
+      return None  # A hedge can double what the request costs
+    return self.model_selection.pick_hedge_model(
+      model_to_use, max_latency=(request.slo_value - transfer_time),
+      latency_percentile=self.get_latency_percentile(request), **self.get_accuracy_floor(request))
+
+  def get_transfer_time(self, request, context):
+    """Expected network time for this request's payload to and from the client, learning from its report if any"""
+    peer = context.peer() if context is not None else None
+    if request.HasField("network_report"):
+      self.network_estimator.record(peer, request.network_report)
+    return self.network_estimator.transfer_time(peer, len(request.data))
+
+  @staticmethod
+  def get_deadline(request, ts, transfer_time=0.):
+    """Absolute time a request with a latency SLO has to be answered by, if it has one"""
+    if request.slo_type == inference_service_pb2.SLOType.LATENCY:
+      return ts + request.slo_value - transfer_time
+    return None
+
+  ######################
+  # Selection Helpers  #
+  ######################
+  def pick_model_infer1(self, request):
     application = request.application
+    model_name = request.model_name
+    return self.model_selection.pick_model(model_name=model_name.lower())
+
+  def pick_model_infer2(self, request, transfer_time=0.):
+    application = self.get_application(request)
     slo_type = request.slo_type
     slo_value = request.slo_value
 
     if slo_type == inference_service_pb2.SLOType.ACCURACY:
-      model_to_use = self.model_selection.pick_model(min_accuracy=slo_value)
+      return self.model_selection.pick_model(
+        min_accuracy=slo_value, application=application, minimize_cost=request.minimize_cost)
     else:
-      model_to_use = self.model_selection.pick_model(max_latency=slo_value)
+      # Only the part of the SLO left after moving the payload to and from the client is there for compute
+      return self.model_selection.pick_model(
+        max_latency=(slo_value - transfer_time), latency_percentile=self.get_latency_percentile(request),
+        application=application, minimize_cost=request.minimize_cost, **self.get_accuracy_floor(request))
 
-    data = self.process_data(model_to_use, request)
-    response = model_to_use.infer(data)
-    return inference_service_pb2.InferenceResponse(
-      metadata=inference_service_pb2.ServerMetadata(processing_latency=(time.time()-ts)),
-      response=[
-        json.dumps(
-          {
-            "response" : response,
-            "model" : model_to_use.name,
-            "infer_cold": str(model_to_use.measurements[serving_model.ActionState.INFER_COLD]),
-            "infer": str(model_to_use.measurements[serving_model.ActionState.INFER]),
-            "accuracy": model_to_use.accuracy
-          }
-        )
-      ],
-      endpoint=inference_service_pb2.EndpointInformation(
-        model_name=model_to_use.name,
-        endpoint_name=model_to_use.endpoint.endpoint_name,
-        accuracy=model_to_use.accuracy,
-        latency=model_to_use.exec_latency,
-        dimensions=model_to_use.dimensions[0],
-        application=(
-          inference_service_pb2.Application.IMAGE
-          if model_to_use.application == common.Application.IMAGE
-          else inference_service_pb2.Application.TEXT
-        )
-      )
-    )
+  @staticmethod
+  def get_accuracy_floor(request):
+    """Accuracy a latency-SLO request must also meet, as kwargs for the model picker"""
+    if request.HasField("min_accuracy"):
+      return { "accuracy_floor" : request.min_accuracy }
+    return {}
 
-  def Infer3(self, request, context):
-    ts = time.time()
-    print("Infer3")
-    application = request.application
-    min_accuracy = request.accuracy_slo
-    max_latency = request.latency_slo
+  @staticmethod
+  def get_latency_percentile(request):
+    """Percentile of latency the SLO is on, or None for the mean"""
+    if request.HasField("latency_percentile"):
+      return request.latency_percentile
+    return None
 
+  @staticmethod
+  def get_application(request):
     if request.application == inference_service_pb2.IMAGE:
-      application = common.Application.IMAGE
-    else:
-      application = common.Application.TEXT
+      return common.Application.IMAGE
+    return common.Application.TEXT
+
+  ######################
+  # Response Builders  #
+  ######################
+  def build_infer_response(self, model_to_use, inference_request):
+    response_dict = {
+      "time" : time.time(), # In case we want to synchronize time in the most basic way
+      "estimated_queue_delay" : self.scheduler.estimate_queue_delay(model_to_use), # Estimated time for a request to wait if it were in the system now
+      "estimated_exec_delay" : model_to_use.expected_latency, # Estimated execution latency
+      #"models_loaded" : list(self.server.available_models.keys()), # List of models that would be loaded if the request arrived right now
+      "response": inference_request.response,
+      **inference_request.getTimes(),
+    }
+    response = inference_service_pb2.InferenceResponse(response=[json.dumps(response_dict)])
+    return response
 
-    appropriate_models = list(filter((lambda m: m.accuracy >= min_accuracy and m.latency <= max_latency and m.application == application), self.model_selection.get_models()))
+  @staticmethod
+  def get_latency_summary(measurement):
+    return inference_service_pb2.LatencySummary(mean=measurement.avg(), stddev=measurement.stddev(), count=len(measurement))
 
-    return inference_service_pb2.Endpoints(
+  @classmethod
+  def build_infer1_response(cls, model_to_use, inference_request, ts, **response_fields):
+    return inference_service_pb2.InferenceResponse(
+      response=[inference_request.response],
+      prediction=inference_request.response,
+      model_name=model_to_use.name,
+      cold_latency=cls.get_latency_summary(model_to_use.measurements[serving_model.ActionState.INFER_COLD]),
+      warm_latency=cls.get_latency_summary(model_to_use.measurements[serving_model.ActionState.INFER]),
+      timing=inference_service_pb2.RequestTiming(**inference_request.getTimes()),
+      cost=model_to_use.cost_model.invocation_cost(inference_request.getTimes()["execution_delay"]),
+      **response_fields,
       metadata=inference_service_pb2.ServerMetadata(processing_latency=(time.time()-ts)),
-      endpoints=[
-        inference_service_pb2.EndpointInformation(
-          model_name=model.name,
-          endpoint_name=model.endpoint.endpoint_name,
-          accuracy=model.accuracy,
-          latency=model.exec_latency,
-          dimensions=model.dimensions[0],
-          application=(
-            inference_service_pb2.Application.IMAGE
-            if model.application == common.Application.IMAGE
-            else inference_service_pb2.Application.TEXT
-          )
-        )
-        for model in appropriate_models
-      ]
     )
 
-  def BandwidthMeasurement(self, request, context):
-    """Just return the data so we can get a measurement on the other end"""
-    log.info(f"BandwidthMeasurement recieved ({len(request.data)}bytes)")
-    return inference_service_pb2.BandwidthMeasurementMessage(data=request.data)
+  @classmethod
+  def build_infer2_response(cls, model_to_use, inference_request, ts, percentile=None):
+    """Infer1's response plus the endpoint that served it, described the same way Infer3 describes endpoints"""
+    return cls.build_infer1_response(
+      model_to_use, inference_request, ts, endpoint=discovery.get_endpoint_information(model_to_use, percentile))
 
   @staticmethod
+  @tracing.traced("process_data")
   def process_data(model_selected: serving_model.SageMakerModel, request):
-    """Reads in the data and decrypts from b64 to an image (hopefully correctly but I'll find out I suppose!)"""
-    #img_byte_arr = io.BytesIO()
-    #base64.decode(request.data, img_byte_arr)
-    img_byte_arr = io.BytesIO(base64.urlsafe_b64decode(request.data))
-    img = PIL.Image.open(img_byte_arr)
-    return img
-
-def serve():
+    """Reads in the data, decoding from b64 for the string RPCs; decoding the image is left to the endpoint"""
+    data = request.data
+    if isinstance(data, str):
+      with metrics.STAGE_LATENCY.time(stage="b64_decode"):
+        data = base64.urlsafe_b64decode(data)
+    return data
+
+class AsyncInferenceServicer(InferenceServicer):
+  """InferenceServicer for grpc.aio: handlers await the endpoint call instead of holding a server thread for it"""
+  def __init__(self, endpoints=None, warmup=True, max_in_flight=common.MAX_IN_FLIGHT_REQUESTS, *args, **kwargs):
+    super().__init__(endpoints, warmup, *args, **kwargs)
+    self.max_in_flight = max_in_flight
+    # Endpoint calls are made by the scheduler's workers; only preprocessing has to be kept off the event loop
+    self.preprocess_executor = futures.ThreadPoolExecutor(thread_name_prefix="preprocess")
+    self._in_flight = None
+
+  @property
+  def in_flight(self):
+    # Created lazily so that the semaphore binds to the loop the server is running on
+    if self._in_flight is None:
+      self._in_flight = asyncio.Semaphore(self.max_in_flight)
+    return self._in_flight
+
+  async def infer_async(self, inference_request, model_to_use, data=None, hedge_model=None, **kwargs):
+    loop = asyncio.get_running_loop()
+    async with self.in_flight:
+      inference_request.set_model(model_to_use)
+      self.record_request(model_to_use)
+      inference_request.data = await loop.run_in_executor(
+        self.preprocess_executor,
+        tracing.bind(functools.partial(model_to_use.encode_input, data, **kwargs))
+      )
+      future = self.scheduler.submit(inference_request)
+      if hedge_model is not None:
+        return await self.hedger.run_async(inference_request, hedge_model, data, executor=self.preprocess_executor)
+      return await asyncio.wrap_future(future)
+
+  @RPC_LATENCY.time(rpc="Infer")
+  @tracing.traced("Infer", root=True)
+  async def Infer(self, request, context):
+    log.debug(f"Got request: {request} for {request.model_name}")
+    inference_request = self.new_request()
+    model_to_use = self.model_selection.pick_model()
+    await self.infer_async(inference_request, model_to_use, None, do_resize=True)
+    return self.build_infer_response(model_to_use, inference_request)
+
+  @RPC_LATENCY.time(rpc="Infer1")
+  @tracing.traced("Infer1", root=True)
+  async def Infer1(self, request, context):
+    ts = time.time()
+    inference_request = self.new_request()
+    model_to_use = self.pick_model_infer1(request)
+    data = self.process_data(model_to_use, request)
+    await self.infer_async(inference_request, model_to_use, data)
+    return self.build_infer1_response(model_to_use, inference_request, ts)
+
+  @RPC_LATENCY.time(rpc="Infer2")
+  @tracing.traced("Infer2", root=True)
+  async def Infer2(self, request, context):
+    ts = time.time()
+    transfer_time = self.get_transfer_time(request, context)
+    inference_request = self.new_request(deadline=self.get_deadline(request, ts, transfer_time))
+    model_to_use = self.pick_model_infer2(request, transfer_time)
+    data = self.process_data(model_to_use, request)
+    inference_request = await self.infer_async(
+      inference_request, model_to_use, data,
+      hedge_model=self.pick_hedge_model(model_to_use, request, transfer_time))
+    return self.build_infer2_response(
+      inference_request.model, inference_request, ts, percentile=self.get_latency_percentile(request))
+
+  async def Infer3(self, request, context):
+    return super().Infer3(request, context)
+
+  async def BandwidthMeasurement(self, request, context):
+    return super().BandwidthMeasurement(request, context)
+
+  async def GetFrontier(self, request, context):
+    return super().GetFrontier(request, context)
+
+  async def GetStats(self, request, context):
+    return super().GetStats(request, context)
+
+  async def Infer1V2(self, request, context):
+    return await self.Infer1(request, context)
+
+  async def Infer2V2(self, request, context):
+    return await self.Infer2(request, context)
+
+  async def InferStream(self, request_iterator, context):
+    """Same contract as InferStream on the threaded servicer, with each request served as a task"""
+    outstanding = asyncio.Semaphore(self.max_stream_outstanding)
+    responses = asyncio.Queue()
+
+    async def _handle(stream_request):
+      try:
+        response = await self.get_stream_handler(stream_request)(
+          getattr(stream_request, stream_request.WhichOneof("request")), context)
+      except Exception as e:
+        log.error(f"Stream request {stream_request.request_id} failed: {e}")
+        await responses.put(inference_service_pb2.StreamResponse(request_id=stream_request.request_id, error=str(e)))
+        return
+      await responses.put(inference_service_pb2.StreamResponse(request_id=stream_request.request_id, response=response))
+
+    async def _read():
+      tasks = set()
+      try:
+        async for stream_request in request_iterator:
+          await outstanding.acquire()
+          task = asyncio.create_task(_handle(stream_request))
+          tasks.add(task)
+          task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+      finally:
+        for task in list(tasks):
+          task.cancel()
+        await responses.put(None)
+
+    reader = asyncio.create_task(_read())
+    try:
+      while (stream_response := await responses.get()) is not None:
+        yield stream_response
+        outstanding.release()
+    finally:
+      reader.cancel()
+
+
+def serve(port=common.GRPC_PORT, num_workers=common.NUM_GRPC_WORKERS, **servicer_kwargs):
+  inference_servicer = None
   try:
-    inference_servicer = InferenceServicer()
+    inference_servicer = InferenceServicer(**servicer_kwargs)
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=num_workers))
     inference_service_pb2_grpc.add_InferenceServicer_to_server(
       inference_servicer, server)
-    server.add_insecure_port('[::]:50051')
+    server.add_insecure_port(f'[::]:{port}')
     server.start()
     print("server started")
     server.wait_for_termination()
     log.info("Shutting down")
+    _, dominated = inference_servicer.model_selection.catalog.get_frontier()
+    log.info(f"Dominated variants: {[model.name for model in dominated]}")
+    if inference_servicer.hedger is not None:
+      log.info(f"Hedging: {inference_servicer.hedger.get_stats()}")
+    if inference_servicer.keep_warm is not None:
+      log.info(f"Keep-warm: {inference_servicer.keep_warm.get_stats()}")
   finally:
     serving_model.SageMakerModelEndpoint.document_active_endpoints()
+    if inference_servicer is not None:
+      inference_servicer.save_profiles()
+    log.info(f"Preprocessing: {serving_model.SageMakerModelEndpoint_Image.preprocessor}")
+    log.info(f"Runtime connections: {serving_model.SageMakerRuntime.get_connection_stats()}")
+    tracing.TRACER.shutdown()
   exit(0)
 
 
+async def serve_async(port=common.GRPC_PORT, max_in_flight=common.MAX_IN_FLIGHT_REQUESTS, **servicer_kwargs):
+  inference_servicer = None
+  try:
+    inference_servicer = AsyncInferenceServicer(max_in_flight=max_in_flight, **servicer_kwargs)
+
+    server = grpc.aio.server()
+    inference_service_pb2_grpc.add_InferenceServicer_to_server(
+      inference_servicer, server)
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    print("server started (asyncio)")
+    await server.wait_for_termination()
+    log.info("Shutting down")
+    _, dominated = inference_servicer.model_selection.catalog.get_frontier()
+    log.info(f"Dominated variants: {[model.name for model in dominated]}")
+    if inference_servicer.hedger is not None:
+      log.info(f"Hedging: {inference_servicer.hedger.get_stats()}")
+    if inference_servicer.keep_warm is not None:
+      log.info(f"Keep-warm: {inference_servicer.keep_warm.get_stats()}")
+  finally:
+    serving_model.SageMakerModelEndpoint.document_active_endpoints()
+    if inference_servicer is not None:
+      inference_servicer.save_profiles()
+    log.info(f"Preprocessing: {serving_model.SageMakerModelEndpoint_Image.preprocessor}")
+    log.info(f"Runtime connections: {serving_model.SageMakerRuntime.get_connection_stats()}")
+    tracing.TRACER.shutdown()
+
+
 def main():
-  serve()
+  parser = argparse.ArgumentParser(description="LayerCake inference server")
+  parser.add_argument("--port", type=int, default=common.GRPC_PORT)
+  parser.add_argument("--asyncio", action="store_true", help="Serve with grpc.aio instead of a thread pool")
+  parser.add_argument("--max_in_flight", type=int, default=common.MAX_IN_FLIGHT_REQUESTS,
+                      help="Maximum concurrent endpoint calls when using --asyncio")
+  parser.add_argument("--num_workers", type=int, default=common.NUM_GRPC_WORKERS,
+                      help="Size of the gRPC thread pool when not using --asyncio")
+  parser.add_argument("--max_batch_size", type=int, default=common.MAX_BATCH_SIZE,
+                      help="Most image requests sent to an endpoint in one invocation (1 disables batching)")
+  parser.add_argument("--batch_window", type=float, default=common.BATCH_WINDOW_IN_SECONDS,
+                      help="Longest time in seconds a request waits for others to batch with")
+  parser.add_argument("--hedge", action="store_true",
+                      help="Back up latency-SLO requests that are running late with a second model variant")
+  parser.add_argument("--hedge_percentile", type=float, default=common.HEDGE_PERCENTILE,
+                      help="Percentile of the primary's latency after which a hedge is sent")
+  parser.add_argument("--power_of_two", action="store_true",
+                      help="Compare two random candidate variants rather than all of them when placing a request")
+  parser.add_argument("--keep_warm", action="store_true",
+                      help="Ping endpoints likely to be requested again just before they would go cold")
+  parser.add_argument("--keep_warm_budget", type=int, default=common.KEEP_WARM_PINGS_PER_HOUR,
+                      help="Most keep-warm pings to send per hour")
+  parser.add_argument("--trace_file", default=None,
+                      help="Write a Chrome/Perfetto trace of sampled requests to this file")
+  parser.add_argument("--trace_sample_rate", type=float, default=common.TRACE_SAMPLE_RATE,
+                      help="Fraction of requests to trace when using --trace_file")
+  parser.add_argument("--profile_store", default=common.PROFILE_STORE_FILE,
+                      help="SQLite file endpoint latency profiles are kept in across restarts")
+  parser.add_argument("--reprofile", action="store_true",
+                      help="Profile every endpoint at startup, even those with a fresh saved profile")
+  args = parser.parse_args()
+
+  if args.trace_file is not None:
+    tracing.TRACER.configure(args.trace_file, sample_rate=args.trace_sample_rate)
+
+  servicer_kwargs = {
+    "max_batch_size" : args.max_batch_size,
+    "batch_window" : args.batch_window,
+    "hedge_percentile" : (args.hedge_percentile if args.hedge else None),
+    "power_of_two_choices" : args.power_of_two,
+    "keep_warm_pings_per_hour" : (args.keep_warm_budget if args.keep_warm else None),
+    "profile_store" : args.profile_store,
+    "reprofile" : args.reprofile,
+  }
+  if args.asyncio:
+    asyncio.run(serve_async(port=args.port, max_in_flight=args.max_in_flight, **servicer_kwargs))
+    exit(0)
+  serve(port=args.port, num_workers=args.num_workers, **servicer_kwargs)
 
 
 if __name__ == "__main__":
@@ -13,8 +13,11 @@ import enum
 import tarfile
 import time
 import functools
+import threading
 
+import boto3
 import botocore
+import botocore.config
 import numpy as np
 import tensorflow as tf
 import sagemaker.tensorflow
@@ -26,37 +29,103 @@ from sagemaker.huggingface import HuggingFaceModel
 
 import tensorflowmodels
 import common
+import cost
+import exceptions
+import keepalive
+import metrics
+import preprocessing
+import stats
+import tracing
 
 logging.basicConfig()
 log = logging.getLogger("layercake")
 log.setLevel(logging.INFO)
 
+ENDPOINT_LATENCY = metrics.REGISTRY.histogram(
+  "layercake_endpoint_seconds", "Time each endpoint takes for each kind of action", labels=("model", "action"))
+COLD_STARTS = metrics.REGISTRY.counter(
+  "layercake_cold_starts", "Invocations that started on a cold endpoint", labels=("model",))
+
 
 class ActionState(enum.Enum):
   LOAD = 1,
   UNLOAD = 2,
   INFER = 3,
-  INFER_COLD = 4
+  INFER_COLD = 4,
+  INFER_BATCH = 5  # Invocations over more than one input, which aren't comparable to single requests
 
 class ImageB64Serializer(sagemaker.serializers.JSONSerializer):
   def serialize(self, data):
-    return json.dumps({"instances": [ [base64.urlsafe_b64encode(data).decode('utf-8')] ]})
+    if not isinstance(data, (list, tuple)):
+      data = [data]
+    return json.dumps({"instances": [ [base64.urlsafe_b64encode(d).decode('utf-8')] for d in data ]})
 
 
+class SageMakerRuntime(object):
+  """
+  The single sagemaker-runtime client every endpoint's Predictor invokes through.
 
-class Measurement(list):
-  def avg(self):
-    if len(self) == 0:
-      return 0.0
-    return np.mean(self)
+  Connections to the runtime host are pooled and kept alive, so after the first few requests invocations reuse an
+  open TLS connection instead of paying for a new handshake.
+  """
+  _session = None
+  _lock = threading.Lock()
+  max_pool_connections = common.MAX_IN_FLIGHT_REQUESTS
+  endpoint_url = None  # Where invocations are sent, if not to AWS (e.g. an emulated runtime for benchmarking)
 
-  def stddev(self):
-    if len(self) == 0:
-      return 0.0
-    return np.std(self)
+  @classmethod
+  def _create_client(cls):
+    return boto3.client(
+      "sagemaker-runtime",
+      endpoint_url=cls.endpoint_url,
+      config=botocore.config.Config(
+        max_pool_connections=cls.max_pool_connections,
+        tcp_keepalive=True,
+      )
+    )
 
-  def __str__(self):
-    return f"{self.avg():0.3f} +/- {self.stddev():0.3f}"
+  @classmethod
+  def get_session(cls) -> sagemaker.Session:
+    with cls._lock:
+      if cls._session is None:
+        cls._session = sagemaker.Session(sagemaker_runtime_client=cls._create_client())
+      return cls._session
+
+  @classmethod
+  def configure(cls, max_pool_connections):
+    """Resizes the connection pool; predictors pick up the new client since they share the session"""
+    session = cls.get_session()
+    with cls._lock:
+      if max_pool_connections == cls.max_pool_connections:
+        return
+      cls.max_pool_connections = max_pool_connections
+      session.sagemaker_runtime_client = cls._create_client()
+    log.info(f"SageMaker runtime connection pool sized to {max_pool_connections}")
+
+  @classmethod
+  def set_endpoint_url(cls, endpoint_url):
+    """Points every predictor at a different runtime, e.g. http://localhost:8080 for an emulated one"""
+    session = cls.get_session()
+    with cls._lock:
+      cls.endpoint_url = endpoint_url
+      session.sagemaker_runtime_client = cls._create_client()
+    log.info(f"SageMaker runtime requests now go to {endpoint_url}")
+
+  @classmethod
+  def get_connection_stats(cls):
+    """Requests sent and connections opened by the runtime client, from its urllib3 pools"""
+    try:
+      pool_manager = cls.get_session().sagemaker_runtime_client._endpoint.http_session._manager
+      pools = [pool_manager.pools[key] for key in pool_manager.pools.keys()]
+    except AttributeError:
+      return None
+    num_requests = sum([pool.num_requests for pool in pools])
+    num_connections = sum([pool.num_connections for pool in pools])
+    return {
+      "requests" : num_requests,
+      "new_connections" : num_connections,
+      "reused_connections" : num_requests - num_connections,
+    }
 
 
 class Model(abc.ABC):
@@ -69,10 +138,10 @@ class Model(abc.ABC):
 
   @property
   def latency(self):
-    if self.is_loaded:
-      return self.exec_latency
-    else:
-      return self.exec_latency + self.coldexec_latency
+    return self.exec_latency + self.cold_start_probability() * self.coldexec_latency
+
+  def cold_start_probability(self):
+    return 0. if self.is_loaded else 1.
 
   @abc.abstractmethod
   def prepare(self, *args, **kwargs):
@@ -114,13 +183,17 @@ class SageMakerModel(object):
 
     self.dimensions = dimensions
     self.accuracy = accuracy
-    self.measurements = collections.defaultdict(Measurement)
+    self.measurements = collections.defaultdict(stats.LatencyStats)
 
     self.application = application
     log.debug(f"Creating model with application: {application}")
 
     self.use_serverless = True if "use_serverless" not in kwargs else kwargs["use_serverless"]
-    self.instance_type = "ml.t2.medium" if "instance_type" not in kwargs else kwargs["instance_type"]
+    self.instance_type = common.DEDICATED_INSTANCE_TYPE if "instance_type" not in kwargs else kwargs["instance_type"]
+    self.memory_size_in_mb = kwargs.get("memory_size_in_mb", common.SERVERLESS_MEMORY_SIZE_IN_MB)
+    # Built up front so an instance type we can't price fails before anything is deployed
+    self.cost_model = (cost.CostModel.serverless(self.memory_size_in_mb) if self.use_serverless
+                       else cost.CostModel.dedicated(self.instance_type))
 
     self.first_run = True
 
@@ -232,9 +305,10 @@ class SageMakerModel(object):
     log.info(f"Deploy: {self}")
     if self.use_serverless:
       serverless_config = sagemaker.serverless.ServerlessInferenceConfig(
-        memory_size_in_mb=6144,
-        max_concurrency=1,
+        memory_size_in_mb=self.memory_size_in_mb,
+        max_concurrency=common.SERVERLESS_MAX_CONCURRENCY,
       )
+      concurrency = common.SERVERLESS_MAX_CONCURRENCY
       self.endpoint = self.sagemaker_model.deploy(
         serverless_inference_config=serverless_config,
         serializer=(ImageB64Serializer() if self.application == common.Application.IMAGE else sagemaker.serializers.JSONSerializer())
@@ -245,13 +319,16 @@ class SageMakerModel(object):
         instance_type=self.instance_type,
         serializer=ImageB64Serializer()
       )
+      concurrency = common.DEDICATED_CONCURRENCY
+    self.endpoint.sagemaker_session = SageMakerRuntime.get_session()
     self.is_deployed = True
     log.info(f"Deployed {self.name} as {self.endpoint.endpoint_name}")
     kind_of_endpoint = (SageMakerModelEndpoint_Image
                         if self.application == common.Application.IMAGE
                         else SageMakerModelEndpoint_Text)
     log.debug(f"Returning an enpoind of kind: {kind_of_endpoint}")
-    return kind_of_endpoint(self.name, self.endpoint, self.dimensions, self.accuracy, *args, **kwargs)
+    return kind_of_endpoint(
+      self.name, self.endpoint, self.dimensions, self.accuracy, concurrency, *args, cost_model=self.cost_model, **kwargs)
 
 
 class SageMakerModelEndpoint(Model):
@@ -259,16 +336,23 @@ class SageMakerModelEndpoint(Model):
   _all_endpoints = set([])
   endpoint_info_file = "endpoints.info"
 
-  def __init__(self, name, endpoint, dimensions, accuracy, *args, **kwargs):
+  supports_batching = False
+
+  def __init__(self, name, endpoint, dimensions, accuracy, concurrency=common.SERVERLESS_MAX_CONCURRENCY, *args,
+               cost_model=None, **kwargs):
     super().__init__(name, *args, **kwargs)
     self.name = name
     self.endpoint = endpoint
     self.dimensions = dimensions
     self._accuracy = accuracy
+    self.concurrency = concurrency  # How many invocations the endpoint serves at once
+    self.cost_model = cost_model if cost_model is not None else cost.CostModel.serverless()
     self.__class__._all_endpoints.add(self)
 
-    self.measurements = collections.defaultdict(Measurement)
+    self.measurements = collections.defaultdict(stats.LatencyStats)
     self.first_run = True
+    self.keep_alive = keepalive.KeepAliveEstimator()
+    self.latency_listeners = []  # Called with the endpoint whenever it records a new measurement
 
 
   def __str__(self):
@@ -304,7 +388,9 @@ class SageMakerModelEndpoint(Model):
       "endpoint_name" : self.endpoint.endpoint_name,
       "dimensions" : list(self.dimensions),
       "accuracy" : self.accuracy,
-      "application" : self.application
+      "application" : self.application,
+      "concurrency" : self.concurrency,
+      "cost_model" : self.cost_model.to_dict(),
     })
 
   @classmethod
@@ -312,34 +398,76 @@ class SageMakerModelEndpoint(Model):
     endpoint_dict = json.loads(endpoint_json)
     if "application" not in endpoint_dict or endpoint_dict["application"] == common.Application.IMAGE:
       new_cls = SageMakerModelEndpoint_Image
-      endpoint = sagemaker.predictor.Predictor(endpoint_name=endpoint_dict["endpoint_name"],serializer=ImageB64Serializer())
+      endpoint = sagemaker.predictor.Predictor(endpoint_name=endpoint_dict["endpoint_name"],sagemaker_session=SageMakerRuntime.get_session(),serializer=ImageB64Serializer())
     else:
       new_cls = SageMakerModelEndpoint_Text
-      endpoint = sagemaker.predictor.Predictor(endpoint_name=endpoint_dict["endpoint_name"],serializer=sagemaker.serializers.JSONSerializer())
+      endpoint = sagemaker.predictor.Predictor(endpoint_name=endpoint_dict["endpoint_name"],sagemaker_session=SageMakerRuntime.get_session(),serializer=sagemaker.serializers.JSONSerializer())
     return new_cls(
       name = endpoint_dict["name"],
       endpoint = endpoint,
       dimensions = tuple(endpoint_dict["dimensions"]), # todo: parse to and from json appropriate
       accuracy = endpoint_dict["accuracy"],
+      concurrency = endpoint_dict.get("concurrency", common.SERVERLESS_MAX_CONCURRENCY),
+      cost_model = cost.CostModel.from_dict(endpoint_dict.get("cost_model")),
       #type = application
     )
 
+  def get_profile(self):
+    """Everything measured about the endpoint that is worth keeping across restarts"""
+    return {
+      "measurements" : { action.name : self.measurements[action].to_dict() for action in ActionState },
+      "keep_alive" : self.keep_alive.to_dict(),
+    }
+
+  def load_profile(self, profile):
+    """Restores a get_profile() from an earlier run; the endpoint is still assumed cold until it is next called"""
+    for action_name, stats_dict in profile["measurements"].items():
+      self.measurements[ActionState[action_name]] = stats.LatencyStats.from_dict(stats_dict)
+    self.keep_alive.load_dict(profile["keep_alive"])
+    for listener in self.latency_listeners:
+      listener(self)
+
   def record_time(action: ActionState):
     def record_decorator(fn):
       @functools.wraps(fn)
       def _impl(self, *fn_args, **fn_kwargs):
+        recorded_action = action
+        if action == ActionState.INFER_BATCH and len(fn_args[0]) <= 1:
+          recorded_action = ActionState.INFER
+        invocation = recorded_action in (ActionState.INFER, ActionState.INFER_BATCH)
         ts = time.time()
-        response = fn(self, *fn_args, **fn_kwargs)
+        idle = self.keep_alive.begin(ts) if invocation else None
+        try:
+          response = fn(self, *fn_args, **fn_kwargs)
+        except Exception:
+          if invocation:
+            self.keep_alive.end(time.time(), None, False)
+          raise
         te = time.time()
-        if self.first_run and action == ActionState.INFER:
-          # action = ActionState.INFER_COLD
-          self.measurements[ActionState.INFER_COLD].append((te - ts))
-          self.first_run = False
-          self.is_loaded = True
+        if invocation:
+          # Only a single request that started on an idle endpoint can be told apart from a slow warm one, so
+          # batches neither count as cold starts after the first run nor teach the keep-alive anything
+          if recorded_action != ActionState.INFER:
+            idle = None
+          cold = self.first_run or (
+            idle is not None and self.keep_alive.is_cold_start((te - ts), self.measurements[ActionState.INFER]))
+          self.keep_alive.end(te, idle, cold)
+          if cold:
+            self.measurements[ActionState.INFER_COLD].append((te - ts))
+            ENDPOINT_LATENCY.observe((te - ts), model=self.name, action=ActionState.INFER_COLD.name)
+            COLD_STARTS.inc(model=self.name)
+            self.first_run = False
+            self.is_loaded = True
+          else:
+            self.measurements[recorded_action].append((te - ts))
+            ENDPOINT_LATENCY.observe((te - ts), model=self.name, action=recorded_action.name)
         else:
           self.measurements[action].append((te - ts))
+          ENDPOINT_LATENCY.observe((te - ts), model=self.name, action=action.name)
         if action == ActionState.UNLOAD:
           self.first_run = True
+        for listener in self.latency_listeners:
+          listener(self)
         return response
 
       return _impl
@@ -367,15 +495,34 @@ class SageMakerModelEndpoint(Model):
 
   @property
   def expected_latency(self):
-    if self.is_loaded:
-      return self.exec_latency
-    else:
-      return self.coldexec_latency
+    p_cold = self.cold_start_probability()
+    return (1 - p_cold) * self.exec_latency + p_cold * self.coldexec_latency
+
+  def cold_start_probability(self):
+    """Chance the next invocation starts cold, given how long the endpoint has been idle"""
+    if not self.is_loaded or self.first_run:
+      return 1.
+    return self.keep_alive.cold_start_probability()
 
   @property
   def accuracy(self):
     return self._accuracy # todo: currently only works for efficientnets
 
+  @property
+  def expected_cost(self):
+    """Expected USD for the next invocation, given how long it is expected to run"""
+    return self.cost_model.invocation_cost(self.latency)
+
+  def percentile_latency(self, q):
+    """Like latency, but taking the q-th percentile (0-100) of warm executions rather than their mean"""
+    warm_latency = self.measurements[ActionState.INFER].percentile(q)
+    return warm_latency + self.cold_start_probability() * self.coldexec_latency
+
+  @property
+  def is_profiling(self):
+    """Whether there are too few warm measurements yet for the latency estimates to be trusted"""
+    return len(self.measurements[ActionState.INFER]) < common.MIN_PROFILING_SAMPLES
+
   ##################
   # Common Methods #
   ##################
@@ -392,12 +539,25 @@ class SageMakerModelEndpoint(Model):
 
   @record_time(ActionState.INFER)
   def infer(self, data=None, do_resize=True, *args, **kwargs):
-    self._infer(data, do_resize, *args, **kwargs)
+    return self._infer(data, do_resize, *args, **kwargs)
 
   @abc.abstractmethod
   def _infer(self, data=None, do_resize=True, *args, **kwargs):
     pass
 
+  def encode_input(self, data=None, *args, **kwargs):
+    """Turns request data into what is sent to the endpoint"""
+    return data
+
+  @record_time(ActionState.INFER_BATCH)
+  def infer_batch(self, batch, *args, **kwargs):
+    """Runs a single invocation over a list of already-encoded inputs, returning one response per input"""
+    return self._infer_batch(batch, *args, **kwargs)
+
+  def _infer_batch(self, batch, *args, **kwargs):
+    """One invocation per input, for endpoints that can't take a batch in a single call"""
+    return [self._infer(data, *args, **kwargs) for data in batch]
+
   @record_time(ActionState.UNLOAD)
   def cooldown(self, *args, **kwargs):
     pass
@@ -420,6 +580,22 @@ class SageMakerModelEndpoint(Model):
       for action in ActionState
     }
 
+  def profile(self, num_executions=20, deadline=None, invoke=None):
+    """
+    Takes a cold and then warm measurements, stopping early if the deadline (an absolute time) passes.
+
+    invoke(endpoint) makes each invocation, e.g. through the scheduler so that profiling shares the endpoint's
+    concurrency with live traffic; by default the endpoint is called directly.
+    """
+    if invoke is None:
+      invoke = (lambda endpoint: endpoint.infer())
+    invoke(self)  # cold start
+    for _ in range(num_executions):
+      if deadline is not None and time.time() >= deadline:
+        log.info(f"Stopped profiling {self.name} after {len(self.measurements[ActionState.INFER])} measurements")
+        break
+      invoke(self)  # real inference
+
   def cycle_model(self, num_executions=20):
     #self.prepare()
     #self.deploy()
@@ -431,34 +607,68 @@ class SageMakerModelEndpoint(Model):
 
 
 class SageMakerModelEndpoint_Image(SageMakerModelEndpoint):
+  supports_batching = True
+
   @property
   def application(self):
     return common.Application.IMAGE
 
-  def _infer(self, data=None, do_resize=True, *args, **kwargs):
-    ts = time.time()
-    img_byte_arr = io.BytesIO()
+  preprocessor = preprocessing.ImagePreprocessor()
+  _default_input = None
+
+  @classmethod
+  def get_default_input(cls):
+    if cls._default_input is None:
+      with open("mug.jpg", "rb") as fid:
+        cls._default_input = fid.read()
+    return cls._default_input
+
+  def calibrate_preprocessing(self):
+    """Measures the full preprocessing path once, so fast-path savings can be reported without a request paying"""
+    self.preprocessor.calibrate(self.get_default_input(), self.dimensions)
+
+  @tracing.traced("encode_input")
+  def encode_input(self, data=None, do_resize=True):
+    """Turns the request's image bytes into the JPEG bytes sent to the endpoint"""
     if (data is None):
       log.info("Using mug as input")
-      img = Image.open("mug.jpg")
+      data = self.get_default_input()
     else:
       log.info("Using gRPC as input")
-      img = data
-    tl = time.time()
     # todo: only do resize if not running in infaas mode
-    if do_resize:
-      img.resize(self.dimensions).save(img_byte_arr, format="JPEG")
-    else:
-      img_byte_arr = img
-      # img.save(img_byte_arr, format="JPEG")
-    ti = time.time()
-    response = self.endpoint.predict(img_byte_arr.getvalue())
+    if not do_resize:
+      return bytes(data)
+    return self.preprocessor.prepare(data, self.dimensions)
+
+  def _predict(self, batch):
+    with metrics.STAGE_LATENCY.time(stage="predict"), tracing.span("predict", batch_size=len(batch)):
+      response = self.endpoint.predict(batch)
     if response is not dict:
-      response = json.loads(response)
-    prediction = np.argmax(response["predictions"], axis=1)
+      with metrics.STAGE_LATENCY.time(stage="json_parse"):
+        response = json.loads(response)
+    if len(response["predictions"]) != len(batch):
+      raise exceptions.BatchSizeMismatch(
+        f"{self.name} returned {len(response['predictions'])} predictions for {len(batch)} inputs")
+    with metrics.STAGE_LATENCY.time(stage="argmax"):
+      prediction = np.argmax(response["predictions"], axis=1)
+    return [str(prediction[i:i+1]) for i in range(len(batch))]
+
+  @tracing.traced("_infer")
+  def _infer(self, data=None, do_resize=True, *args, **kwargs):
+    ts = time.time()
+    encoded = self.encode_input(data, do_resize)
+    ti = time.time()
+    response = self._predict([encoded])[0]
     te = time.time()
-    log.info(f"{te - ts:0.3f} ({tl - ts:0.3f} + {ti - tl:0.3f} + {te - ti:0.3f}) ({self.dimensions})")
-    return str(prediction)
+    log.debug(f"{te - ts:0.3f} ({ti - ts:0.3f} + {te - ti:0.3f}) ({self.dimensions})")
+    return response
+
+  @tracing.traced("_infer_batch")
+  def _infer_batch(self, batch, *args, **kwargs):
+    ts = time.time()
+    responses = self._predict(batch)
+    log.info(f"{time.time() - ts:0.3f} (batch of {len(batch)}) ({self.dimensions})")
+    return responses
 
 
 
@@ -467,6 +677,7 @@ class SageMakerModelEndpoint_Text(SageMakerModelEndpoint):
   def application(self):
     return common.Application.TEXT
 
+  @tracing.traced("_infer")
   def _infer(self, data=None, do_resize=True, *args, **kwargs):
     response = self.endpoint.predict({
       'inputs': json.dumps({
@@ -477,6 +688,8 @@ class SageMakerModelEndpoint_Text(SageMakerModelEndpoint):
       })
     })
     log.info(f"response: {response}")
+    if isinstance(response, bytes):
+      response = response.decode("utf-8")
     return response
 
 def cycle_model(model, num_inferences=2, serverless=False):
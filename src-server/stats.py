@@ -0,0 +1,172 @@
+#!env python
+
+## Built-in imports
+import collections
+import copy
+import logging
+import math
+import threading
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.stats")
+log.setLevel(logging.INFO)
+
+
+class LatencySketch(object):
+  """
+  Quantile sketch over positive values with log-spaced buckets, so every quantile is within a fixed relative error.
+
+  Counts can be removed as well as added, and two sketches with the same accuracy merge by adding their buckets.
+  """
+  def __init__(self, relative_accuracy=common.SKETCH_RELATIVE_ACCURACY, min_value=common.SKETCH_MIN_VALUE):
+    self.relative_accuracy = relative_accuracy
+    self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    self.log_gamma = math.log(self.gamma)
+    self.min_value = min_value  # Anything smaller is counted as zero
+    self.buckets = collections.Counter()
+    self.zero_count = 0
+    self.count = 0
+
+  def bucket(self, value):
+    return math.ceil(math.log(value) / self.log_gamma)
+
+  def add(self, value, count=1):
+    if value < self.min_value:
+      self.zero_count += count
+    else:
+      self.buckets[self.bucket(value)] += count
+    self.count += count
+
+  def remove(self, value):
+    if value < self.min_value:
+      self.zero_count -= 1
+    else:
+      key = self.bucket(value)
+      self.buckets[key] -= 1
+      if self.buckets[key] <= 0:
+        del self.buckets[key]
+    self.count -= 1
+
+  def merge(self, other):
+    if other.gamma != self.gamma:
+      raise ValueError("Can only merge sketches with the same relative accuracy")
+    self.buckets.update(other.buckets)
+    self.zero_count += other.zero_count
+    self.count += other.count
+
+  def quantile(self, q):
+    """Value at quantile q (0 to 1), or 0 if the sketch is empty"""
+    if self.count == 0:
+      return 0.0
+    rank = q * (self.count - 1)
+    seen = self.zero_count
+    if rank < seen:
+      return 0.0
+    for key in sorted(self.buckets):
+      seen += self.buckets[key]
+      if rank < seen:
+        # Midpoint of the bucket, relative to which every value in it is within relative_accuracy
+        return 2 * self.gamma ** key / (self.gamma + 1)
+    return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+  def distribution(self):
+    """(value, count) for every non-empty bucket from smallest to largest, with zeros first"""
+    values = [(0.0, self.zero_count)] if self.zero_count > 0 else []
+    return values + [(2 * self.gamma ** key / (self.gamma + 1), self.buckets[key]) for key in sorted(self.buckets)]
+
+
+class LatencyStats(object):
+  """
+  Latency statistics over a sliding window of the most recent measurements, safe to update from any thread.
+
+  The window's mean and variance are kept up to date in O(1) per measurement and its quantiles come from a
+  LatencySketch, so memory stays bounded however long the server runs. len() is the total number of measurements
+  ever recorded, which is what decides whether an endpoint has been profiled enough.
+  """
+  def __init__(self, values=(), window_size=common.LATENCY_WINDOW_SIZE):
+    self.window = collections.deque()
+    self.window_size = window_size
+    self.sketch = LatencySketch()
+    self.total_count = 0
+    self._mean = 0.0
+    self._m2 = 0.0
+    self.lock = threading.Lock()
+    self.extend(values)
+
+  def append(self, value):
+    with self.lock:
+      if len(self.window) >= self.window_size:
+        self._evict(self.window.popleft())
+      self.window.append(value)
+      self.sketch.add(value)
+      self.total_count += 1
+      delta = value - self._mean
+      self._mean += delta / len(self.window)
+      self._m2 += delta * (value - self._mean)
+
+  def _evict(self, value):
+    """Removes the oldest value from the running moments; caller must hold the lock"""
+    self.sketch.remove(value)
+    n = len(self.window) + 1  # The value has already left the window
+    if n == 1:
+      self._mean, self._m2 = 0.0, 0.0
+      return
+    old_mean = self._mean
+    self._mean = (n * old_mean - value) / (n - 1)
+    self._m2 = max(0.0, self._m2 - (value - old_mean) * (value - self._mean))
+
+  def extend(self, values=()):
+    for value in values:
+      self.append(value)
+
+  def avg(self):
+    with self.lock:
+      return self._mean if len(self.window) > 0 else 0.0
+
+  def stddev(self):
+    with self.lock:
+      if len(self.window) == 0:
+        return 0.0
+      return math.sqrt(self._m2 / len(self.window))
+
+  def percentile(self, q):
+    """q-th percentile (0 to 100) of the window"""
+    with self.lock:
+      return self.sketch.quantile(q / 100.)
+
+  def get_sketch(self):
+    """Copy of the window's sketch, e.g. to merge with other endpoints'"""
+    with self.lock:
+      return copy.deepcopy(self.sketch)
+
+  def to_dict(self):
+    """The window and count, which are all from_dict needs, along with a summary for anyone reading it"""
+    with self.lock:
+      window = list(self.window)
+      total_count = self.total_count
+    return {
+      "window" : window,
+      "total_count" : total_count,
+      "mean" : self.avg(),
+      "stddev" : self.stddev(),
+      "p50" : self.percentile(50),
+      "p99" : self.percentile(99),
+    }
+
+  @classmethod
+  def from_dict(cls, stats_dict, window_size=common.LATENCY_WINDOW_SIZE):
+    latency_stats = cls(stats_dict["window"][-window_size:], window_size=window_size)
+    latency_stats.total_count = max(latency_stats.total_count, stats_dict["total_count"])
+    return latency_stats
+
+  def __len__(self):
+    return self.total_count
+
+  def __str__(self):
+    return f"{self.avg():0.3f} +/- {self.stddev():0.3f} (p50 {self.percentile(50):0.3f}, p99 {self.percentile(99):0.3f})"
@@ -0,0 +1,248 @@
+#!env python
+
+## Built-in imports
+import collections
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+## pip'd imports
+# (none)
+
+## my imports
+import common
+
+logging.basicConfig()
+log = logging.getLogger("layercake.tracing")
+log.setLevel(logging.INFO)
+
+
+TraceContext = collections.namedtuple("TraceContext", ["trace_id", "name"])
+
+_current_trace = contextvars.ContextVar("layercake_trace", default=None)
+
+
+def now():
+  return time.perf_counter_ns()
+
+
+class _NoSpan(object):
+  """What span() hands back for unsampled requests, so that they pay for nothing but the context lookup"""
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    return False
+
+_NO_SPAN = _NoSpan()
+
+
+class Span(object):
+  def __init__(self, tracer, trace, name, args):
+    self.tracer = tracer
+    self.trace = trace
+    self.name = name
+    self.args = args
+    self.start = None
+
+  def __enter__(self):
+    self.start = now()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.tracer.record(self.name, self.trace, self.start, now(), **self.args)
+    return False
+
+
+class Tracer(object):
+  """
+  Records nested spans for a sampled fraction of requests and writes them out as a Chrome/Perfetto trace.
+
+  Whether a request is traced is decided once, when its root span opens, and carried with it in a context variable
+  (and on its InferenceRequest across to the scheduler's workers). Finished spans are appended to a buffer owned by
+  the thread that recorded them, so recording takes no lock; a background thread drains the buffers into the trace
+  file. Each traced request is drawn as its own track, named after the RPC that started it.
+  """
+  def __init__(self):
+    self.sample_rate = 0.
+    self.path = None
+    self.trace_ids = itertools.count(1)
+    self.local = threading.local()
+    self.buffers_lock = threading.Lock()
+    self.buffers = []
+    self.file_lock = threading.Lock()
+    self.file = None
+    self.num_written = 0
+    self.stopped = threading.Event()
+    self.flush_thread = None
+
+  def configure(self, path, sample_rate=common.TRACE_SAMPLE_RATE,
+                flush_interval=common.TRACE_FLUSH_INTERVAL_IN_SECONDS):
+    """Starts tracing sample_rate of requests into the trace file at path"""
+    self.path = path
+    self.sample_rate = sample_rate
+    self.stopped.clear()
+    self.flush_thread = threading.Thread(target=self._run, args=(flush_interval,), name="trace-flush", daemon=True)
+    self.flush_thread.start()
+
+  @staticmethod
+  def current_trace():
+    return _current_trace.get()
+
+  def _buffer(self):
+    buffer = getattr(self.local, "buffer", None)
+    if buffer is None:
+      buffer = collections.deque(maxlen=common.TRACE_BUFFER_SIZE)
+      self.local.buffer = buffer
+      with self.buffers_lock:
+        self.buffers.append(buffer)
+    return buffer
+
+  def record(self, name, trace, start, end, **args):
+    """Records a span with explicit perf_counter_ns bounds, e.g. one timed before the trace could be resumed"""
+    if trace is None:
+      return
+    self._buffer().append((name, trace, start, end, threading.current_thread().name, args))
+
+  def span(self, name, **args):
+    trace = _current_trace.get()
+    if trace is None:
+      return _NO_SPAN
+    return Span(self, trace, name, args)
+
+  @contextlib.contextmanager
+  def root(self, name, **args):
+    """Span that starts a new trace, if this request is sampled and isn't already part of one"""
+    if _current_trace.get() is not None or self.sample_rate <= 0. or random.random() >= self.sample_rate:
+      with self.span(name, **args):
+        yield
+      return
+    token = _current_trace.set(TraceContext(next(self.trace_ids), name))
+    try:
+      with self.span(name, **args):
+        yield
+    finally:
+      _current_trace.reset(token)
+
+  @contextlib.contextmanager
+  def resume(self, trace):
+    """Continues a trace, e.g. on the scheduler worker running the request"""
+    if trace is None:
+      yield
+      return
+    token = _current_trace.set(trace)
+    try:
+      yield
+    finally:
+      _current_trace.reset(token)
+
+  def bind(self, fn):
+    """Carries the current trace along with fn, for handing it to an executor"""
+    if _current_trace.get() is None:
+      return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+  def traced(self, name=None, root=False):
+    """Decorator wrapping a function or coroutine in a span (or a root span); free when its request isn't traced"""
+    def decorator(fn):
+      span_name = name if name is not None else fn.__name__
+      if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def _async_impl(*args, **kwargs):
+          if _current_trace.get() is None and (not root or self.sample_rate <= 0.):
+            return await fn(*args, **kwargs)
+          with (self.root(span_name) if root else self.span(span_name)):
+            return await fn(*args, **kwargs)
+        return _async_impl
+
+      @functools.wraps(fn)
+      def _impl(*args, **kwargs):
+        if _current_trace.get() is None and (not root or self.sample_rate <= 0.):
+          return fn(*args, **kwargs)
+        with (self.root(span_name) if root else self.span(span_name)):
+          return fn(*args, **kwargs)
+      return _impl
+    return decorator
+
+  def _drain(self):
+    with self.buffers_lock:
+      buffers = list(self.buffers)
+    spans = []
+    for buffer in buffers:
+      while True:
+        try:
+          spans.append(buffer.popleft())
+        except IndexError:
+          break
+    return spans
+
+  @staticmethod
+  def to_event(span):
+    name, trace, start, end, thread_name, args = span
+    return {
+      "name" : name,
+      "ph" : "X",
+      "ts" : start / 1000.,
+      "dur" : (end - start) / 1000.,
+      "pid" : os.getpid(),
+      "tid" : trace.trace_id,
+      "args" : { "thread" : thread_name, **{ key : str(value) for key, value in args.items() } },
+    }
+
+  def flush(self):
+    """Appends every recorded span to the trace file, which stays valid JSON-array trace format throughout"""
+    spans = self._drain()
+    if self.path is None or len(spans) == 0:
+      return
+    events = [self.to_event(span) for span in spans]
+    # Name each request's track after the RPC that started it
+    for trace in set([span[1] for span in spans]):
+      events.append({
+        "name" : "thread_name", "ph" : "M", "pid" : os.getpid(), "tid" : trace.trace_id,
+        "args" : { "name" : f"{trace.name} #{trace.trace_id}" },
+      })
+    with self.file_lock:
+      if self.file is None:
+        self.file = open(self.path, "w")
+        self.file.write("[\n")
+      for event in events:
+        self.file.write(("" if self.num_written == 0 else ",\n") + json.dumps(event))
+        self.num_written += 1
+      self.file.flush()
+
+  def _run(self, flush_interval):
+    while not self.stopped.wait(flush_interval):
+      try:
+        self.flush()
+      except Exception as e:
+        log.error(f"Trace flush failed: {e}")
+
+  def shutdown(self):
+    """Writes out what is left and closes the trace; the trailing ] is optional in the format, but tidy"""
+    self.stopped.set()
+    self.flush()
+    with self.file_lock:
+      if self.file is not None:
+        self.file.write("\n]\n")
+        self.file.close()
+        self.file = None
+        log.info(f"Wrote {self.num_written} trace events to {self.path}")
+
+
+TRACER = Tracer()
+
+span = TRACER.span
+root = TRACER.root
+resume = TRACER.resume
+record = TRACER.record
+bind = TRACER.bind
+traced = TRACER.traced
+current_trace = TRACER.current_trace